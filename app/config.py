@@ -9,12 +9,41 @@ APP_VERSION = "1.1.4"
 WORKER_ID = os.environ.get("WORKER_ID", 1)
 API_URL = os.environ.get("API_URL", "http://3.229.101.152:8081")
 API_ENDPOINT = os.environ.get("API_ENDPOINT", API_URL)
+# seconds to wait for a connection and for a response from the API
+API_CONNECT_TIMEOUT = float(os.environ.get("API_CONNECT_TIMEOUT", 10))
+API_READ_TIMEOUT = float(os.environ.get("API_READ_TIMEOUT", 300))
+# number of keep-alive connections to the API kept by each process
+API_POOL_SIZE = int(os.environ.get("API_POOL_SIZE", 4))
+# gzip the ocr-updates payload, the API must accept `Content-Encoding: gzip`
+API_GZIP = bool(os.environ.get("API_GZIP", False))
+# largest ocr-updates body accepted by the API in bytes (uncompressed), 0 if unknown
+API_MAX_PAYLOAD = int(os.environ.get("API_MAX_PAYLOAD", 0))
 OUTPUT_PATH = os.environ.get("OUTPUT_PATH", "nlp/documents/analysis")
 SLEEP_TIME = int(os.environ.get("SLEEP_TIME", 10))
+# polling interval when there is nothing to process, grows exponentially from min to max
+POLL_MIN_SLEEP = float(os.environ.get("POLL_MIN_SLEEP", 1))
+POLL_MAX_SLEEP = float(os.environ.get("POLL_MAX_SLEEP", 6 * SLEEP_TIME))
+# number of documents claimed in one next-document request, if the API supports it
+CLAIM_BATCH_SIZE = int(os.environ.get("CLAIM_BATCH_SIZE", 1))
 DUMP_JSON = bool(os.environ.get("DUMP_JSON", False))
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO")
 MAX_NUM_PAGES = int(os.environ.get("MAX_NUM_PAGES", 75600))
 MIN_QUALITY = 77.0
+# number of documents processed concurrently, each one in a separate process
+WORKER_SLOTS = int(os.environ.get("WORKER_SLOTS", 1))
+# claim documents and report statuses from an asyncio loop, processing in an executor
+ASYNC_FRONTEND = bool(os.environ.get("ASYNC_FRONTEND", False))
+# overlap the OCR of a document with the analysis of the previous ones
+PIPELINE = bool(os.environ.get("PIPELINE", False))
+PIPELINE_OCR_WORKERS = int(os.environ.get("PIPELINE_OCR_WORKERS", 1))
+PIPELINE_EXTRACT_WORKERS = int(os.environ.get("PIPELINE_EXTRACT_WORKERS", 1))
+# number of documents waiting in front of each stage
+PIPELINE_QUEUE_SIZE = int(os.environ.get("PIPELINE_QUEUE_SIZE", 1))
+# port of the Prometheus metrics endpoint, disabled if 0
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 0))
+METRICS_HOST = os.environ.get("METRICS_HOST", "0.0.0.0")
+# load the models when the worker starts, before it forks; otherwise each process loads them on first use
+WARM_UP = bool(os.environ.get("WARM_UP", True))
 
 LOG_CONFIG = (
     f"Worker {WORKER_ID} : {APP_VERSION}: "
@@ -22,15 +51,59 @@ LOG_CONFIG = (
 )
 logging.basicConfig(level=LOG_LEVEL, format=LOG_CONFIG)
 
+# directory of the journal used to resume documents after a crash, disabled if empty
+JOB_JOURNAL_PATH = os.environ.get("JOB_JOURNAL_PATH", os.path.join(OUTPUT_PATH, "journal"))
+# runs of a document left unfinished by crashes after which it is reported as failed instead of resumed
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+# directory of the cache of OCR and highlighting results, disabled if empty
+RESULT_CACHE_PATH = os.environ.get("RESULT_CACHE_PATH", "")
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 10 * 1024**3))
 
 # SECTION: OCR service
 LEGAL_LANG = "ro_legal"
 BACK_LANG = "ron"
-# number of parallel processes to use for OCR
-NUM_PROC = str(os.environ.get("NUM_PROC", 1))
+# number of parallel processes to use for OCR, "auto" to size it for each document from the CPU budget
+NUM_PROC = str(os.environ.get("NUM_PROC", "auto"))
+# cores shared by all the documents OCRed at the same time when NUM_PROC is "auto", detected if 0
+OCR_CPU_BUDGET = int(os.environ.get("OCR_CPU_BUDGET", 0))
 # maximum number of pages to convert to PDF/A
 # otherwise output type is PDF
 MAX_PAGE_PDF_A = 50
+# OCR through the ocrmypdf API in long-lived processes instead of starting ocrmypdf for every document
+OCR_IN_PROCESS = bool(os.environ.get("OCR_IN_PROCESS", False))
+OCR_ENGINE_WORKERS = int(os.environ.get("OCR_ENGINE_WORKERS", 1))
+# keep Tesseract loaded in the OCR engine processes, requires tesserocr
+OCR_TESSEROCR = bool(os.environ.get("OCR_TESSEROCR", False))
+# skip ocrmypdf for pages that already have a text layer
+BORN_DIGITAL_FAST_PATH = bool(os.environ.get("BORN_DIGITAL_FAST_PATH", True))
+# pages OCRed beforehand to decide if a document needs forced page rotation, 0 to disable
+ROTATION_PROBE_PAGES = int(os.environ.get("ROTATION_PROBE_PAGES", 5))
+# documents are probed only if at least this many of their pages need OCR
+ROTATION_PROBE_MIN_PAGES = int(os.environ.get("ROTATION_PROBE_MIN_PAGES", 50))
+# processes cleaning the text and estimating its quality for documents of at least TEXT_PARALLEL_MIN_PAGES pages, 0 to disable
+TEXT_WORKERS = int(os.environ.get("TEXT_WORKERS", 0))
+TEXT_PARALLEL_MIN_PAGES = int(os.environ.get("TEXT_PARALLEL_MIN_PAGES", 500))
+# pages cleaned by a process at a time
+TEXT_CHUNK_PAGES = int(os.environ.get("TEXT_CHUNK_PAGES", 100))
+# documents with at least QUALITY_SAMPLE_MIN_PAGES pages are scored on a sample of QUALITY_SAMPLE_PAGES pages,
+# and fully only if the confidence interval of the sample contains MIN_QUALITY, disabled if 0
+QUALITY_SAMPLE_MIN_PAGES = int(os.environ.get("QUALITY_SAMPLE_MIN_PAGES", 200))
+QUALITY_SAMPLE_PAGES = int(os.environ.get("QUALITY_SAMPLE_PAGES", 50))
+# download the NLTK data that is not installed, on first use; if not set, missing data is an error
+NLTK_DOWNLOAD = bool(os.environ.get("NLTK_DOWNLOAD", True))
+# distinct words whose normalization is memoized by each process
+NORMALIZATION_CACHE_SIZE = int(os.environ.get("NORMALIZATION_CACHE_SIZE", 65536))
+# directory of the compiled vocabulary used to estimate the quality, disabled if empty
+VOCABULARY_CACHE_PATH = os.environ.get("VOCABULARY_CACHE_PATH", "nlp/resources/cache")
+# estimate the quality of the OCRed pages from the Tesseract word confidences, off until MIN_QUALITY,
+# calibrated for the dictionary heuristic, is calibrated for the confidences too
+OCR_CONFIDENCE_QUALITY = bool(os.environ.get("OCR_CONFIDENCE_QUALITY", False))
+# documents with more pages are split into shards that are OCRed in parallel, disabled if 0
+OCR_SHARD_THRESHOLD = int(os.environ.get("OCR_SHARD_THRESHOLD", 0))
+# number of pages of a shard
+OCR_SHARD_SIZE = int(os.environ.get("OCR_SHARD_SIZE", 50))
+# maximum number of shards OCRed at the same time, each one by an ocrmypdf process
+OCR_SHARD_WORKERS = int(os.environ.get("OCR_SHARD_WORKERS", 4))
 
 
 # SECTION: doc analysis
@@ -25,6 +25,12 @@ class ResponseField:
     KWDS = "keywords"
 
 
+class PayloadTier:
+    FULL = "full"
+    SUMMARIZED = "summarized"
+    MINIMAL = "minimal"
+
+
 class Status:
     COMPLETE = "complete"
     FAILED = "failed"
@@ -61,3 +67,46 @@ class JobSpec:
     STATUS = "status"
     ID = "job_id"
     QUALITY = "quality"
+
+
+class JobField:
+    DOCUMENT = "document"
+    ANALYSIS = "analysis"
+    OUTPUT_PATH = "output_path"
+    DUMP_TEXT = "dump_text"
+    DUMP_JSON = "dump_json"
+    START_TIME = "start_time"
+    CACHE_KEY = "cache_key"
+    CACHE_STATS = "cache_stats"
+    TIMINGS = "timings"
+    PAGE_KINDS = "page_kinds"
+    PAGE_QUALITIES = "page_qualities"
+    FORCE_ROTATE = "force_rotate"
+    PROBE = "probe"
+    JOURNAL = "journal"
+    COMPLETED = "completed_stages"
+
+
+class JournalStage:
+    VALIDATED = "validated"
+    OCR_DONE = "ocr_done"
+    TEXT_EXTRACTED = "text_extracted"
+    HIGHLIGHTED = "highlighted"
+
+
+class CacheStat:
+    OCR = "ocr"
+    HIGHLIGHT = "highlight"
+    HIT = "hit"
+    MISS = "miss"
+
+
+class PageKind:
+    TEXT = "text"
+    IMAGE = "image"
+    MIXED = "mixed"
+    EMPTY = "empty"
+
+    @staticmethod
+    def needs_ocr(kind: str) -> bool:
+        return kind == PageKind.IMAGE
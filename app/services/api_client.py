@@ -0,0 +1,66 @@
+import gzip
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.config import (API_CONNECT_TIMEOUT,
+                        API_GZIP,
+                        API_POOL_SIZE,
+                        API_READ_TIMEOUT,)
+
+logger = logging.getLogger(__name__)
+
+SESSION = None
+# sessions must not be shared with forked processes
+SESSION_PID = None
+
+
+def get_session() -> requests.Session:
+    """Get the keep-alive session of the current process."""
+    global SESSION, SESSION_PID
+    if SESSION is None or SESSION_PID != os.getpid():
+        SESSION = requests.Session()
+        adapter = HTTPAdapter(pool_connections=API_POOL_SIZE, pool_maxsize=API_POOL_SIZE)
+        SESSION.mount("http://", adapter)
+        SESSION.mount("https://", adapter)
+        SESSION_PID = os.getpid()
+    return SESSION
+
+
+def get(endpoint: str) -> requests.Response:
+    """GET request on a pooled connection."""
+    return get_session().get(endpoint, timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT))
+
+
+def encode_json(body: Dict[str, Any]) -> bytes:
+    """Serialize a JSON body."""
+    return json.dumps(body).encode("utf-8")
+
+
+def post_json(endpoint: str,
+              body: Optional[Dict[str, Any]] = None,
+              data: Optional[bytes] = None,
+              compress: bool = API_GZIP) -> requests.Response:
+    """POST a JSON body on a pooled connection.
+
+    :param endpoint: url to post to
+    :param body: JSON body to post
+    :param data: already serialized JSON body, used instead of body
+    :param compress: gzip the body, the server must accept `Content-Encoding: gzip`
+    :return: response of the server
+    """
+    if data is None:
+        data = encode_json(body)
+    headers = {"Content-Type": "application/json"}
+    if compress:
+        size = len(data)
+        data = gzip.compress(data, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+        logger.debug(f"Compressed payload from {size} to {len(data)} bytes")
+    return get_session().post(
+        endpoint, data=data, headers=headers, timeout=(API_CONNECT_TIMEOUT, API_READ_TIMEOUT)
+    )
@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import BrokenExecutor, Executor, Future
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class StatusReporter:
+    """Sends status updates to the API in the background.
+
+    Updates of a document are sent in order. An update that is still waiting
+    to be sent is replaced by a newer one of the same document only if both
+    have the same status, the first argument of the update, so every status
+    change, e.g. `locked` before `ocr_in_progress`, reaches the API.
+    `report` returns a future telling whether the update, or the newer one
+    replacing it, was sent.
+    """
+
+    def __init__(
+        self,
+        send: Callable[..., Any],
+        executor: Optional[Executor] = None,
+        concurrency: int = 4,
+        on_error: Optional[Callable[[str, Exception], Any]] = None,
+    ) -> None:
+        """Initialize the reporter.
+
+        :param send: blocking function called with the document id and the update
+        :param executor: executor running the blocking calls, defaults to the loop's
+        :param concurrency: number of updates sent at the same time
+        :param on_error: called with the document id and the error when an update fails
+        """
+        self.send = send
+        self.executor = executor
+        self.concurrency = concurrency
+        self.on_error = on_error
+        # updates waiting to be sent, by document, in order
+        self.pending: Dict[str, List[Tuple[Tuple[Any, ...], Dict[str, Any], List[asyncio.Future]]]] = {}
+        self.queued: Set[str] = set()
+        self.active: Set[str] = set()
+        self.coalesced = 0
+        self.queue: Optional[asyncio.Queue] = None
+        self.tasks = []
+
+    def start(self) -> None:
+        """Start the sending tasks, must be called from the event loop."""
+        self.queue = asyncio.Queue()
+        self.tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    def report(self, job_id: str, *args, **kwargs) -> asyncio.Future:
+        """Schedule an update of a document without waiting for it.
+
+        :return: future resolved to True once the update is sent, False if sending it failed
+        """
+        sent = asyncio.get_running_loop().create_future()
+        updates = self.pending.setdefault(job_id, [])
+        if updates and updates[-1][0][:1] == args[:1]:
+            self.coalesced += 1
+            logger.debug(f"Coalesced status update of '{job_id}'.")
+            updates[-1] = (args, kwargs, updates[-1][2] + [sent])
+        else:
+            updates.append((args, kwargs, [sent]))
+        if job_id not in self.queued and job_id not in self.active:
+            self.queued.add(job_id)
+            self.queue.put_nowait(job_id)
+        return sent
+
+    async def flush(self) -> None:
+        """Wait until all scheduled updates are sent."""
+        await self.queue.join()
+
+    async def stop(self) -> None:
+        """Send the scheduled updates and stop the tasks."""
+        await self.flush()
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def _run(self) -> None:
+        """Loop of a sending task."""
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id = await self.queue.get()
+            self.queued.discard(job_id)
+            updates = self.pending[job_id]
+            args, kwargs, waiting = updates.pop(0)
+            if not updates:
+                del self.pending[job_id]
+            self.active.add(job_id)
+            sent = False
+            try:
+                await loop.run_in_executor(self.executor, lambda: self.send(job_id, *args, **kwargs))
+                sent = True
+            except Exception as e:
+                logger.exception(f"Failed to send status update of '{job_id}'.")
+                if self.on_error is not None:
+                    await loop.run_in_executor(self.executor, self.on_error, job_id, e)
+            finally:
+                for future in waiting:
+                    if not future.done():
+                        future.set_result(sent)
+                self.active.discard(job_id)
+                if job_id in self.pending:
+                    self.queued.add(job_id)
+                    self.queue.put_nowait(job_id)
+                self.queue.task_done()
+
+
+class RestartingExecutor(Executor):
+    """Executor replaced by a new one when it breaks, e.g. when a process of a process pool dies.
+
+    The calls running in the broken executor fail with its error, the later
+    ones run in the new executor.
+    """
+
+    def __init__(self, factory: Callable[[], Executor], on_restart: Optional[Callable[[], Any]] = None) -> None:
+        """Initialize the executor.
+
+        :param factory: makes the underlying executor, again after it breaks
+        :param on_restart: called after the underlying executor is replaced
+        """
+        self.factory = factory
+        self.on_restart = on_restart
+        self.lock = threading.Lock()
+        self.executor = factory()
+        self.restarts = 0
+
+    def submit(self, fn, /, *args, **kwargs) -> Future:
+        executor = self.executor
+        try:
+            future = executor.submit(fn, *args, **kwargs)
+        except BrokenExecutor:
+            self.restart(executor)
+            executor = self.executor
+            future = executor.submit(fn, *args, **kwargs)
+        future.add_done_callback(lambda done: self._check(executor, done))
+        return future
+
+    def _check(self, executor: Executor, future: Future) -> None:
+        """Restart the executor if the call failed because it broke."""
+        if not future.cancelled() and isinstance(future.exception(), BrokenExecutor):
+            self.restart(executor)
+
+    def restart(self, broken: Executor) -> None:
+        """Replace the executor, unless it was already replaced since it broke."""
+        with self.lock:
+            if self.executor is not broken:
+                return
+            logger.error("Executor broke, restarting it.")
+            broken.shutdown(wait=False, cancel_futures=True)
+            self.executor = self.factory()
+            self.restarts += 1
+        if self.on_restart is not None:
+            self.on_restart()
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        self.executor.shutdown(wait=wait, cancel_futures=cancel_futures)
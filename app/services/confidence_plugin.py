@@ -0,0 +1,105 @@
+"""ocrmypdf plugin recording the Tesseract word confidences of every OCRed page.
+
+With `--confidence-dir DIR` the Tesseract command line also writes the hOCR
+of each page, whose word confidences are summarized in `DIR/<page>.json`.
+Pages skipped by ocrmypdf, e.g. pages that already have text, have no file.
+The plugin is loaded by path in the ocrmypdf command, so it must not import
+the `app` package.
+"""
+import json
+import os
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ocrmypdf import hookimpl
+from ocrmypdf._exec import tesseract
+from ocrmypdf.builtin_plugins.tesseract_ocr import TesseractOcrEngine
+
+WORD_CONFIDENCE = re.compile(r"""class=['"]ocrx_word['"][^>]*?x_wconf (\d+)""")
+
+
+def hocr_word_confidences(hocr: str) -> List[int]:
+    """Confidences (0-100) of the words of an hOCR document."""
+    return [int(confidence) for confidence in WORD_CONFIDENCE.findall(hocr)]
+
+
+def summarize_confidences(confidences: List[int]) -> Dict[str, Any]:
+    """Number of words and mean confidence of a page, None if it has no words."""
+    mean = round(sum(confidences) / len(confidences), 2) if confidences else None
+    return {"words": len(confidences), "confidence": mean}
+
+
+def page_index(page_file: Path) -> int:
+    """Index of the page of an ocrmypdf intermediate file, named like 000001_ocr.png."""
+    return int(Path(page_file).name.split("_")[0]) - 1
+
+
+def record_page_confidences(input_file: Path, hocr: str, options) -> None:
+    """Write the confidence summary of the page OCRed from `input_file`."""
+    if not getattr(options, "confidence_dir", None):
+        return
+    summary = summarize_confidences(hocr_word_confidences(hocr))
+    path = os.path.join(options.confidence_dir, f"{page_index(input_file):06d}.json")
+    with open(path, "w", encoding="utf-8") as fout:
+        json.dump(summary, fout)
+
+
+def read_page_confidences(confidence_dir: str, num_pages: int) -> List[Optional[Dict[str, Any]]]:
+    """Confidence summaries of the pages of a document, None for the pages that were not OCRed."""
+    pages: List[Optional[Dict[str, Any]]] = [None] * num_pages
+    for name in os.listdir(confidence_dir):
+        page = int(name.split(".")[0])
+        if page < num_pages:
+            with open(os.path.join(confidence_dir, name), encoding="utf-8") as fin:
+                pages[page] = json.load(fin)
+    return pages
+
+
+class ConfidenceOcrEngine(TesseractOcrEngine):
+    """Tesseract engine also writing the hOCR of every page, to record its word confidences."""
+
+    @staticmethod
+    def generate_hocr(input_file, output_hocr, output_text, options):
+        TesseractOcrEngine.generate_hocr(input_file, output_hocr, output_text, options)
+        if Path(output_hocr).exists():
+            record_page_confidences(input_file, Path(output_hocr).read_text(encoding="utf-8"), options)
+
+    @staticmethod
+    def generate_pdf(input_file, output_pdf, output_text, options):
+        if not options.confidence_dir:
+            TesseractOcrEngine.generate_pdf(input_file, output_pdf, output_text, options)
+            return
+        tesseract.generate_pdf(
+            input_file=input_file,
+            output_pdf=output_pdf,
+            output_text=output_text,
+            languages=options.languages,
+            engine_mode=options.tesseract_oem,
+            # the "hocr" config makes Tesseract write <output>.hocr next to the PDF
+            tessconfig=[*options.tesseract_config, "hocr"],
+            timeout=options.tesseract_timeout,
+            pagesegmode=options.tesseract_pagesegmode,
+            thresholding=options.tesseract_thresholding,
+            user_words=options.user_words,
+            user_patterns=options.user_patterns,
+        )
+        # missing if Tesseract timed out and the page was skipped
+        hocr_file = Path(output_pdf).with_suffix(".hocr")
+        if hocr_file.exists():
+            record_page_confidences(input_file, hocr_file.read_text(encoding="utf-8"), options)
+
+
+@hookimpl
+def add_options(parser):
+    group = parser.add_argument_group("Confidence", "Word confidences of the OCRed pages")
+    group.add_argument(
+        "--confidence-dir",
+        default=None,
+        help="Directory where the word confidences of each OCRed page are written.",
+    )
+
+
+@hookimpl
+def get_ocr_engine():
+    return ConfidenceOcrEngine()
@@ -0,0 +1,140 @@
+import logging
+import math
+import multiprocessing
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CGROUP_V2_CPU_MAX = "/sys/fs/cgroup/cpu.max"
+CGROUP_V1_QUOTA = "/sys/fs/cgroup/cpu/cpu.cfs_quota_us"
+CGROUP_V1_PERIOD = "/sys/fs/cgroup/cpu/cpu.cfs_period_us"
+# seconds a reset waits for the lock before assuming a dead process holds it
+RESET_LOCK_TIMEOUT = 5.0
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as fin:
+            return fin.read().strip()
+    except OSError:
+        return None
+
+
+def cgroup_cpu_quota(
+    cpu_max: str = CGROUP_V2_CPU_MAX, v1_quota: str = CGROUP_V1_QUOTA, v1_period: str = CGROUP_V1_PERIOD
+) -> Optional[float]:
+    """CPU limit of the container in cores, None if it is not limited."""
+    content = _read(cpu_max)
+    if content is not None:
+        quota, _, period = content.partition(" ")
+        if quota == "max":
+            return None
+        return int(quota) / int(period or 100000)
+    quota, period = _read(v1_quota), _read(v1_period)
+    if quota is None or period is None or int(quota) <= 0:
+        return None
+    return int(quota) / int(period)
+
+
+def available_cpus() -> int:
+    """CPUs this process may use, given its affinity and the cgroup quota."""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = len(os.sched_getaffinity(0))
+    else:
+        cpus = os.cpu_count() or 1
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        # rounding down, because going over the quota throttles every process of the container
+        cpus = min(cpus, max(1, math.floor(quota)))
+    return cpus
+
+
+class CpuBudget:
+    """Cores shared by the documents OCRed at the same time, in any thread or forked process.
+
+    Each document asks for the cores it can use and gets at most its fair
+    share of the budget among the documents that are being OCRed, so the
+    total never exceeds the budget. Reservations belong to a generation,
+    which `reset` ends, so the late releases of processes that died or were
+    replaced do not count twice.
+    """
+
+    def __init__(self, total: int) -> None:
+        """Initialize the budget; processes forked afterwards share it.
+
+        :param total: number of cores of the budget
+        """
+        self.total = total
+        self._share(generation=0)
+
+    def _share(self, generation: int) -> None:
+        """Make the counters and the lock shared with the processes forked afterwards."""
+        context = multiprocessing.get_context("fork")
+        self.free = context.Value("i", self.total, lock=False)
+        self.users = context.Value("i", 0, lock=False)
+        self.generation = context.Value("i", generation, lock=False)
+        self.condition = context.Condition()
+
+    def _take(self, wanted: int) -> Tuple[int, int]:
+        """Block until at least one core is free and take up to `wanted` cores.
+
+        :return: number of cores taken and generation of the reservation
+        """
+        with self.condition:
+            self.users.value += 1
+            while self.free.value < 1:
+                self.condition.wait()
+            fair_share = max(1, self.total // self.users.value)
+            cores = max(1, min(wanted, fair_share, self.free.value))
+            self.free.value -= cores
+            return cores, self.generation.value
+
+    def acquire(self, wanted: int) -> int:
+        """Block until at least one core is free and take up to `wanted` cores.
+
+        :return: number of cores taken
+        """
+        return self._take(wanted)[0]
+
+    def release(self, cores: int, generation: Optional[int] = None) -> None:
+        """Give back the cores taken by `acquire`.
+
+        :param generation: generation of the reservation, releases of an older generation are ignored
+        """
+        with self.condition:
+            if generation is not None and generation != self.generation.value:
+                logger.debug(f"Ignoring the release of {cores} cores reserved before a reset")
+                return
+            self.free.value = min(self.total, self.free.value + cores)
+            self.users.value = max(0, self.users.value - 1)
+            self.condition.notify_all()
+
+    def reset(self) -> None:
+        """Forget all reservations, e.g. after the processes holding them died.
+
+        A process killed while holding the lock never releases it, so the
+        budget then starts over with a new lock, shared with the processes
+        forked afterwards.
+        """
+        if not self.condition.acquire(timeout=RESET_LOCK_TIMEOUT):
+            logger.warning("The CPU budget lock is held by a dead process, replacing it")
+            self._share(generation=self.generation.value + 1)
+            return
+        try:
+            self.generation.value += 1
+            self.free.value = self.total
+            self.users.value = 0
+            self.condition.notify_all()
+        finally:
+            self.condition.release()
+
+    @contextmanager
+    def reserve(self, wanted: int) -> Iterator[int]:
+        """Take up to `wanted` cores for the duration of the block."""
+        cores, generation = self._take(wanted)
+        try:
+            yield cores
+        finally:
+            self.release(cores, generation)
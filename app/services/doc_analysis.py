@@ -1,8 +1,9 @@
 import logging
 import os
+import time
 from collections import defaultdict
 from io import BytesIO
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
 
 import fitz
 import numpy as np
@@ -15,14 +16,17 @@ from spacy.tokens import Doc, Span, Token
 from spacy.util import filter_spans
 
 from app.config import VECTOR_SEARCH
+from app.services import resources
 from app.services.synonyms import get_synonyms
 from app.services.text_processing import remove_diacritics
 from app.services.vector_searcher import VectorSearcher
 from app.utils.file_util import read_text_file
+from app.utils.timing import Timings, measure
 from nlp.resources.constants import KEYWORDS_PATH
 
 logger = logging.getLogger(__name__)
 NLP = None
+MODEL_NAME = None
 KEYWORDS_AS_DOCS = None
 ORTH_MATCHER = None
 LAST_KEYWORDS_HASH = "0"
@@ -32,7 +36,7 @@ VECTOR_SEARCHER = VectorSearcher()
 
 def load_spacy_global_model() -> spacy.language.Language:
     """Load spacy global model"""
-    global NLP
+    global NLP, MODEL_NAME
     enable_ner = bool(os.environ.get("ENABLE_NER", False))
     pipelines_to_disable = ["attribute_ruler", "ner"]
     if enable_ner:
@@ -41,14 +45,21 @@ def load_spacy_global_model() -> spacy.language.Language:
     if not spacy.util.is_package(model_name):
         model_name = "ro_core_news_lg"
     NLP = spacy.load(model_name, disable=pipelines_to_disable)
+    MODEL_NAME = f"{model_name}-{NLP.meta.get('version')} disabled={pipelines_to_disable}"
     logger.info(f"Loaded model {model_name}.")
     return NLP
 
 
-NLP = load_spacy_global_model()
+get_nlp = resources.register("spacy_model", load_spacy_global_model)
 Token.set_extension("synonyms", getter=get_synonyms)
 
 
+def highlight_settings() -> str:
+    """Settings that change the highlighting output, used to identify cached results."""
+    get_nlp()
+    return f"{MODEL_NAME} vector_search={VECTOR_SEARCH}"
+
+
 def process_keywords_with_spacy(keywords: List[str], nlp: Language) -> List[Doc]:
     """Process keywords with spacy"""
     keywords_as_docs = list(nlp.pipe(keywords))
@@ -104,7 +115,7 @@ def get_token_variants(keyword_token: Token) -> List[str]:
         remove_diacritics(keyword_token.text),
         keyword_token.lemma_,
     ]
-    synonyms = filter_synonyms(keyword_token, keyword_token._.synonyms, NLP)
+    synonyms = filter_synonyms(keyword_token, keyword_token._.synonyms, get_nlp())
     variants.extend(synonyms)
     variants.extend([remove_diacritics(synonym) for synonym in synonyms])
     return list(set(variants))
@@ -140,10 +151,11 @@ def update_global_kewyord_vars(keywords: List[str]) -> None:
     :param keywords: List of string keywords
     """
     global KEYWORDS_AS_DOCS, ORTH_MATCHER, LEMMA_MATCHER, VECTOR_SEARCHER
-    KEYWORDS_AS_DOCS = process_keywords_with_spacy(keywords, NLP)
-    ORTH_MATCHER = make_orth_matcher(KEYWORDS_AS_DOCS, NLP)
-    LEMMA_MATCHER = make_lemma_matcher(KEYWORDS_AS_DOCS, NLP)
-    make_keywords_in_spacy(KEYWORDS_AS_DOCS, NLP)
+    nlp = get_nlp()
+    KEYWORDS_AS_DOCS = process_keywords_with_spacy(keywords, nlp)
+    ORTH_MATCHER = make_orth_matcher(KEYWORDS_AS_DOCS, nlp)
+    LEMMA_MATCHER = make_lemma_matcher(KEYWORDS_AS_DOCS, nlp)
+    make_keywords_in_spacy(KEYWORDS_AS_DOCS, nlp)
     if VECTOR_SEARCH:
         logger.info("Building vector searcher for keywords...")
         VECTOR_SEARCHER.fit(KEYWORDS_AS_DOCS)
@@ -179,12 +191,13 @@ def do_matching(doc: Doc) -> List[Span]:
 
 
 def highlight_keywords_spacy(
-    input_pdf_path: str, output_pdf_path: str
+    input_pdf_path: str, output_pdf_path: str, timings: Optional[Timings] = None
 ) -> Tuple[Dict, Dict]:
     """Highlight keywords of a PDF file and write the output.
 
     :param input_pdf_path: input PDF file
     :param output_pdf_path: output PDF file
+    :param timings: collects the time spent in each step, defaults to None
     :return: metadata and statistics
     """
     highlight_meta_results = defaultdict(list)
@@ -197,14 +210,20 @@ def highlight_keywords_spacy(
         statistics["num_pages"] = pdfDoc.page_count
         for pg in range(pdfDoc.page_count):
             page = pdfDoc[pg]
-            word_coordinates = page.get_text_words(fitz.TEXTFLAGS_SEARCH)
+            with measure(timings, "word_extraction"):
+                word_coordinates = page.get_text_words(fitz.TEXTFLAGS_SEARCH)
             tokens_pdf = [w[4] for w in word_coordinates]
-            doc = NLP(" ".join(tokens_pdf))
+            with measure(timings, "spacy_parsing"):
+                doc = get_nlp()(" ".join(tokens_pdf))
             num_wds += len(doc)
             num_chars += len(doc.text)
             tokens_spc = [t.text for t in doc]
             pdf2spc, spc2pdf = tokenizations.get_alignments(tokens_pdf, tokens_spc)
-            matches = do_matching(doc)
+            with measure(timings, "matching"):
+                matches = do_matching(doc)
+            with measure(timings, "vector_search"):
+                semantic_matches = VECTOR_SEARCHER.search(doc)
+            annotation_start = time.perf_counter()
             for entity in matches:
                 num_kwds += 1
                 string_id = entity.label_
@@ -229,7 +248,7 @@ def highlight_keywords_spacy(
                 highlight.set_info(content=string_id)
                 highlight.update()
 
-            for entity in VECTOR_SEARCHER.search(doc):
+            for entity in semantic_matches:
                 # num_kwds += 1
                 string_id = entity.label_
                 logger.debug(
@@ -286,11 +305,15 @@ def highlight_keywords_spacy(
                 highlight.set_colors(stroke=[0.5, 1, 1])
                 highlight.set_info(content=string_id)
                 highlight.update()
-        output_buffer = BytesIO()
-        pdfDoc.save(output_buffer)
-
-    with open(output_pdf_path, mode="wb") as f:
-        f.write(output_buffer.getbuffer())
+            if timings is not None:
+                timings.add("annotation", time.perf_counter() - annotation_start)
+        with measure(timings, "pdf_save"):
+            output_buffer = BytesIO()
+            pdfDoc.save(output_buffer)
+
+    with measure(timings, "pdf_save"):
+        with open(output_pdf_path, mode="wb") as f:
+            f.write(output_buffer.getbuffer())
     statistics["num_ents"] = num_ents
     statistics["num_kwds"] = num_kwds
     statistics["num_wds"] = num_wds
@@ -308,7 +331,11 @@ def highlight_keywords_spacy(
 
 
 def highlight_keywords(
-    input_pdf_path: str, output_pdf_path: str, keywords: List[Dict], last_modified: str
+    input_pdf_path: str,
+    output_pdf_path: str,
+    keywords: List[Dict],
+    last_modified: str,
+    timings: Optional[Timings] = None,
 ) -> Tuple[Dict, Dict]:
     """Highlight keywords of a PDF file and write the output.
 
@@ -316,6 +343,7 @@ def highlight_keywords(
     :param output_pdf_path: output PDF file
     :param keywords: keywords list from API
     :param last_modified: hash of the keywords list
+    :param timings: collects the time spent in each step, defaults to None
     :return: metadata and statistics
     """
     global LAST_KEYWORDS_HASH
@@ -324,12 +352,13 @@ def highlight_keywords(
     )
     if last_modified != LAST_KEYWORDS_HASH:
         try:
-            keywords = load_response_keywords(keywords)
-            update_global_kewyord_vars(keywords)
+            with measure(timings, "keywords_loading"):
+                keywords = load_response_keywords(keywords)
+                update_global_kewyord_vars(keywords)
             LAST_KEYWORDS_HASH = last_modified
         except Exception:
             logger.exception("Failed to update the list of keywords.")
         logger.info(
             f"Highlighting with keywords list hash '{last_modified}' of '{len(keywords)}' keywords"
         )
-    return highlight_keywords_spacy(input_pdf_path, output_pdf_path)
+    return highlight_keywords_spacy(input_pdf_path, output_pdf_path, timings=timings)
@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from app.config import JOB_JOURNAL_PATH, WORKER_ID
+from app.utils.file_util import secure_filename
+
+logger = logging.getLogger(__name__)
+
+
+class JobJournal:
+    """Write-ahead journal of the stages completed for each document.
+
+    Every document has its own append-only file of JSON lines, flushed to disk
+    after each stage, so a worker restarted after a crash knows which stages
+    are done and can resume from the artifacts already written. Every resumed
+    run is recorded as an attempt, so a document that keeps crashing the worker
+    can be given up on. The file is removed once the document is reported to
+    the API.
+    """
+
+    def __init__(self, directory: str) -> None:
+        """Initialize the journal.
+
+        :param directory: directory of the journal files of this worker
+        """
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path(self, job_id: str) -> str:
+        """Journal file of a document."""
+        return os.path.join(self.directory, secure_filename(f"{job_id}.jsonl"))
+
+    def record(self, job_id: str, stage: str,
+               analysis: Dict[str, Any], document: Optional[Dict[str, Any]] = None,
+               state: Optional[Dict[str, Any]] = None) -> None:
+        """Durably record that a stage of a document is completed.
+
+        :param job_id: document id
+        :param stage: completed stage
+        :param analysis: analysis of the document so far
+        :param document: document received from the API, recorded with the first stage
+        :param state: decisions made while processing the document so far, defaults to None
+        """
+        entry = {"stage": stage, "time": time.time(), "analysis": analysis}
+        if document is not None:
+            entry["document"] = document
+        if state is not None:
+            entry["state"] = state
+        with open(self.path(job_id), "a", encoding="utf-8") as fout:
+            fout.write(json.dumps(entry) + "\n")
+            fout.flush()
+            os.fsync(fout.fileno())
+
+    def record_attempt(self, job_id: str) -> None:
+        """Durably record that the processing of a document is resumed."""
+        with open(self.path(job_id), "a", encoding="utf-8") as fout:
+            fout.write(json.dumps({"attempt": True, "time": time.time()}) + "\n")
+            fout.flush()
+            os.fsync(fout.fileno())
+
+    def finish(self, job_id: str) -> None:
+        """Forget a document once it is reported."""
+        try:
+            os.remove(self.path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def read(self, path: str) -> Optional[Dict[str, Any]]:
+        """Replay a journal file.
+
+        :param path: journal file
+        :return: the document, the completed stages, the last analysis and state, and the number of runs so far
+        """
+        document = None
+        stages = []
+        analysis = {}
+        state = {}
+        attempts = 1
+        with open(path, encoding="utf-8") as fin:
+            for line in fin:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # last line was not entirely written
+                    logger.warning(f"Ignoring truncated entry in {path}")
+                    break
+                if entry.get("attempt"):
+                    attempts += 1
+                    continue
+                document = entry.get("document", document)
+                stages.append(entry["stage"])
+                analysis = entry["analysis"]
+                state = entry.get("state", state)
+        if document is None:
+            return None
+        return {"document": document, "stages": stages, "analysis": analysis, "state": state, "attempts": attempts}
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """Documents left unfinished by a previous run of the worker."""
+        jobs = []
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            job = self.read(path)
+            if job is None:
+                os.remove(path)
+                continue
+            jobs.append(job)
+        return jobs
+
+
+JOURNAL = None
+
+
+def get_journal() -> Optional[JobJournal]:
+    """Get the journal of this worker, None if it is disabled."""
+    global JOURNAL
+    if JOURNAL is None and JOB_JOURNAL_PATH:
+        JOURNAL = JobJournal(os.path.join(JOB_JOURNAL_PATH, secure_filename(str(WORKER_ID))))
+    return JOURNAL
@@ -0,0 +1,300 @@
+import logging
+import multiprocessing
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+RATE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50)
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Prometheus label set, e.g. {status="ocr_done"}."""
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    """Prometheus sample value."""
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """A named family of samples, one per combination of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, registry: "Registry", name: str, description: str, label_names: Sequence[str] = ()) -> None:
+        """Initialize the metric.
+
+        :param registry: registry the metric belongs to
+        :param name: name of the metric
+        :param description: help text of the metric
+        :param label_names: names of the labels of the metric
+        """
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+
+    def _labels(self, labels: Dict[str, str]) -> Labels:
+        """Label values in the order of the label names."""
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def apply(self, labels: Labels, value: float) -> None:
+        """Update the sample of the labels, called with the registry lock held."""
+        raise NotImplementedError
+
+    def samples(self) -> List[Tuple[str, Labels, Sequence[str], float]]:
+        """Samples as (suffix, label values, extra label pairs, value)."""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        """Lines of the metric in the Prometheus text format."""
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, extra, value in self.samples():
+            names = self.label_names + tuple(extra[::2])
+            values = labels + tuple(extra[1::2])
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increase the count of the labels."""
+        self.registry.record(self.name, self._labels(labels), amount)
+
+    def apply(self, labels: Labels, value: float) -> None:
+        self.values[labels] = self.values.get(labels, 0.0) + value
+
+    def samples(self):
+        return [("", labels, (), value) for labels, value in sorted(self.values.items())]
+
+
+class Gauge(Metric):
+    """Value that goes up and down, either set or read at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.values: Dict[Labels, float] = {}
+        self.functions: Dict[Labels, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the value of the labels."""
+        self.registry.record(self.name, self._labels(labels), value)
+
+    def track(self, function: Callable[[], float], **labels: str) -> None:
+        """Read the value of the labels from a function of this process at scrape time."""
+        with self.registry.lock:
+            self.functions[self._labels(labels)] = function
+
+    def apply(self, labels: Labels, value: float) -> None:
+        self.values[labels] = value
+
+    def samples(self):
+        values = dict(self.values)
+        for labels, function in self.functions.items():
+            try:
+                values[labels] = function()
+            except Exception:
+                logger.debug(f"Could not read gauge {self.name}", exc_info=True)
+        return [("", labels, (), value) for labels, value in sorted(values.items())]
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = SECONDS_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self.counts: Dict[Labels, List[int]] = {}
+        self.sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Add an observation to the labels."""
+        self.registry.record(self.name, self._labels(labels), value)
+
+    def apply(self, labels: Labels, value: float) -> None:
+        counts = self.counts.setdefault(labels, [0] * len(self.buckets))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        self.sums[labels] = self.sums.get(labels, 0.0) + value
+
+    def samples(self):
+        samples = []
+        for labels, counts in sorted(self.counts.items()):
+            for bound, count in zip(self.buckets, counts):
+                samples.append(("_bucket", labels, ("le", _format_value(bound)), count))
+            samples.append(("_sum", labels, (), self.sums[labels]))
+            samples.append(("_count", labels, (), counts[-1]))
+        return samples
+
+
+class Registry:
+    """Metrics of the worker, rendered in the Prometheus text format.
+
+    Once `share` is called, processes forked afterwards (pool slots, executors)
+    send their updates over a queue to the process that serves the metrics, so
+    the endpoint reports the whole worker.
+    """
+
+    def __init__(self) -> None:
+        """Initialize an empty registry."""
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = threading.Lock()
+        self.owner = os.getpid()
+        self.events: Optional[multiprocessing.Queue] = None
+
+    def counter(self, name: str, description: str, label_names: Sequence[str] = ()) -> Counter:
+        """Register a counter."""
+        return self._register(Counter(self, name, description, label_names))
+
+    def gauge(self, name: str, description: str, label_names: Sequence[str] = ()) -> Gauge:
+        """Register a gauge."""
+        return self._register(Gauge(self, name, description, label_names))
+
+    def histogram(self, name: str, description: str, label_names: Sequence[str] = (),
+                  buckets: Sequence[float] = SECONDS_BUCKETS) -> Histogram:
+        """Register a histogram."""
+        return self._register(Histogram(self, name, description, label_names, buckets=buckets))
+
+    def _register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def record(self, name: str, labels: Labels, value: float) -> None:
+        """Apply an update here, or send it to the serving process from a forked one."""
+        if self.events is not None and os.getpid() != self.owner:
+            self.events.put((name, labels, value))
+            return
+        with self.lock:
+            self.metrics[name].apply(labels, value)
+
+    def share(self) -> None:
+        """Start collecting the updates of the processes forked from now on."""
+        if self.events is not None:
+            return
+        self.owner = os.getpid()
+        self.events = multiprocessing.get_context("fork").Queue()
+        threading.Thread(target=self._drain, name="metrics-drain", daemon=True).start()
+
+    def _drain(self) -> None:
+        """Apply the updates sent by the forked processes."""
+        while True:
+            name, labels, value = self.events.get()
+            with self.lock:
+                self.metrics[name].apply(labels, value)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format."""
+        lines = []
+        with self.lock:
+            for metric in self.metrics.values():
+                lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+def resident_memory() -> float:
+    """Resident set size of this process in bytes."""
+    with open("/proc/self/statm") as fin:
+        return int(fin.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def process_uptime() -> float:
+    """Seconds since this process started."""
+    with open("/proc/self/stat") as fin:
+        # the start time is the 22nd field, the 20th after the command name
+        start_ticks = int(fin.read().rsplit(")", 1)[1].split()[19])
+    with open("/proc/uptime") as fin:
+        uptime = float(fin.read().split()[0])
+    return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+
+
+REGISTRY = Registry()
+
+DOCUMENTS = REGISTRY.counter(
+    "ocr_documents_total", "Documents processed, by the final status sent to the API.", ["status"]
+)
+PAGES = REGISTRY.counter("ocr_pages_total", "Pages of the processed documents.")
+PAGES_PER_SECOND = REGISTRY.histogram(
+    "ocr_document_pages_per_second", "Pages processed per second, per document.", buckets=RATE_BUCKETS
+)
+DOCUMENT_SECONDS = REGISTRY.histogram("ocr_document_seconds", "Processing time of a document.")
+STEP_SECONDS = REGISTRY.histogram("ocr_step_seconds", "Time spent in each processing step of a document.", ["step"])
+ROTATION_RETRIES = REGISTRY.counter(
+    "ocr_rotation_retries_total", "Documents done again with forced page rotation because of low quality."
+)
+FORCED_ROTATIONS = REGISTRY.counter(
+    "ocr_forced_rotations_total", "Documents OCRed with forced page rotation, as decided by the rotation probe."
+)
+PAYLOAD_TIERS = REGISTRY.counter(
+    "ocr_update_payload_tier_total", "Status updates sent to the API, by payload tier.", ["tier"]
+)
+CACHE_LOOKUPS = REGISTRY.counter(
+    "ocr_result_cache_lookups_total", "Result cache lookups, by cached result and outcome.", ["result", "outcome"]
+)
+NORMALIZATION_CACHE_LOOKUPS = REGISTRY.counter(
+    "ocr_normalization_cache_lookups_total", "Lookups in the word normalization caches.", ["cache", "result"]
+)
+QUEUE_DEPTH = REGISTRY.gauge("ocr_queue_depth", "Documents waiting in the queues of the worker.", ["queue"])
+STARTUP_SECONDS = REGISTRY.gauge(
+    "ocr_startup_seconds", "Time from the start of the worker until it is ready, and loading each resource.", ["step"]
+)
+RESIDENT_MEMORY = REGISTRY.gauge("ocr_resident_memory_bytes", "Resident memory of the main worker process.")
+RESIDENT_MEMORY.track(resident_memory)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the registry on GET /metrics."""
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in {"/", "/metrics"}:
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug(format % args)
+
+
+def start_server(host: str, port: int) -> ThreadingHTTPServer:
+    """Serve the metrics from a background thread, so the main loop is never blocked.
+
+    Must be called before forking the processes whose metrics are collected.
+    """
+    REGISTRY.share()
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
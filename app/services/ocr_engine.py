@@ -0,0 +1,109 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+import ocrmypdf
+from ocrmypdf.api import get_plugin_manager
+
+logger = logging.getLogger(__name__)
+
+# plugin manager of an engine process, loaded once when the process starts
+PLUGIN_MANAGER = None
+
+
+def _init_engine_process(plugins: List[str]) -> None:
+    """Load ocrmypdf and its plugins once per engine process."""
+    global PLUGIN_MANAGER
+    PLUGIN_MANAGER = get_plugin_manager(plugins)
+
+
+def _ping() -> bool:
+    return True
+
+
+def _run_ocr(input_file: str, output_file: str, options: Dict[str, Any]) -> int:
+    """Run ocrmypdf in an engine process."""
+    return int(ocrmypdf.ocr(input_file, output_file, plugin_manager=PLUGIN_MANAGER, **options))
+
+
+class OcrEngine:
+    """Long-lived processes doing OCR through the ocrmypdf API.
+
+    The processes import ocrmypdf and load its plugins once, so small documents
+    do not pay the start of a new ocrmypdf process. ocrmypdf runs a single task
+    per process, so documents are OCRed concurrently by different processes.
+    """
+
+    def __init__(self, workers: int = 1, plugins: Optional[List[str]] = None) -> None:
+        """Initialize the engine.
+
+        :param workers: number of engine processes
+        :param plugins: ocrmypdf plugins to load, defaults to None
+        """
+        self.workers = workers
+        self.plugins = plugins or []
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.restarts = 0
+        # documents are OCRed from several threads, e.g. the shards of a large document
+        self.lock = threading.Lock()
+
+    def _start_executor(self) -> ProcessPoolExecutor:
+        """Start the engine processes and wait for them to load ocrmypdf."""
+        executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=_init_engine_process,
+            initargs=(self.plugins,),
+        )
+        wait([executor.submit(_ping) for _ in range(self.workers)])
+        logger.info(f"Started OCR engine with {self.workers} processes and plugins {self.plugins}")
+        return executor
+
+    def start(self) -> ProcessPoolExecutor:
+        """Start the engine processes, unless they are running; returns their executor."""
+        with self.lock:
+            if self.executor is None:
+                self.executor = self._start_executor()
+            return self.executor
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the engine processes."""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def restart(self, broken: ProcessPoolExecutor) -> ProcessPoolExecutor:
+        """Replace the engine processes after one of them died, unless another thread already did.
+
+        :param broken: executor of the processes that died
+        :return: executor of the new processes
+        """
+        with self.lock:
+            if self.executor is broken:
+                broken.shutdown(wait=False)
+                self.executor = self._start_executor()
+                self.restarts += 1
+            elif self.executor is None:
+                self.executor = self._start_executor()
+            return self.executor
+
+    def run(self, input_file: str, output_file: str, **options: Any) -> int:
+        """OCR a document in one of the engine processes.
+
+        :param input_file: input PDF file
+        :param output_file: output PDF file
+        :param options: keyword arguments of `ocrmypdf.ocr`
+        :return: exit code of ocrmypdf
+        """
+        executor = self.start()
+        try:
+            return executor.submit(_run_ocr, input_file, output_file, options).result()
+        except BrokenProcessPool:
+            # a crash in the native code of Tesseract kills its process, which breaks the whole pool
+            logger.exception(f"OCR engine died while processing {input_file}, restarting it and trying again")
+            executor = self.restart(executor)
+            return executor.submit(_run_ocr, input_file, output_file, options).result()
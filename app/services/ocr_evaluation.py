@@ -1,41 +1,110 @@
 import logging
+import math
+import os
 import re
-from typing import Set
+from functools import lru_cache
+from typing import (Any, Collection, Dict, Iterable, List, NamedTuple,
+                    Optional, Set, Tuple)
 
 import nltk
 
+from app.config import NLTK_DOWNLOAD, NORMALIZATION_CACHE_SIZE, VOCABULARY_CACHE_PATH
+from app.services import metrics, resources
+from app.services.page_classification import stratified_sample
+from app.services.result_cache import file_hash, make_key
+from app.services.sampling import Z_95, RatioEstimate
 from app.services.text_processing import remove_diacritics
+from app.services.vocabulary_cache import build_vocabulary, load_vocabulary
 from app.utils.file_util import read_text_file
 from nlp.resources.constants import RO_CHARS, VOCAB_PATH, WORDLIST_PATH
 
 logger = logging.getLogger(__name__)
 
-nltk.download("punkt")
-nltk.download("stopwords")
+# NLTK data used, by the package that provides it
+NLTK_DATA = {"tokenizers/punkt": "punkt", "corpora/stopwords": "stopwords"}
 
 STEMMER = nltk.stem.snowball.SnowballStemmer("romanian")
+NON_LETTERS = re.compile(r"[^a-z]+")
 
 
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
 def normalize_word(token: str) -> str:
     """Normalize a word by removing diacritics and stemming it."""
     return remove_diacritics(STEMMER.stem(token))
 
 
+def load_nltk_data() -> None:
+    """Make sure the NLTK data is installed, downloading only the missing packages if NLTK_DOWNLOAD is set.
+
+    :raises LookupError: if some data is missing and cannot be downloaded
+    """
+    for path, package in NLTK_DATA.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            if not NLTK_DOWNLOAD:
+                raise
+            logger.info(f"Downloading the NLTK package {package}")
+            nltk.download(package, quiet=True, raise_on_error=True)
+            nltk.data.find(path)
+
+
+ensure_nltk_data = resources.register("nltk_data", load_nltk_data)
+
+
 def load_vocabulary_words() -> Set[str]:
     """Load vocabulary words from the default vocabulary file and the custom wordlist."""
+    ensure_nltk_data()
     vocab_words = set(read_text_file(VOCAB_PATH).split())
     custom_words = set(read_text_file(WORDLIST_PATH).split())
     vocab_words = vocab_words.union(custom_words)
-    # TODO: do this once, or change file directly
     vocab_words_normalized = [normalize_word(w) for w in vocab_words]
     vocab_words = vocab_words.union(set(vocab_words_normalized))
     stopwords_words = nltk.corpus.stopwords.words("romanian")
     vocab_words = vocab_words.union(set(stopwords_words))
+    # keep the caches for the words of the documents
+    normalize_word.cache_clear()
+    remove_diacritics.cache_clear()
     return vocab_words
 
 
+def vocabulary_file() -> str:
+    """Path of the compiled vocabulary, named after the word sources and the stemmer that normalizes them."""
+    ensure_nltk_data()
+    key = make_key(
+        file_hash(VOCAB_PATH),
+        file_hash(WORDLIST_PATH),
+        "\n".join(nltk.corpus.stopwords.words("romanian")),
+        f"nltk {nltk.__version__}",
+        STEMMER.__class__.__name__,
+        "romanian",
+    )
+    return os.path.join(VOCABULARY_CACHE_PATH, f"vocabulary_{key[:32]}.bin")
+
+
+def load_cached_vocabulary_words() -> Collection[str]:
+    """Map the compiled vocabulary, compiling it first if needed; a set of words if the cache is disabled."""
+    if not VOCABULARY_CACHE_PATH:
+        return load_vocabulary_words()
+    path = vocabulary_file()
+    vocabulary = load_vocabulary(path)
+    if vocabulary is None:
+        logger.info(f"Compiling the vocabulary to {path}")
+        words = load_vocabulary_words()
+        try:
+            build_vocabulary(words, path)
+        except OSError as e:
+            logger.warning(f"Could not write the vocabulary to {path}: {e}")
+            return words
+        vocabulary = load_vocabulary(path)
+        if vocabulary is None:
+            return words
+    return vocabulary
+
+
 # TODO: compile better list of user words based on data
-VOCABULARY_WORDS = load_vocabulary_words()
+# warmed up before the workers are forked, so they share the mapped vocabulary
+get_vocabulary_words = resources.register("vocabulary", load_cached_vocabulary_words)
 
 
 def validate_text(text: str) -> bool:
@@ -47,36 +116,86 @@ def validate_text(text: str) -> bool:
     return True
 
 
+def cer_counts(text: str) -> Tuple[int, int]:
+    """Number of plausible characters and of all the characters of a text."""
+    return len([c for c in text.lower() if c in RO_CHARS]), len(text)
+
+
 def cer(text: str) -> float:
     """Character error rate (the higher the better score)"""
-    total_chars = len(text)
-    correct_chars = len([c for c in text.lower() if c in RO_CHARS])
+    correct_chars, total_chars = cer_counts(text)
     logger.debug(
         f"[CER] Atypical characters: {set([c for c in text.lower() if c not in RO_CHARS])}; CER={correct_chars/total_chars * 100}"
     )
     return correct_chars / total_chars
 
 
-def wer(text: str) -> float:
-    """Word error rate (the higher the better score)"""
+@lru_cache(maxsize=NORMALIZATION_CACHE_SIZE)
+def check_word(word: str) -> Optional[bool]:
+    """Whether a lowercase token or its normalized form is in the vocabulary, None if it is not a word."""
+    normalized_word = normalize_word(word)
+    if not normalized_word or NON_LETTERS.fullmatch(normalized_word):
+        return None
+    vocabulary = get_vocabulary_words()
+    return normalized_word in vocabulary or word in vocabulary
+
+
+def wer_counts(text: str) -> Tuple[int, int, Set[str]]:
+    """Number of words found in the vocabulary and of all the words of a text, and the words not found."""
     # Tokenize and normalize text
+    ensure_nltk_data()
     tokenized_text = nltk.word_tokenize(text.lower())
     # tokenized_text = re.split(r'[^a-zăâîșşțţ\-]+', text.lower())
     correct_words = 0
     incorrect_words = set()
-    all_words = 1
+    checked_words = 0
     for word in tokenized_text:
-        normalized_word = normalize_word(word)
-        if not normalized_word or re.fullmatch(r"[^a-z]+", normalized_word):
+        found = check_word(word)
+        if found is None:
             continue
-        if normalized_word in VOCABULARY_WORDS or word in VOCABULARY_WORDS:
+        if found:
             correct_words += 1
         else:
             incorrect_words.add(word)
-        all_words += 1
-    if all_words == 0:
-        logger.warning("[WER] No words found in text.")
-        return 0
+        checked_words += 1
+    return correct_words, checked_words, incorrect_words
+
+
+NORMALIZATION_CACHES = {
+    "check_word": check_word,
+    "normalize_word": normalize_word,
+    "remove_diacritics": remove_diacritics,
+}
+# lookups of each cache already added to the metrics by this process
+_reported_lookups: Dict[str, Tuple[int, int]] = {}
+
+
+def report_normalization_caches() -> Dict[str, float]:
+    """Add the normalization cache lookups since the last report to the metrics.
+
+    :return: hit rate of each cache since it was last cleared, absent for unused caches
+    """
+    hit_rates = {}
+    for name, cache in NORMALIZATION_CACHES.items():
+        info = cache.cache_info()
+        hits, misses = _reported_lookups.get(name, (0, 0))
+        if info.hits < hits or info.misses < misses:
+            # the cache was cleared since the last report
+            hits = misses = 0
+        if info.hits > hits:
+            metrics.NORMALIZATION_CACHE_LOOKUPS.inc(info.hits - hits, cache=name, result="hit")
+        if info.misses > misses:
+            metrics.NORMALIZATION_CACHE_LOOKUPS.inc(info.misses - misses, cache=name, result="miss")
+        _reported_lookups[name] = (info.hits, info.misses)
+        if info.hits + info.misses:
+            hit_rates[name] = round(info.hits / (info.hits + info.misses), 4)
+    return hit_rates
+
+
+def wer(text: str) -> float:
+    """Word error rate (the higher the better score)"""
+    correct_words, checked_words, incorrect_words = wer_counts(text)
+    all_words = checked_words + 1
     logger.info(f"[WER] WER={correct_words / all_words * 100}%")
     logger.debug(f"[WER] Incorrect words: {incorrect_words})")
     return correct_words / all_words
@@ -84,7 +203,212 @@ def wer(text: str) -> float:
 
 def estimate_quality(text: str) -> float:
     """Estimate output quality based on plausible characters and words in the dictionary."""
-    # TODO: also leverage already implemented "confidence" score from Tesseract
     if not validate_text(text):
         return 100
     return round((cer(text) + wer(text)) / 2 * 100, 2)
+
+
+def estimate_page_quality(text: str, confidence: Optional[Dict[str, Any]]) -> Optional[Tuple[float, int]]:
+    """Estimate the quality of a page and its weight, the number of words.
+
+    The quality of an OCRed page is the mean Tesseract confidence of its words;
+    the dictionary heuristic is used only for the pages that were not OCRed.
+
+    :param text: clean text of the page
+    :param confidence: word confidences of the page, None if it was not OCRed
+    :return: None if the page has no text
+    """
+    if confidence is not None:
+        if not confidence["words"]:
+            return None
+        return confidence["confidence"], confidence["words"]
+    if not validate_text(text):
+        return None
+    return estimate_quality(text), len(text.split())
+
+
+class QualityEstimator:
+    """Estimates the quality of a document incrementally, from the clean text of one page at a time.
+
+    With word confidences, the quality is the mean of the page qualities
+    weighted by their words. Without, it is the dictionary heuristic of
+    `estimate_quality` on the whole text, from counts summed over the pages.
+    """
+
+    def __init__(self, confidences: Optional[List[Optional[Dict[str, Any]]]] = None) -> None:
+        """Initialize the estimator.
+
+        :param confidences: word confidences of each page, None for the pages that were not OCRed
+        """
+        self.confidences = confidences
+        self.page_qualities: List[Optional[float]] = []
+        self.page_words: List[int] = []
+        self.weighted_qualities = 0.0
+        self.weights = 0
+        self.start = ""
+        self.correct_chars = self.total_chars = 0
+        self.correct_words = self.checked_words = 0
+
+    def add_page(self, text: str) -> Optional[float]:
+        """Add the clean text of the next page.
+
+        :return: quality of the page, None if it has no text
+        """
+        page = len(self.page_qualities)
+        if self.confidences is not None:
+            confidence = self.confidences[page] if page < len(self.confidences) else None
+            estimate = estimate_page_quality(text, confidence)
+            quality, words = estimate if estimate is not None else (None, 0)
+            self._add_weighted(quality, words)
+            return quality
+        # the text of the document starts with its first page with text
+        self.start = self.start or text
+        quality = None
+        checked_words = 0
+        if text:
+            correct_chars, total_chars = cer_counts(text)
+            correct_words, checked_words, _ = wer_counts(text)
+            self.correct_chars += correct_chars
+            self.total_chars += total_chars
+            self.correct_words += correct_words
+            self.checked_words += checked_words
+            if validate_text(text):
+                quality = round((correct_chars / total_chars + correct_words / (checked_words + 1)) / 2 * 100, 2)
+        self.page_qualities.append(quality)
+        self.page_words.append(checked_words)
+        return quality
+
+    def _add_weighted(self, quality: Optional[float], words: int) -> None:
+        """Add the quality of a page weighted by its words."""
+        if quality is not None:
+            self.weighted_qualities += quality * words
+            self.weights += words
+        self.page_qualities.append(quality)
+        self.page_words.append(words)
+
+    def merge(self, other: "QualityEstimator") -> None:
+        """Add the pages of another estimator, which follow the pages added so far.
+
+        The pages are added in the same order as by `add_page`, so merging
+        estimators of consecutive chunks gives the same quality.
+        """
+        if self.confidences is not None:
+            for quality, words in zip(other.page_qualities, other.page_words):
+                self._add_weighted(quality, words)
+        else:
+            self.page_qualities.extend(other.page_qualities)
+            self.page_words.extend(other.page_words)
+        self.start = self.start or other.start
+        self.correct_chars += other.correct_chars
+        self.total_chars += other.total_chars
+        self.correct_words += other.correct_words
+        self.checked_words += other.checked_words
+
+    @property
+    def quality(self) -> float:
+        """Quality of the pages added so far."""
+        if self.confidences is not None:
+            if not self.weights:
+                return 100
+            return round(self.weighted_qualities / self.weights, 2)
+        if not validate_text(self.start):
+            return 100
+        all_words = self.checked_words + 1
+        logger.info(f"[WER] WER={self.correct_words / all_words * 100}%")
+        return round((self.correct_chars / self.total_chars + self.correct_words / all_words) / 2 * 100, 2)
+
+
+def estimate_pages_quality(
+    page_texts: Iterable[str], confidences: Optional[List[Optional[Dict[str, Any]]]] = None
+) -> Tuple[float, List[Optional[float]]]:
+    """Estimate the quality of each page and of the document, see `QualityEstimator`.
+
+    :param page_texts: clean text of each page
+    :param confidences: word confidences of each page, None for the pages that were not OCRed
+    :return: quality of the document and of each page, None for the pages without text
+    """
+    estimator = QualityEstimator(confidences)
+    for text in page_texts:
+        estimator.add_page(text)
+    return estimator.quality, estimator.page_qualities
+
+
+class QualitySample(NamedTuple):
+    """Quality of a document estimated from a sample of its pages, with its 95% confidence interval."""
+
+    quality: Optional[float]
+    low: float
+    high: float
+    scored_pages: int
+    page_qualities: List[Optional[float]]
+
+
+def interval(quality: float, variance: float) -> Tuple[float, float]:
+    """95% confidence interval of a quality, within 0-100."""
+    half_width = Z_95 * math.sqrt(max(variance, 0.0))
+    return round(max(quality - half_width, 0.0), 2), round(min(quality + half_width, 100.0), 2)
+
+
+def sample_quality(
+    pages: List[str], confidences: Optional[List[Optional[Dict[str, Any]]]] = None, sample_size: int = 50
+) -> QualitySample:
+    """Estimate the quality of a document from a stratified sample of the pages scored from their text.
+
+    The estimate approximates `estimate_pages_quality` without scoring every
+    page. OCRed pages with word confidences cost nothing to score, so they
+    are all used. Without confidences, the plausible characters and the
+    correct words are estimated as ratio estimators over the sampled pages,
+    and the +1 word of `wer` is ignored.
+
+    :param pages: clean text of each page
+    :param confidences: word confidences of each page, None for the pages that were not OCRed
+    :param sample_size: number of pages scored from their text
+    :return: the quality is None if the sample has no words to estimate it
+    """
+    page_qualities: List[Optional[float]] = [None] * len(pages)
+    if confidences is None:
+        start = next((text for text in pages if text), "")
+        if not validate_text(start):
+            return QualitySample(100, 100, 100, 0, page_qualities)
+        sample = stratified_sample(list(range(len(pages))), sample_size)
+        chars, words = RatioEstimate(len(pages)), RatioEstimate(len(pages))
+        for page in sample:
+            text = pages[page]
+            correct_chars, total_chars = cer_counts(text)
+            correct_words, checked_words, _ = wer_counts(text) if text else (0, 0, set())
+            chars.add(correct_chars, total_chars)
+            words.add(correct_words, checked_words)
+            if validate_text(text):
+                page_qualities[page] = round((correct_chars / total_chars + correct_words / (checked_words + 1)) / 2 * 100, 2)
+        if chars.ratio is None or words.ratio is None:
+            return QualitySample(None, 0, 100, len(sample), page_qualities)
+        quality = (chars.ratio + words.ratio) / 2 * 100
+        variance = (chars.variance + words.variance + 2 * chars.covariance(words)) * 50 ** 2
+        return QualitySample(round(quality, 2), *interval(quality, variance), len(sample), page_qualities)
+
+    weighted_qualities = exact_words = unscored_words = 0
+    unscored = []
+    for page, text in enumerate(pages):
+        confidence = confidences[page] if page < len(confidences) else None
+        if confidence is not None:
+            estimate = estimate_page_quality(text, confidence)
+            if estimate is not None:
+                page_qualities[page], words = estimate
+                weighted_qualities += page_qualities[page] * words
+                exact_words += words
+        elif validate_text(text):
+            unscored.append(page)
+            unscored_words += len(text.split())
+    sample = stratified_sample(unscored, sample_size)
+    ratio = RatioEstimate(len(unscored))
+    for page in sample:
+        page_qualities[page], words = estimate_page_quality(pages[page], None)
+        ratio.add(page_qualities[page] * words, words)
+    if not exact_words + unscored_words:
+        return QualitySample(100, 100, 100, len(sample), page_qualities)
+    if ratio.ratio is None and unscored_words:
+        return QualitySample(None, 0, 100, len(sample), page_qualities)
+    share = unscored_words / (exact_words + unscored_words)
+    quality = (weighted_qualities + (ratio.ratio or 0) * unscored_words) / (exact_words + unscored_words)
+    variance = share ** 2 * ratio.variance if unscored_words else 0.0
+    return QualitySample(round(quality, 2), *interval(quality, variance), len(sample), page_qualities)
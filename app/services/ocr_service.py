@@ -1,15 +1,39 @@
+import json
 import logging
 import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
 from subprocess import run
-from typing import Tuple
+from importlib.util import find_spec
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import fitz
 import pikepdf
-from ocrmypdf.__main__ import run as run_ocrmypdf
 from ocrmypdf._exec import tesseract
 
-from app.config import BACK_LANG, LEGAL_LANG, MAX_PAGE_PDF_A, NUM_PROC
+from app.config import (BACK_LANG,
+                        LEGAL_LANG,
+                        MAX_PAGE_PDF_A,
+                        NUM_PROC,
+                        OCR_CONFIDENCE_QUALITY,
+                        OCR_CPU_BUDGET,
+                        OCR_ENGINE_WORKERS,
+                        OCR_IN_PROCESS,
+                        OCR_SHARD_SIZE,
+                        OCR_SHARD_THRESHOLD,
+                        OCR_SHARD_WORKERS,
+                        OCR_TESSEROCR)
+from app.services import resources
+from app.services.confidence_plugin import read_page_confidences
+from app.services.cpu_budget import CpuBudget, available_cpus
+from app.services.ocr_engine import OcrEngine
+from app.services.pdf_shards import extract_pages, merge_pdfs, replace_pages, split_pdf
 from app.services.text_processing import Cleaner
+from app.utils.file_util import make_derived_file_name
+from app.utils.timing import Timings, measure, timed
 
 logger = logging.getLogger(__name__)
 
@@ -17,11 +41,13 @@ logger = logging.getLogger(__name__)
 def get_language() -> str:
     """Get the language to use for OCR."""
     tess_languages = tesseract.get_languages()
-    return LEGAL_LANG if LEGAL_LANG in tess_languages else BACK_LANG
+    language = LEGAL_LANG if LEGAL_LANG in tess_languages else BACK_LANG
+    logger.info(f"Using language {language} for OCR")
+    return language
 
 
-LANGUAGE = get_language()
-logger.info(f"Using language {LANGUAGE} for OCR")
+# detected by running Tesseract, on first use
+get_ocr_language = resources.register("ocr_language", get_language)
 
 
 WORD_LIST = "nlp/resources/custom-wordlist.txt"
@@ -30,25 +56,131 @@ if os.path.exists(WORD_LIST):
     USER_WORDS = ["--user-words", WORD_LIST]
 
 
-CMD_ARGS = [
-    "--skip-text",
-    "--rotate-pages",
-    "--language",
-    LANGUAGE,
-    "--jobs",
-    str(NUM_PROC),
-    "--tesseract-timeout",
-    "600",
-] + USER_WORDS
+AUTO_JOBS = NUM_PROC == "auto"
+# created before the worker forks, so all the processes share it
+CPU_BUDGET = CpuBudget(OCR_CPU_BUDGET or available_cpus())
+if AUTO_JOBS:
+    logger.info(f"Sizing the OCR jobs of each document from a budget of {CPU_BUDGET.total} cores")
+
+
+JOBS = str(CPU_BUDGET.total) if AUTO_JOBS else NUM_PROC
 # some PDF files might not be convertible to PDF/A
 # then we try again with --output-type pdf
 # for efficiency reasons, large files
 # should not be converted because it takes too long
 FAIL_SAFE_ARGS = ["--output-type", "pdf"]
 FORCE_ROTATE_ARGS = ["--rotate-pages-threshold", "9"]
-CMD_ARGS.extend(["-v", "2"])
 
 OCRMYPDF = "ocrmypdf"
+# loaded by path, the ocrmypdf command cannot import the app package
+CONFIDENCE_PLUGIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "confidence_plugin.py")
+
+
+def cmd_args() -> List[str]:
+    """Arguments of the ocrmypdf command, besides the input and output files."""
+    return [
+        "--skip-text",
+        "--rotate-pages",
+        "--language",
+        get_ocr_language(),
+        "--jobs",
+        JOBS,
+        "--tesseract-timeout",
+        "600",
+        *USER_WORDS,
+        "-v",
+        "2",
+    ]
+
+
+def ocr_settings() -> str:
+    """Settings that change the OCR output, used to identify cached results."""
+    args = cmd_args()
+    jobs = args.index("--jobs")
+    args = args[:jobs] + args[jobs + 2:]
+    return " ".join(args + FAIL_SAFE_ARGS + FORCE_ROTATE_ARGS)
+
+
+def with_jobs(args: List[str], jobs: Optional[int]) -> List[str]:
+    """Command line arguments with another number of jobs."""
+    if jobs is None:
+        return args
+    index = args.index("--jobs")
+    return args[:index + 1] + [str(jobs)] + args[index + 2:]
+
+
+@contextmanager
+def reserve_jobs(num_pages: int, wanted: Optional[int] = None) -> Iterator[Optional[int]]:
+    """Reserve the OCR jobs of a document from the CPU budget.
+
+    A document never gets more jobs than pages, nor more than its share of the
+    cores among the documents OCRed at the same time. Yields None, meaning
+    NUM_PROC jobs, if the number of jobs is static.
+    """
+    if not AUTO_JOBS:
+        yield None
+        return
+    with CPU_BUDGET.reserve(min(num_pages, wanted or CPU_BUDGET.total)) as jobs:
+        logger.debug(f"Using {jobs} OCR jobs for {num_pages} pages")
+        yield jobs
+
+
+def ocr_options(
+    force_rotate: bool, jobs: Optional[int] = None, confidence_dir: Optional[str] = None
+) -> Dict[str, Any]:
+    """Keyword arguments of `ocrmypdf.ocr` equivalent to the command line arguments."""
+    options = {
+        "skip_text": True,
+        "rotate_pages": True,
+        "language": [get_ocr_language()],
+        "jobs": jobs or int(JOBS),
+        "tesseract_timeout": 600,
+        "output_type": "pdf",
+        "progress_bar": False,
+        # pages are OCRed in threads of the engine process, which keeps the Tesseract handles
+        "use_threads": True,
+    }
+    if USER_WORDS:
+        options["user_words"] = WORD_LIST
+    if force_rotate:
+        options["rotate_pages_threshold"] = float(FORCE_ROTATE_ARGS[-1])
+    if confidence_dir:
+        options["confidence_dir"] = confidence_dir
+    return options
+
+
+ENGINE = None
+ENGINE_PID = None
+ENGINE_LOCK = threading.Lock()
+
+
+def get_engine() -> OcrEngine:
+    """Get the in-process OCR engine of this process, starting it if needed.
+
+    Processes forked after the engine started get an engine of their own.
+    """
+    global ENGINE, ENGINE_PID
+    with ENGINE_LOCK:
+        if ENGINE is None or ENGINE_PID != os.getpid():
+            ENGINE = make_engine()
+            ENGINE_PID = os.getpid()
+        return ENGINE
+
+
+def make_engine() -> OcrEngine:
+    """Start an in-process OCR engine with the configured plugins."""
+    plugins = []
+    if OCR_CONFIDENCE_QUALITY:
+        plugins.append("app.services.confidence_plugin")
+    if OCR_TESSEROCR:
+        if find_spec("tesserocr") is None:
+            logger.warning("tesserocr is not installed; the OCR engine uses the Tesseract command line.")
+        else:
+            # registered last, so its OCR engine is the one used
+            plugins.append("app.services.tesserocr_plugin")
+    engine = OcrEngine(OCR_ENGINE_WORKERS, plugins=plugins)
+    engine.start()
+    return engine
 
 
 def is_pdf_valid(input_file: str) -> bool:
@@ -86,33 +218,94 @@ def remove_encryption(pdf_file_path: str):
 
 
 def make_ocr_command(
-    in_file: str, pdf_output: str, pdf_a: bool = True, force_rotate: bool = False
+    in_file: str,
+    pdf_output: str,
+    pdf_a: bool = True,
+    force_rotate: bool = False,
+    num_pages: Optional[int] = None,
+    jobs: Optional[int] = None,
+    confidence_dir: Optional[str] = None,
 ) -> Tuple[str, bool]:
-    """Make the OCR command and check if we have a large number of pages."""
-    ocrmypdf_args = [OCRMYPDF, in_file, pdf_output, *CMD_ARGS]
-    large_page_count = count_pages(in_file) > MAX_PAGE_PDF_A
+    """Make the OCR command and check if we have a large number of pages.
+
+    :param confidence_dir: directory where the word confidences of the OCRed pages are written
+    """
+    args = with_jobs(cmd_args(), jobs)
+    ocrmypdf_args = [OCRMYPDF, in_file, pdf_output, *args]
+    if num_pages is None:
+        num_pages = count_pages(in_file)
+    large_page_count = num_pages > MAX_PAGE_PDF_A
     if pdf_a is False or large_page_count:
-        ocrmypdf_args = [OCRMYPDF, in_file, pdf_output, *FAIL_SAFE_ARGS, *CMD_ARGS]
+        ocrmypdf_args = [OCRMYPDF, in_file, pdf_output, *FAIL_SAFE_ARGS, *args]
     if force_rotate:
         ocrmypdf_args.extend(FORCE_ROTATE_ARGS)
+    if confidence_dir:
+        ocrmypdf_args.extend(["--plugin", CONFIDENCE_PLUGIN, "--confidence-dir", confidence_dir])
     logger.debug(" ".join(ocrmypdf_args))
     return ocrmypdf_args, large_page_count
 
 
-def run_ocr_natively(in_file: str, pdf_output: str, force_rotate: bool):
-    """Run OCR using the ocrmypdf library."""
-    ocrmypdf_args, _ = make_ocr_command(
-        in_file, pdf_output, pdf_a=False, force_rotate=force_rotate
-    )
-    status_code = run_ocrmypdf(ocrmypdf_args)
-    if status_code != 0:
-        raise Exception("Failed to do OCR.")
-
-
-def call_ocr(in_file: str, pdf_output: str, force_rotate: bool) -> Tuple[str, str]:
-    """Call OCR using the ocrmypdf subprocess."""
+def call_ocr(
+    in_file: str, pdf_output: str, force_rotate: bool, num_pages: Optional[int] = None
+) -> Tuple[str, str]:
+    """Call OCR using the ocrmypdf subprocess, sharding documents with many pages.
+
+    The number of jobs is reserved from the CPU budget for the whole call.
+
+    :param num_pages: number of pages of the input, if already known
+    """
+    if num_pages is None:
+        num_pages = count_pages(in_file)
+    with reserve_jobs(num_pages) as jobs:
+        if OCR_SHARD_THRESHOLD and num_pages > OCR_SHARD_THRESHOLD:
+            return call_ocr_sharded(in_file, pdf_output, force_rotate, num_pages, jobs=jobs)
+        return call_ocr_whole(in_file, pdf_output, force_rotate, num_pages=num_pages, jobs=jobs)
+
+
+def call_ocr_whole(
+    in_file: str,
+    pdf_output: str,
+    force_rotate: bool,
+    num_pages: Optional[int] = None,
+    jobs: Optional[int] = None,
+) -> Tuple[str, str]:
+    """Call OCR on the entire document using one ocrmypdf subprocess.
+
+    The word confidences of the OCRed pages are written next to the output, see `read_confidences`.
+
+    :param jobs: number of ocrmypdf jobs, defaults to NUM_PROC
+    """
+    if num_pages is None:
+        num_pages = count_pages(in_file)
+    confidence_context = nullcontext()
+    if OCR_CONFIDENCE_QUALITY:
+        confidence_context = tempfile.TemporaryDirectory(
+            dir=os.path.dirname(os.path.abspath(pdf_output)), prefix=".confidence_"
+        )
+    with confidence_context as confidence_dir:
+        if OCR_IN_PROCESS:
+            result = call_ocr_in_process(in_file, pdf_output, force_rotate, jobs=jobs, confidence_dir=confidence_dir)
+        else:
+            result = call_ocr_subprocess(
+                in_file, pdf_output, force_rotate, num_pages, jobs=jobs, confidence_dir=confidence_dir
+            )
+        if confidence_dir is not None:
+            write_confidences(pdf_output, read_page_confidences(confidence_dir, num_pages))
+    return result
+
+
+def call_ocr_subprocess(
+    in_file: str,
+    pdf_output: str,
+    force_rotate: bool,
+    num_pages: int,
+    jobs: Optional[int] = None,
+    confidence_dir: Optional[str] = None,
+) -> Tuple[str, str]:
+    """Call OCR on the entire document in a new ocrmypdf process."""
     ocrmypdf_args, _ = make_ocr_command(
-        in_file, pdf_output, pdf_a=False, force_rotate=force_rotate
+        in_file, pdf_output, pdf_a=False, force_rotate=force_rotate, num_pages=num_pages, jobs=jobs,
+        confidence_dir=confidence_dir,
     )
     proc = run(ocrmypdf_args, capture_output=True, encoding="utf-8")
     if proc.returncode != 0:
@@ -125,6 +318,155 @@ def call_ocr(in_file: str, pdf_output: str, force_rotate: bool) -> Tuple[str, st
     return proc.stdout, proc.stderr
 
 
+def call_ocr_in_process(
+    in_file: str,
+    pdf_output: str,
+    force_rotate: bool,
+    jobs: Optional[int] = None,
+    confidence_dir: Optional[str] = None,
+) -> Tuple[str, str]:
+    """Call OCR on the entire document in the warm OCR engine, failing like `call_ocr_subprocess`."""
+    try:
+        options = ocr_options(force_rotate, jobs=jobs, confidence_dir=confidence_dir)
+        exit_code = get_engine().run(in_file, pdf_output, **options)
+    except Exception as e:
+        logger.exception(f"OCR of {in_file} failed.")
+        # the generated PDF might still be usable, as with the command line
+        if not os.path.exists(pdf_output) or not is_pdf_valid(pdf_output):
+            raise Exception(str(e)) from e
+        return "", str(e)
+    if exit_code != 0:
+        logger.error(f"OCR of {in_file} exited with code {exit_code}.")
+        if not os.path.exists(pdf_output) or not is_pdf_valid(pdf_output):
+            raise Exception(f"OCR of {in_file} exited with code {exit_code}.")
+    return "", ""
+
+
+def call_ocr_sharded(
+    in_file: str, pdf_output: str, force_rotate: bool, num_pages: int, jobs: Optional[int] = None
+) -> Tuple[str, str]:
+    """Split the document into shards of pages, OCR them in parallel and merge the results.
+
+    :param jobs: total number of ocrmypdf jobs shared by the shards, defaults to NUM_PROC
+    """
+    if jobs is None:
+        jobs = int(JOBS)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(pdf_output)), prefix=".shards_") as shard_dir:
+        shards = split_pdf(in_file, shard_dir, OCR_SHARD_SIZE)
+        shard_outputs = [shard.replace(".pdf", "_ocr.pdf") for shard in shards]
+        shard_pages = [min(OCR_SHARD_SIZE, num_pages - index * OCR_SHARD_SIZE) for index in range(len(shards))]
+        concurrency = min(OCR_SHARD_WORKERS, len(shards), jobs)
+        shard_jobs = max(1, jobs // concurrency)
+        logger.info(
+            f"Split {in_file} of {num_pages} pages into {len(shards)} shards"
+            f" for {concurrency} parallel OCR processes"
+        )
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(
+                lambda paths: call_ocr_whole(paths[0], paths[1], force_rotate, num_pages=paths[2], jobs=shard_jobs),
+                zip(shards, shard_outputs, shard_pages),
+            ))
+        merged_pages = merge_pdfs(shard_outputs, pdf_output)
+        shard_confidences = [read_confidences(shard_output) for shard_output in shard_outputs]
+    if merged_pages != num_pages or not is_pdf_valid(pdf_output):
+        raise Exception(f"Merging the OCR shards of {in_file} produced an invalid PDF.")
+    if all(confidences is not None for confidences in shard_confidences):
+        write_confidences(pdf_output, [page for confidences in shard_confidences for page in confidences])
+    stdout = "\n".join(result[0] for result in results)
+    stderr = "\n".join(result[1] for result in results)
+    return stdout, stderr
+
+
+def call_ocr_on_pages(in_file: str, pages: List[int], pdf_output: str, force_rotate: bool) -> Tuple[str, str]:
+    """Call OCR only on some pages of a document; the output has just those pages, in the same order."""
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(pdf_output)), prefix=".pages_") as tmp_dir:
+        subset = os.path.join(tmp_dir, "pages.pdf")
+        extract_pages(in_file, pages, subset)
+        return call_ocr(subset, pdf_output, force_rotate=force_rotate, num_pages=len(pages))
+
+
+def call_ocr_on_some_pages(
+    in_file: str, pdf_output: str, pages: List[int], force_rotate: bool, num_pages: Optional[int] = None
+) -> Tuple[str, str]:
+    """Call OCR only on some pages of a document and keep the other pages as they are.
+
+    :param num_pages: number of pages of the input, if already known
+    """
+    if num_pages is None:
+        num_pages = count_pages(in_file)
+    if len(pages) == num_pages:
+        return call_ocr(in_file, pdf_output, force_rotate=force_rotate, num_pages=num_pages)
+    shutil.copyfile(in_file, pdf_output)
+    if OCR_CONFIDENCE_QUALITY:
+        write_confidences(pdf_output, [None] * num_pages)
+    if not pages:
+        logger.info(f"No page of {in_file} needs OCR, skipping ocrmypdf")
+        return "", ""
+    logger.info(f"Doing OCR on {len(pages)} of the {num_pages} pages of {in_file}")
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(pdf_output)), prefix=".pages_") as tmp_dir:
+        pages_output = os.path.join(tmp_dir, "pages_ocr.pdf")
+        result = call_ocr_on_pages(in_file, pages, pages_output, force_rotate=force_rotate)
+        splice_pages(pdf_output, pages_output, {page: index for index, page in enumerate(pages)})
+    return result
+
+
+def splice_pages(pdf_output: str, source: str, replacements: Dict[int, int]) -> None:
+    """Replace pages of the OCR output with pages OCRed again, along with their word confidences.
+
+    The pages are spliced into a temporary file replacing the OCR output once
+    valid, so a crash never leaves a partly written output behind.
+    """
+    spliced = make_derived_file_name(pdf_output, new_suffix="spliced", new_extension="pdf")
+    try:
+        replace_pages(pdf_output, source, replacements, output=spliced)
+        if not is_pdf_valid(spliced):
+            raise Exception(f"Replacing pages of {pdf_output} produced an invalid PDF.")
+        confidences = read_confidences(pdf_output)
+        if confidences is not None:
+            source_confidences = read_confidences(source)
+            for page, index in replacements.items():
+                confidences[page] = source_confidences[index] if source_confidences is not None else None
+            write_confidences(spliced, confidences)
+        os.replace(spliced, pdf_output)
+        if confidences is not None:
+            os.replace(confidence_file(spliced), confidence_file(pdf_output))
+    finally:
+        if os.path.exists(spliced):
+            os.remove(spliced)
+        remove_confidences(spliced)
+
+
+def confidence_file(pdf_file: str) -> str:
+    """File of the word confidences of the pages of an OCR output."""
+    return make_derived_file_name(pdf_file, new_suffix="confidence", new_extension="json")
+
+
+def write_confidences(pdf_file: str, confidences: List[Optional[Dict[str, Any]]]) -> None:
+    """Write the word confidences of the pages of an OCR output."""
+    with open(confidence_file(pdf_file), "w", encoding="utf-8") as fout:
+        json.dump(confidences, fout)
+
+
+def read_confidences(pdf_file: str) -> Optional[List[Optional[Dict[str, Any]]]]:
+    """Word confidences of the pages of an OCR output, None for the pages that were not OCRed.
+
+    :return: one summary per page, or None if the confidences were not recorded
+    """
+    try:
+        with open(confidence_file(pdf_file), encoding="utf-8") as fin:
+            return json.load(fin)
+    except FileNotFoundError:
+        return None
+
+
+def remove_confidences(pdf_file: str) -> None:
+    """Remove the word confidences of an OCR output."""
+    try:
+        os.remove(confidence_file(pdf_file))
+    except FileNotFoundError:
+        pass
+
+
 def get_ocrized_text(pdf_file: str) -> str:
     """Get the OCRized text from a PDF file."""
     text = ""
@@ -134,15 +476,28 @@ def get_ocrized_text(pdf_file: str) -> str:
     return text
 
 
-def get_ocrized_text_from_blocks(pdf_file: str) -> str:
-    """Get the OCRized text from a PDF file in a clean format using blocks."""
-    text = ""
+def iter_page_texts_from_blocks(pdf_file: str, timings: Optional[Timings] = None) -> Iterator[str]:
+    """Yield the OCRized text of each page of a PDF file using blocks, one page at a time."""
     with fitz.open(pdf_file) as pdf_f:
         for page in pdf_f.pages():
-            blocks = page.get_text(option="blocks", flags=fitz.TEXTFLAGS_SEARCH)
-            text += "\n".join([block[4].replace("\n", " ") for block in blocks]) + "\n"
-    text = Cleaner().clean(text)
-    return text
+            with measure(timings, "text_extraction"):
+                blocks = page.get_text(option="blocks", flags=fitz.TEXTFLAGS_SEARCH)
+                text = "\n".join([block[4].replace("\n", " ") for block in blocks]) + "\n"
+            yield text
+
+
+def iter_clean_pages(pdf_file: str, timings: Optional[Timings] = None) -> Iterator[str]:
+    """Yield the clean OCRized text of each page of a PDF file, one page at a time.
+
+    Joined, the pages are the text of `get_ocrized_text_from_blocks`.
+    """
+    pages = Cleaner().clean_pages(iter_page_texts_from_blocks(pdf_file, timings=timings))
+    yield from timed(pages, timings, "cleaning", exclude="text_extraction")
+
+
+def get_ocrized_text_from_blocks(pdf_file: str, timings: Optional[Timings] = None) -> str:
+    """Get the OCRized text from a PDF file in a clean format using blocks."""
+    return "".join(iter_clean_pages(pdf_file, timings=timings))
 
 
 def dump_text(text: str, txt_output_file: str):
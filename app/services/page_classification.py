@@ -0,0 +1,69 @@
+import logging
+import random
+from collections import Counter
+from typing import Dict, List
+
+import fitz
+
+from app.constants import PageKind
+
+logger = logging.getLogger(__name__)
+
+
+def classify_page(page: fitz.Page) -> str:
+    """Classify a page by its text layer and its content.
+
+    Like `ocrmypdf --skip-text`, a page with any text is not OCRed, so only
+    pages without text that show images or drawings need OCR.
+    """
+    has_text = bool(page.get_text("text", flags=fitz.TEXTFLAGS_SEARCH).strip())
+    has_images = bool(page.get_image_info())
+    if has_text:
+        return PageKind.MIXED if has_images else PageKind.TEXT
+    if has_images or page.get_drawings():
+        return PageKind.IMAGE
+    return PageKind.EMPTY
+
+
+def classify_pages(pdf_file: str) -> List[str]:
+    """Classify each page of a PDF file as text, image, mixed or empty."""
+    with fitz.open(pdf_file) as pdf:
+        return [classify_page(page) for page in pdf]
+
+
+def count_kinds(kinds: List[str]) -> Dict[str, int]:
+    """Number of pages of each kind, reported in the statistics."""
+    counts = Counter(kinds)
+    return {kind: counts.get(kind, 0) for kind in (PageKind.TEXT, PageKind.IMAGE, PageKind.MIXED, PageKind.EMPTY)}
+
+
+def pages_to_ocr(kinds: List[str]) -> List[int]:
+    """0-based numbers of the pages that need OCR."""
+    return [page for page, kind in enumerate(kinds) if PageKind.needs_ocr(kind)]
+
+
+def sample_pages(pages: List[int], count: int) -> List[int]:
+    """Sample of the pages: the first, the last and random ones, in page order.
+
+    The sample of a list of pages is always the same, so a document probed
+    again makes the same decisions.
+    """
+    if len(pages) <= count:
+        return list(pages)
+    sample = {pages[0], pages[-1]}
+    middle = pages[1:-1]
+    sample.update(random.Random(len(pages)).sample(middle, max(0, min(len(middle), count - len(sample)))))
+    return sorted(sample)
+
+
+def stratified_sample(pages: List[int], count: int) -> List[int]:
+    """One random page of each of `count` runs of consecutive pages, in page order.
+
+    Every part of the document is represented, unlike in a simple random
+    sample. The sample of a list of pages is always the same.
+    """
+    if len(pages) <= count:
+        return list(pages)
+    rng = random.Random(len(pages))
+    bounds = [len(pages) * stratum // count for stratum in range(count + 1)]
+    return [pages[rng.randrange(start, end)] for start, end in zip(bounds, bounds[1:])]
@@ -0,0 +1,79 @@
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.services.text_processing import Cleaner
+
+logger = logging.getLogger(__name__)
+
+
+def chunks(pages: Iterable[str], size: int) -> Iterator[List[str]]:
+    """Consecutive lists of `size` pages."""
+    iterator = iter(pages)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def process_chunk(pages: List[str], estimator: Optional[Any],
+                  report: Optional[Callable[[], Any]] = None) -> Tuple[List[str], Dict[str, Any], Any]:
+    """Clean the pages of a chunk and add them to an empty quality estimator, if any, in a worker process.
+
+    :param report: called after the chunk, e.g. to report the metrics of the worker process
+    :return: the clean pages, the cleaning stats and the estimator of the chunk
+    """
+    cleaner = Cleaner()
+    clean_pages = list(cleaner.clean_pages(pages, log_stats=False))
+    if estimator is not None:
+        for page in clean_pages:
+            estimator.add_page(page)
+    if report is not None:
+        report()
+    return clean_pages, cleaner.stats, estimator
+
+
+def clean_and_estimate(pages: Iterable[str], estimator: Optional[Any], workers: int, chunk_pages: int,
+                       report: Optional[Callable[[], Any]] = None) -> Iterator[str]:
+    """Clean the pages and add them to the quality estimator in parallel processes, `chunk_pages` at a time.
+
+    The clean pages are yielded in order, and the estimator and the cleaning
+    stats end up as if the pages were processed one by one. At most two chunks
+    per worker are in flight, so the pages are still streamed.
+
+    :param pages: raw text of each page
+    :param estimator: `QualityEstimator` the pages are added to, None to only clean them
+    :param workers: number of worker processes
+    :param chunk_pages: number of pages of a chunk
+    :param report: called in the worker process after each chunk
+    """
+    cleaner = Cleaner()
+    stats = None
+
+    def merge(future: Future) -> List[str]:
+        nonlocal stats
+        clean_pages, chunk_stats, chunk_estimator = future.result()
+        stats = chunk_stats if stats is None else cleaner.add_stats(stats, chunk_stats)
+        if estimator is not None:
+            estimator.merge(chunk_estimator)
+        return clean_pages
+
+    context = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        pending = deque()
+        first_page = 0
+        for chunk in chunks(pages, chunk_pages):
+            chunk_estimator = None
+            if estimator is not None:
+                confidences = None
+                if estimator.confidences is not None:
+                    confidences = estimator.confidences[first_page:first_page + len(chunk)]
+                chunk_estimator = type(estimator)(confidences)
+            pending.append(executor.submit(process_chunk, chunk, chunk_estimator, report))
+            first_page += len(chunk)
+            while len(pending) >= 2 * workers or (pending and pending[0].done()):
+                yield from merge(pending.popleft())
+        while pending:
+            yield from merge(pending.popleft())
+    logger.info(f"Cleaning stats {stats}")
@@ -0,0 +1,69 @@
+import logging
+import os
+from typing import List, Optional
+
+import fitz
+import pikepdf
+
+from app.constants import PageKind
+from app.services.page_classification import classify_page
+
+logger = logging.getLogger(__name__)
+
+
+class PdfProbe:
+    """Facts about an input PDF file, gathered once and passed along with the document.
+
+    The file is opened once by pikepdf, to check that its structure is valid,
+    and once by PyMuPDF, for the page count, the encryption and signature
+    state and the kind of each page.
+    """
+
+    def __init__(self, path: str, classify: bool = False, max_pages: Optional[int] = None) -> None:
+        """Probe a PDF file.
+
+        :param path: PDF file
+        :param classify: classify the pages by their text layer, defaults to False
+        :param max_pages: do not classify documents with more pages, defaults to None
+        """
+        self.path = path
+        self.file_size = os.path.getsize(path)
+        self.valid = False
+        self.num_pages = 0
+        self.encrypted = False
+        self.signed = False
+        self.page_kinds: Optional[List[str]] = None
+        try:
+            with pikepdf.open(path) as _:
+                self.valid = True
+        except pikepdf.PdfError:
+            logger.exception(f"Invalid PDF: {path}")
+            return
+        with fitz.open(path) as doc:
+            self.num_pages = doc.page_count
+            self.encrypted = bool(
+                doc.needs_pass
+                or doc.metadata is None
+                or doc.is_encrypted
+                or doc.metadata.get("encryption", "")
+            )
+            self.signed = doc.get_sigflags() > 0
+            if classify and not self.encrypted and (max_pages is None or self.num_pages <= max_pages):
+                self.page_kinds = [classify_page(page) for page in doc]
+
+    @property
+    def text_coverage(self) -> Optional[float]:
+        """Fraction of the pages that have a text layer, None if the pages were not classified."""
+        if self.page_kinds is None:
+            return None
+        if not self.page_kinds:
+            return 0.0
+        with_text = [kind for kind in self.page_kinds if kind in {PageKind.TEXT, PageKind.MIXED}]
+        return len(with_text) / len(self.page_kinds)
+
+    def __repr__(self) -> str:
+        return (
+            f"PdfProbe({self.path!r}, valid={self.valid}, num_pages={self.num_pages},"
+            f" encrypted={self.encrypted}, signed={self.signed}, file_size={self.file_size},"
+            f" text_coverage={self.text_coverage})"
+        )
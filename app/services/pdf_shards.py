@@ -0,0 +1,70 @@
+import logging
+import os
+from contextlib import ExitStack
+from typing import Dict, List, Optional
+
+import pikepdf
+
+logger = logging.getLogger(__name__)
+
+
+def split_pdf(in_file: str, shard_dir: str, shard_size: int) -> List[str]:
+    """Split a PDF file into shards of consecutive pages.
+
+    :param in_file: input PDF file
+    :param shard_dir: directory of the shards
+    :param shard_size: maximum number of pages of a shard
+    :return: paths of the shards, in page order
+    """
+    shards = []
+    with pikepdf.open(in_file) as pdf:
+        for start in range(0, len(pdf.pages), shard_size):
+            shard_path = os.path.join(shard_dir, f"shard_{start:06d}.pdf")
+            with pikepdf.new() as shard:
+                shard.pages.extend(pdf.pages[start:start + shard_size])
+                shard.save(shard_path)
+            shards.append(shard_path)
+    logger.debug(f"Split {in_file} into {len(shards)} shards of {shard_size} pages")
+    return shards
+
+
+def merge_pdfs(shards: List[str], pdf_output: str) -> int:
+    """Concatenate PDF files, keeping the text layer of their pages.
+
+    :param shards: PDF files in page order
+    :param pdf_output: merged PDF file
+    :return: number of pages of the merged file
+    """
+    with ExitStack() as stack, pikepdf.new() as merged:
+        # pages are copied lazily, so the shards stay open until the merged file is saved
+        for shard_path in shards:
+            shard = stack.enter_context(pikepdf.open(shard_path))
+            merged.pages.extend(shard.pages)
+        merged.save(pdf_output)
+        return len(merged.pages)
+
+
+def extract_pages(in_file: str, pages: List[int], pdf_output: str) -> None:
+    """Write the given pages of a PDF file to a new file.
+
+    :param in_file: input PDF file
+    :param pages: 0-based page numbers, in the order of the output
+    :param pdf_output: output PDF file
+    """
+    with pikepdf.open(in_file) as pdf, pikepdf.new() as subset:
+        subset.pages.extend(pdf.pages[page] for page in pages)
+        subset.save(pdf_output)
+
+
+def replace_pages(pdf_file: str, source: str, replacements: Dict[int, int], output: Optional[str] = None) -> None:
+    """Replace pages of a PDF file with pages of another one.
+
+    :param pdf_file: PDF file to modify
+    :param source: PDF file with the new pages
+    :param replacements: maps 0-based page numbers of `pdf_file` to the ones of `source`
+    :param output: PDF file written with the replaced pages, `pdf_file` itself by default
+    """
+    with pikepdf.open(pdf_file, allow_overwriting_input=output is None) as pdf, pikepdf.open(source) as new_pages:
+        for page, new_page in replacements.items():
+            pdf.pages[page] = new_pages.pages[new_page]
+        pdf.save(output or pdf_file)
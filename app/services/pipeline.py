@@ -0,0 +1,166 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# sentinel used to stop the workers of a stage
+_STOP = object()
+
+
+class Stage:
+    """A processing step of the pipeline run by one or more threads."""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Any], Any],
+        workers: int = 1,
+        queue_size: int = 1,
+    ) -> None:
+        """Initialize the stage.
+
+        :param name: name of the stage used in logs and statistics
+        :param func: function applied on each item, returns the item for the next stage
+        :param workers: number of threads running the stage
+        :param queue_size: maximum number of items waiting for the stage
+        """
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self.blocked_time = 0.0
+        self.lock = threading.Lock()
+
+    def stats(self) -> Dict[str, Any]:
+        """Statistics of the stage."""
+        return {
+            "queued": self.queue.qsize(),
+            "busy": self.busy,
+            "workers": self.workers,
+            "processed": self.processed,
+            "failed": self.failed,
+            "blocked_time": round(self.blocked_time, 3),
+        }
+
+
+class Pipeline:
+    """Chain of stages connected by bounded queues.
+
+    Each stage works on a different item, so while document N is in a later
+    stage, document N+1 can already be in an earlier one. A full queue blocks
+    the stage feeding it, which propagates backpressure up to the producer.
+    """
+
+    def __init__(
+        self,
+        stages: List[Stage],
+        on_error: Optional[Callable[[Any, Exception], Any]] = None,
+        blocked_log_interval: float = 5.0,
+    ) -> None:
+        """Initialize the pipeline.
+
+        :param stages: ordered list of stages
+        :param on_error: called with the item and the error when a stage fails
+        :param blocked_log_interval: seconds a stage waits on a full queue before logging it
+        """
+        self.stages = stages
+        self.on_error = on_error
+        self.blocked_log_interval = blocked_log_interval
+        self.threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        """Start the threads of all stages."""
+        for index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._run_stage,
+                    args=(index,),
+                    name=f"{stage.name}-{worker}",
+                    daemon=True,
+                )
+                thread.start()
+                self.threads.append(thread)
+        logger.info(
+            f"Started pipeline {[(stage.name, stage.workers) for stage in self.stages]}"
+        )
+
+    def stop(self) -> None:
+        """Wait for all items to go through the pipeline and stop the threads."""
+        for stage in self.stages:
+            for _ in range(stage.workers):
+                self._put(stage, _STOP, "producer")
+            for thread in self.threads:
+                if thread.name.startswith(f"{stage.name}-"):
+                    thread.join()
+
+    def submit(self, item: Any) -> None:
+        """Feed an item to the first stage, blocks while the stage is full."""
+        self._put(self.stages[0], item, "producer")
+
+    def wait_for_capacity(self) -> None:
+        """Block until the first stage can accept a new item."""
+        stage = self.stages[0]
+        start_time = time.time()
+        while stage.queue.full():
+            time.sleep(0.1)
+        self._log_blocked(stage, "producer", time.time() - start_time)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Statistics of all stages."""
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def _put(self, stage: Stage, item: Any, source: str) -> None:
+        """Put an item in the queue of a stage, logging if it has to wait."""
+        start_time = time.time()
+        while True:
+            try:
+                stage.queue.put(item, timeout=self.blocked_log_interval)
+                break
+            except queue.Full:
+                logger.info(
+                    f"Backpressure: '{source}' waiting for '{stage.name}' for"
+                    f" {round(time.time() - start_time, 1)} seconds {self.stats()}"
+                )
+        self._log_blocked(stage, source, time.time() - start_time)
+
+    def _log_blocked(self, stage: Stage, source: str, blocked_time: float) -> None:
+        """Account the time spent waiting for a stage."""
+        with stage.lock:
+            stage.blocked_time += blocked_time
+        if blocked_time >= self.blocked_log_interval:
+            logger.info(
+                f"Backpressure: '{source}' waited {round(blocked_time, 1)} seconds for '{stage.name}'."
+            )
+
+    def _run_stage(self, index: int) -> None:
+        """Loop of a stage thread."""
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                break
+            with stage.lock:
+                stage.busy += 1
+            try:
+                result = stage.func(item)
+            except Exception as e:
+                with stage.lock:
+                    stage.failed += 1
+                logger.exception(f"Stage '{stage.name}' failed.")
+                if self.on_error is not None:
+                    self.on_error(item, e)
+                continue
+            finally:
+                with stage.lock:
+                    stage.busy -= 1
+            with stage.lock:
+                stage.processed += 1
+            if next_stage is not None:
+                self._put(next_stage, result, stage.name)
@@ -0,0 +1,77 @@
+import logging
+import random
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class Backoff:
+    """Exponential backoff with jitter, reset when there is work to do."""
+
+    def __init__(
+        self,
+        min_delay: float,
+        max_delay: float,
+        factor: float = 2.0,
+        jitter: float = 0.1,
+    ) -> None:
+        """Initialize the backoff.
+
+        :param min_delay: first delay in seconds
+        :param max_delay: maximum delay in seconds
+        :param factor: multiplier applied to the delay after each idle poll
+        :param jitter: fraction of the delay randomly added or subtracted
+        """
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.delay = min_delay
+
+    def reset(self) -> None:
+        """Go back to the minimum delay."""
+        self.delay = self.min_delay
+
+    def next_delay(self) -> float:
+        """Get the delay to wait now and increase the following one."""
+        delay = self.delay
+        self.delay = min(self.delay * self.factor, self.max_delay)
+        return max(0.0, delay * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def sleep(self) -> float:
+        """Sleep for the next delay."""
+        delay = self.next_delay()
+        time.sleep(delay)
+        return delay
+
+
+class DocumentPoller:
+    """Claims documents from the API, several at a time if the API allows it.
+
+    Claimed documents are kept in a local prefetch queue and handed out one by one.
+    """
+
+    def __init__(self, fetch: Callable[[int], List[Dict[str, Any]]], batch_size: int = 1) -> None:
+        """Initialize the poller.
+
+        :param fetch: function claiming up to a number of documents from the API
+        :param batch_size: number of documents to claim in one request
+        """
+        self.fetch = fetch
+        self.batch_size = batch_size
+        self.prefetched: Deque[Dict[str, Any]] = deque()
+
+    def queue_depth(self) -> int:
+        """Number of documents claimed but not handed out yet."""
+        return len(self.prefetched)
+
+    def next_document(self) -> Dict[str, Any]:
+        """Get the next document, claiming a new batch when the queue is empty."""
+        if not self.prefetched:
+            documents = self.fetch(self.batch_size)
+            if len(documents) > 1:
+                logger.info(f"Claimed {len(documents)} documents in one request.")
+            self.prefetched.extend(documents)
+        return self.prefetched.popleft()
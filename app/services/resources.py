@@ -0,0 +1,68 @@
+"""Registry of the models and data files loaded on first use.
+
+Importing the services loads nothing; each resource is loaded the first time
+it is needed, or by `warm_up`. The worker warms up its resources before it
+forks, so its processes share them, and reports how long each one took.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceRegistry:
+    """Named resources, each one loaded once, on first use or when warming up."""
+
+    def __init__(self) -> None:
+        self.loaders: Dict[str, Callable[[], Any]] = {}
+        self.resources: Dict[str, Any] = {}
+        self.load_seconds: Dict[str, float] = {}
+        # reentrant, loaders get the resources they depend on
+        self.lock = threading.RLock()
+
+    def register(self, name: str, loader: Callable[[], Any]) -> None:
+        """Register the function loading a resource."""
+        self.loaders[name] = loader
+
+    def get(self, name: str) -> Any:
+        """Get a resource, loading it if needed."""
+        try:
+            return self.resources[name]
+        except KeyError:
+            pass
+        with self.lock:
+            if name not in self.resources:
+                start = time.perf_counter()
+                resource = self.loaders[name]()
+                self.load_seconds[name] = round(time.perf_counter() - start, 3)
+                self.resources[name] = resource
+                logger.info(f"Loaded {name} in {self.load_seconds[name]} seconds")
+        return self.resources[name]
+
+    def is_loaded(self, name: str) -> bool:
+        """Whether a resource is already loaded."""
+        return name in self.resources
+
+    def warm_up(self, names: Optional[Iterable[str]] = None) -> Dict[str, float]:
+        """Load resources, all the registered ones by default, in the order they were registered.
+
+        :return: load time in seconds of every loaded resource
+        """
+        for name in list(self.loaders) if names is None else names:
+            self.get(name)
+        return self.report()
+
+    def report(self) -> Dict[str, float]:
+        """Load time in seconds of every loaded resource, including the resources it uses if they were not loaded."""
+        return dict(self.load_seconds)
+
+
+RESOURCES = ResourceRegistry()
+
+
+def register(name: str, loader: Callable[[], Any]) -> Callable[[], Any]:
+    """Register a resource of the global registry; returns the function getting it."""
+    RESOURCES.register(name, loader)
+    return lambda: RESOURCES.get(name)
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.config import APP_VERSION, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_PATH
+from app.utils.file_util import read_text_file
+
+logger = logging.getLogger(__name__)
+
+OCR_PDF = "ocr.pdf"
+TEXT = "text.txt"
+OCR_META = "ocr.json"
+HIGHLIGHT_PDF = "highlight.pdf"
+HIGHLIGHT_META = "highlight.json"
+
+
+def file_hash(path: str, chunk_size: int = 1024 * 1024) -> str:
+    """SHA-256 of the content of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fin:
+        while chunk := fin.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def make_key(*parts: str) -> str:
+    """Combine several strings into a cache key."""
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def dir_size(path: str) -> int:
+    """Total size of the files in a directory tree."""
+    size = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                size += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return size
+
+
+class ResultCache:
+    """On-disk cache of OCR and highlighting results, keyed by the input file content.
+
+    Every entry is a directory named after the key of the OCR result, with one
+    sub-directory per keywords hash for the highlighting results. Entries are
+    written to a temporary directory and renamed, so concurrent workers sharing
+    the cache never see partial entries. The least recently used entries are
+    evicted when the cache grows over its size limit.
+    """
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        """Initialize the cache.
+
+        :param path: directory of the cache
+        :param max_bytes: maximum size of the cache
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(self.path, exist_ok=True)
+
+    def ocr_key(self, input_file: str, ocr_settings: str) -> str:
+        """Key of the OCR result of a file with the given settings."""
+        return make_key(file_hash(input_file), APP_VERSION, ocr_settings)
+
+    def _entry(self, key: str, kwds_hash: Optional[str] = None) -> str:
+        """Directory of an entry."""
+        entry = os.path.join(self.path, key)
+        if kwds_hash is not None:
+            entry = os.path.join(entry, "highlight_" + make_key(kwds_hash))
+        return entry
+
+    def _touch(self, key: str) -> None:
+        """Mark an entry as recently used."""
+        try:
+            os.utime(self._entry(key))
+        except FileNotFoundError:
+            pass
+
+    def _store(self, entry: str, files: Dict[str, str], meta_name: str, meta: Dict[str, Any]) -> None:
+        """Atomically write the files and the metadata of an entry."""
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(entry), prefix=".tmp_")
+        try:
+            for name, source in files.items():
+                shutil.copyfile(source, os.path.join(tmp_dir, name))
+            with open(os.path.join(tmp_dir, meta_name), "w", encoding="utf-8") as fout:
+                json.dump(meta, fout)
+            os.rename(tmp_dir, entry)
+        except OSError:
+            # another worker stored the same entry in the meantime
+            logger.debug(f"Could not store cache entry {entry}", exc_info=True)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def get_ocr(self, key: str, ocr_output: str) -> Optional[Tuple[str, float]]:
+        """Copy the cached OCR output and return the cached text and quality."""
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, OCR_META), encoding="utf-8") as fin:
+                meta = json.load(fin)
+            text = read_text_file(os.path.join(entry, TEXT))
+            shutil.copyfile(os.path.join(entry, OCR_PDF), ocr_output)
+        except (FileNotFoundError, ValueError):
+            return None
+        self._touch(key)
+        return text, meta["quality"]
+
+    def put_ocr(self, key: str, ocr_output: str, text: str, quality: float) -> None:
+        """Store the OCR output with its text and quality."""
+        entry = self._entry(key)
+        if os.path.exists(entry):
+            return
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", suffix=".txt", delete=False) as fout:
+            fout.write(text)
+        try:
+            self._store(entry, {OCR_PDF: ocr_output, TEXT: fout.name}, OCR_META, {"quality": quality})
+        finally:
+            os.remove(fout.name)
+        self.evict()
+
+    def get_highlight(self, key: str, kwds_hash: str, anl_output: str) -> Optional[Tuple[List, Dict]]:
+        """Copy the cached highlighted PDF and return the cached metadata and statistics."""
+        entry = self._entry(key, kwds_hash)
+        try:
+            with open(os.path.join(entry, HIGHLIGHT_META), encoding="utf-8") as fin:
+                meta = json.load(fin)
+            shutil.copyfile(os.path.join(entry, HIGHLIGHT_PDF), anl_output)
+        except (FileNotFoundError, ValueError):
+            return None
+        self._touch(key)
+        return meta["highlight_metadata"], meta["statistics"]
+
+    def put_highlight(self, key: str, kwds_hash: str, anl_output: str,
+                      highlight_meta: List, statistics: Dict) -> None:
+        """Store the highlighted PDF with its metadata and statistics."""
+        entry = self._entry(key, kwds_hash)
+        if not os.path.exists(self._entry(key)) or os.path.exists(entry):
+            return
+        meta = {"highlight_metadata": highlight_meta, "statistics": statistics}
+        self._store(entry, {HIGHLIGHT_PDF: anl_output}, HIGHLIGHT_META, meta)
+        self.evict()
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the cache fits its size limit."""
+        entries = []
+        for name in os.listdir(self.path):
+            entry = os.path.join(self.path, name)
+            if name.startswith(".tmp_") or not os.path.isdir(entry):
+                continue
+            try:
+                entries.append((os.path.getmtime(entry), dir_size(entry), entry))
+            except FileNotFoundError:
+                pass
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            logger.info(f"Evicting cache entry {entry} of {size} bytes")
+            shutil.rmtree(entry, ignore_errors=True)
+            total_size -= size
+
+
+CACHE = None
+
+
+def get_cache() -> Optional[ResultCache]:
+    """Get the result cache, None if it is disabled."""
+    global CACHE
+    if CACHE is None and RESULT_CACHE_PATH:
+        CACHE = ResultCache(RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES)
+    return CACHE
@@ -0,0 +1,53 @@
+import math
+from typing import List, Optional
+
+# normal quantile of a two-sided 95% confidence interval
+Z_95 = 1.96
+
+
+class RatioEstimate:
+    """Ratio of two totals over the units of a population, estimated from a sample of the units.
+
+    E.g. the correct words over the checked words of the pages of a document.
+    The variance is the usual linearized variance of a ratio estimator from a
+    simple random sample without replacement, with the finite population
+    correction, so a sample of the whole population has no variance.
+    """
+
+    def __init__(self, population: int) -> None:
+        """Initialize the estimate.
+
+        :param population: number of units of the population
+        """
+        self.population = population
+        self.ys: List[float] = []
+        self.xs: List[float] = []
+
+    def add(self, y: float, x: float) -> None:
+        """Add the numerator and denominator of a sampled unit."""
+        self.ys.append(y)
+        self.xs.append(x)
+
+    @property
+    def ratio(self) -> Optional[float]:
+        """Estimated ratio, None if the denominators of the sample are all 0."""
+        total = sum(self.xs)
+        return sum(self.ys) / total if total else None
+
+    def covariance(self, other: "RatioEstimate") -> float:
+        """Covariance with the estimate of another ratio over the same sample, infinite if unknown."""
+        n = len(self.xs)
+        if n >= self.population:
+            return 0.0
+        if n < 2 or self.ratio is None or other.ratio is None:
+            return math.inf
+        residuals = [y - self.ratio * x for y, x in zip(self.ys, self.xs)]
+        other_residuals = [y - other.ratio * x for y, x in zip(other.ys, other.xs)]
+        mean_x, other_mean_x = sum(self.xs) / n, sum(other.xs) / n
+        sum_products = sum(e * f for e, f in zip(residuals, other_residuals))
+        return (1 - n / self.population) / n * sum_products / (n - 1) / (mean_x * other_mean_x)
+
+    @property
+    def variance(self) -> float:
+        """Variance of the estimated ratio, infinite if unknown."""
+        return self.covariance(self)
@@ -1,26 +1,35 @@
 import logging
 
-import pytextrank  # noqa: F401
-
 # from app.services.doc_analysis import NLP
-from spacy.lang.ro import Romanian
+from spacy.language import Language
 
 from app.config import SUMMARIZATION_METHOD, SUMMARY_PHRASES, SUMMARY_SENTENCES
+from app.services import resources
 
 MAX_LEN = 2**18
-SNLP = Romanian()
-SNLP.add_pipe("sentencizer")
-SNLP.max_length = MAX_LEN  # to avoid memory issues
 logger = logging.getLogger(__name__)
 
 
+def load_summarization_pipeline() -> Language:
+    """Romanian sentence splitting and PyTextRank pipeline."""
+    import pytextrank  # noqa: F401, registers the PyTextRank pipes
+    from spacy.lang.ro import Romanian
+
+    snlp = Romanian()
+    snlp.add_pipe("sentencizer")
+    snlp.add_pipe(SUMMARIZATION_METHOD, last=True)
+    snlp.max_length = MAX_LEN  # to avoid memory issues
+    return snlp
+
+
+get_summarization_pipeline = resources.register("summarization_pipeline", load_summarization_pipeline)
+
+
 def summarize(text: str) -> str:
     """Summarize text using PyTextRank."""
-    if SUMMARIZATION_METHOD not in SNLP.pipe_names:
-        SNLP.add_pipe(SUMMARIZATION_METHOD, last=True)
     logger.info(f"Summarizing text of {len(text)} bytes...")
     # no need to do a summary of a very large text
-    doc = SNLP(text[:MAX_LEN])
+    doc = get_summarization_pipeline()(text[:MAX_LEN])
     summary = list(
         doc._.textrank.summary(
             limit_phrases=SUMMARY_PHRASES, limit_sentences=SUMMARY_SENTENCES
@@ -1,22 +1,25 @@
 import rowordnet
 
-WORDNET = rowordnet.RoWordNet()
+from app.services import resources
+
+get_wordnet = resources.register("wordnet", rowordnet.RoWordNet)
 
 
 def get_synonyms(token):
     if not token.is_alpha or (len(token.text) < 4):
         return []
+    wordnet = get_wordnet()
     lexem_literal = sum(
         [
-            WORDNET.synset(synset_id).literals
-            for synset_id in WORDNET.synsets(literal=token.text)
+            wordnet.synset(synset_id).literals
+            for synset_id in wordnet.synsets(literal=token.text)
         ],
         [],
     )
     lemma_literal = sum(
         [
-            WORDNET.synset(synset_id).literals
-            for synset_id in WORDNET.synsets(literal=token.lemma_)
+            wordnet.synset(synset_id).literals
+            for synset_id in wordnet.synsets(literal=token.lemma_)
         ],
         [],
     )
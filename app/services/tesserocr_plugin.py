@@ -0,0 +1,138 @@
+"""ocrmypdf plugin running Tesseract in-process through tesserocr.
+
+The command line Tesseract loads the language models for every page; this
+plugin keeps initialized Tesseract handles alive in the engine process and
+reuses them for all the pages it OCRs. It requires the optional `tesserocr`
+package and ocrmypdf to run the pages in threads (`use_threads=True`).
+Word confidences are recorded like the confidence plugin does, which must be
+loaded before this plugin so this engine takes precedence.
+"""
+import logging
+import queue
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Tuple
+
+import tesserocr
+from ocrmypdf import hookimpl
+from ocrmypdf._exec.tesseract import _generate_null_hocr, page_timedout, use_skip_page
+from ocrmypdf.builtin_plugins.tesseract_ocr import TesseractOcrEngine
+from ocrmypdf.hocrtransform import HocrTransform
+from ocrmypdf.pluginspec import OrientationConfidence
+from PIL import Image
+
+from app.services.confidence_plugin import record_page_confidences
+
+logger = logging.getLogger(__name__)
+
+HOCR_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN"
+    "http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">
+<html xmlns="http://www.w3.org/1999/xhtml" xml:lang="en" lang="en">
+ <head>
+  <title></title>
+  <meta http-equiv="Content-Type" content="text/html;charset=utf-8"/>
+  <meta name="ocr-system" content="tesseract {version}"/>
+ </head>
+ <body>
+{page}
+ </body>
+</html>
+"""
+
+# idle Tesseract handles, by the settings they were initialized with
+HANDLES: Dict[Tuple, queue.SimpleQueue] = {}
+
+
+class PageTimeout(Exception):
+    """Tesseract did not OCR a page within `tesseract_timeout`."""
+
+
+@contextmanager
+def tesseract_handle(languages: Tuple[str, ...], psm: int, user_words: str = "") -> Iterator:
+    """Borrow an initialized Tesseract handle, creating one if all are busy."""
+    key = (languages, psm, user_words)
+    handles = HANDLES.setdefault(key, queue.SimpleQueue())
+    try:
+        api = handles.get_nowait()
+    except queue.Empty:
+        logger.debug(f"Initializing a Tesseract handle for {key}")
+        variables = {"user_words_file": user_words} if user_words else {}
+        api = tesserocr.PyTessBaseAPI(lang="+".join(languages), psm=psm, variables=variables)
+    try:
+        yield api
+    finally:
+        api.Clear()
+        handles.put(api)
+
+
+def recognize(input_file: Path, options) -> Tuple[str, str]:
+    """OCR a page image; returns the hOCR document and the text.
+
+    :raises PageTimeout: if the page took longer than `tesseract_timeout`
+    """
+    psm = options.tesseract_pagesegmode
+    if psm is None:
+        psm = tesserocr.PSM.AUTO
+    user_words = str(options.user_words) if options.user_words else ""
+    with tesseract_handle(tuple(options.languages), psm, user_words) as api:
+        api.SetImageFile(str(input_file))
+        timeout = int((options.tesseract_timeout or 0) * 1000)
+        if not api.Recognize(timeout=timeout):
+            if timeout:
+                raise PageTimeout(str(input_file))
+            raise RuntimeError(f"Tesseract failed on {input_file}")
+        page = api.GetHOCRText(0)
+        text = api.GetUTF8Text()
+    return HOCR_TEMPLATE.format(version=tesserocr.tesseract_version(), page=page), text
+
+
+class TesserocrEngine(TesseractOcrEngine):
+    """Tesseract engine keeping its handles alive between pages."""
+
+    def __str__(self):
+        return f"Tesseract OCR (tesserocr) {TesseractOcrEngine.version()}"
+
+    @staticmethod
+    def get_orientation(input_file, options):
+        with tesseract_handle(("osd",), tesserocr.PSM.OSD_ONLY) as api:
+            api.SetImageFile(str(input_file))
+            osd = api.DetectOrientationScript()
+        if not osd:
+            return OrientationConfidence(angle=0, confidence=0.0)
+        return OrientationConfidence(angle=osd["orient_deg"], confidence=osd["orient_conf"])
+
+    @staticmethod
+    def generate_hocr(input_file, output_hocr, output_text, options):
+        try:
+            hocr, text = recognize(input_file, options)
+        except PageTimeout:
+            # same as the command line Tesseract: the page is kept without text
+            page_timedout(options.tesseract_timeout)
+            _generate_null_hocr(Path(output_hocr), Path(output_text), Path(input_file))
+            return
+        Path(output_hocr).write_text(hocr, encoding="utf-8")
+        Path(output_text).write_text(text, encoding="utf-8")
+        record_page_confidences(input_file, hocr, options)
+
+    @staticmethod
+    def generate_pdf(input_file, output_pdf, output_text, options):
+        try:
+            hocr, text = recognize(input_file, options)
+        except PageTimeout:
+            # same as the command line Tesseract: the page is skipped, keeping the original page
+            page_timedout(options.tesseract_timeout)
+            use_skip_page(Path(output_pdf), Path(output_text))
+            return
+        hocr_file = Path(output_pdf).with_suffix(".hocr")
+        hocr_file.write_text(hocr, encoding="utf-8")
+        with Image.open(input_file) as image:
+            dpi = image.info.get("dpi", (300, 300))[0]
+        HocrTransform(hocr_filename=hocr_file, dpi=dpi).to_pdf(out_filename=Path(output_pdf), invisible_text=True)
+        Path(output_text).write_text(text, encoding="utf-8")
+        record_page_confidences(input_file, hocr, options)
+
+
+@hookimpl
+def get_ocr_engine():
+    return TesserocrEngine()
@@ -0,0 +1,124 @@
+import logging
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# slot of the current process, 0 means we are not running inside the pool
+SLOT_ID = 0
+
+
+def current_slot() -> int:
+    """Get the slot number of the current process."""
+    return SLOT_ID
+
+
+def _init_slot(counter, warm_up: Optional[Callable[[], Any]]) -> None:
+    """Initializer of a pool process: takes a slot number and warms up models."""
+    global SLOT_ID
+    with counter.get_lock():
+        counter.value += 1
+        SLOT_ID = counter.value
+    if warm_up is not None:
+        warm_up()
+    logger.info(f"Slot {SLOT_ID} is ready.")
+
+
+def _ping() -> int:
+    """No-op task used to make sure a slot is started."""
+    return SLOT_ID
+
+
+class WorkerPool:
+    """Supervisor of a fixed number of document slots, each one a separate process.
+
+    Processes are forked from the supervisor so the models already loaded by
+    the parent are shared copy-on-write and each slot is warm before the first
+    document is claimed.
+    """
+
+    def __init__(
+        self,
+        num_slots: int,
+        warm_up: Optional[Callable[[], Any]] = None,
+        on_crash: Optional[Callable[[Dict[str, Any], Exception], Any]] = None,
+    ) -> None:
+        """Initialize the pool.
+
+        :param num_slots: number of documents processed concurrently
+        :param warm_up: function called once in each slot before any document
+        :param on_crash: called with the document and the error when a slot dies
+        """
+        self.num_slots = num_slots
+        self.warm_up = warm_up
+        self.on_crash = on_crash
+        self.in_flight: Dict[Future, Dict[str, Any]] = {}
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.start()
+
+    def start(self) -> None:
+        """Start (or restart) the slot processes and wait for them to warm up."""
+        context = multiprocessing.get_context("fork")
+        counter = context.Value("i", 0)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.num_slots,
+            mp_context=context,
+            initializer=_init_slot,
+            initargs=(counter, self.warm_up),
+        )
+        pings = [self.executor.submit(_ping) for _ in range(self.num_slots)]
+        wait(pings)
+        logger.info(f"Started worker pool with {self.num_slots} slots.")
+
+    def shutdown(self) -> None:
+        """Wait for the documents in flight and stop the slot processes."""
+        self.reap(wait(self.in_flight).done)
+        self.executor.shutdown(wait=True)
+
+    def free_slots(self) -> int:
+        """Number of slots that can accept a document."""
+        return self.num_slots - len(self.in_flight)
+
+    def submit(self, handler: Callable[[Dict[str, Any]], Any], document: Dict[str, Any]) -> Future:
+        """Dispatch a document to the first free slot."""
+        self.wait_for_slot()
+        future = self.executor.submit(handler, document)
+        self.in_flight[future] = document
+        return future
+
+    def wait_for_slot(self) -> None:
+        """Block until at least one slot is free."""
+        self.reap([f for f in self.in_flight if f.done()])
+        while self.free_slots() <= 0:
+            done, _ = wait(self.in_flight, return_when=FIRST_COMPLETED)
+            self.reap(done)
+
+    def reap(self, done: Iterable[Future]) -> None:
+        """Collect finished documents and recover from slot crashes."""
+        broken = False
+        for future in list(done):
+            broken = self._collect(future) or broken
+        if broken:
+            # every document still in flight fails once the pool is broken
+            for future in list(self.in_flight):
+                self._collect(future)
+            logger.warning("Restarting worker pool after a crashed slot...")
+            self.executor.shutdown(wait=False)
+            self.start()
+
+    def _collect(self, future: Future) -> bool:
+        """Collect a finished document; returns True if its slot crashed."""
+        document = self.in_flight.pop(future)
+        try:
+            future.result()
+        except BrokenProcessPool as e:
+            logger.error(f"Slot died while processing document '{document.get('id')}'.")
+            if self.on_crash is not None:
+                self.on_crash(document, e)
+            return True
+        except Exception:
+            # handlers are expected to report their own failures
+            logger.exception(f"Unhandled error for document '{document.get('id')}'.")
+        return False
@@ -0,0 +1,63 @@
+"""Utilities to measure where the processing time goes."""
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class Timings:
+    """Wall-clock seconds spent in each named step, accumulated over repeated calls."""
+
+    def __init__(self) -> None:
+        """Initialize empty timings."""
+        self.durations: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        """Add the duration of a step."""
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    @contextmanager
+    def measure(self, name: str) -> Iterator[None]:
+        """Measure the duration of the wrapped block, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def as_dict(self, precision: int = 3) -> Dict[str, float]:
+        """Rounded durations, in the order in which the steps were first measured."""
+        return {name: round(seconds, precision) for name, seconds in self.durations.items()}
+
+
+@contextmanager
+def measure(timings: Optional[Timings], name: str) -> Iterator[None]:
+    """Measure the wrapped block if timings are collected, else do nothing."""
+    if timings is None:
+        yield
+    else:
+        with timings.measure(name):
+            yield
+
+
+def timed(items: Iterable[T], timings: Optional[Timings], name: str, exclude: Optional[str] = None) -> Iterator[T]:
+    """Yield the items of a lazy iterable, measuring only the time spent producing them.
+
+    :param exclude: step measured while producing the items, whose time is not counted twice
+    """
+    iterator = iter(items)
+    while True:
+        if timings is None:
+            item = next(iterator, StopIteration)
+        else:
+            excluded = timings.durations.get(exclude, 0.0)
+            start = time.perf_counter()
+            try:
+                item = next(iterator, StopIteration)
+            finally:
+                seconds = time.perf_counter() - start
+                timings.add(name, seconds - (timings.durations.get(exclude, 0.0) - excluded))
+        if item is StopIteration:
+            return
+        yield item
@@ -1,32 +1,79 @@
 '''AI analysis worker'''
 import os
+import asyncio
+import contextlib
+import functools
 import logging
-from typing import Any, Dict
+import multiprocessing
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 import requests
 import json
 import time
 import sys
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 
 from app.config import (API_ENDPOINT,
+                        API_MAX_PAYLOAD,
                         APP_VERSION,
+                        ASYNC_FRONTEND,
+                        BORN_DIGITAL_FAST_PATH,
+                        CLAIM_BATCH_SIZE,
                         DUMP_JSON,
+                        JOB_MAX_ATTEMPTS,
                         MAX_NUM_PAGES,
+                        METRICS_HOST,
+                        METRICS_PORT,
                         MIN_QUALITY,
+                        OCR_CONFIDENCE_QUALITY,
+                        OCR_IN_PROCESS,
                         OUTPUT_PATH,
+                        PIPELINE,
+                        PIPELINE_EXTRACT_WORKERS,
+                        PIPELINE_OCR_WORKERS,
+                        PIPELINE_QUEUE_SIZE,
+                        POLL_MAX_SLEEP,
+                        POLL_MIN_SLEEP,
+                        QUALITY_SAMPLE_MIN_PAGES,
+                        QUALITY_SAMPLE_PAGES,
+                        ROTATION_PROBE_MIN_PAGES,
+                        ROTATION_PROBE_PAGES,
                         SLEEP_TIME,
-                        WORKER_ID)
+                        TEXT_CHUNK_PAGES,
+                        TEXT_PARALLEL_MIN_PAGES,
+                        TEXT_WORKERS,
+                        WARM_UP,
+                        WORKER_ID,
+                        WORKER_SLOTS)
 
 from app.constants import (APIStatus,
                            ResponseField,
-                           BodyField,)
+                           BodyField,
+                           CacheStat,
+                           JobField,
+                           JournalStage,
+                           PayloadTier,)
 
-from app.services import (doc_analysis,
+from app.services import (api_client,
+                          doc_analysis,
+                          job_journal,
+                          metrics,
                           ocr_evaluation,
                           ocr_service,
-                          summarization,)
+                          page_classification,
+                          parallel_text,
+                          pipeline,
+                          resources,
+                          result_cache,
+                          summarization,
+                          worker_pool,)
 
+from app.services.async_frontend import RestartingExecutor, StatusReporter
+from app.services.job_journal import JobJournal
+from app.services.pdf_probe import PdfProbe
+from app.services.poller import Backoff, DocumentPoller
 from app.utils.utils import all_keys_but
-from app.utils.file_util import make_derived_file_name
+from app.utils.file_util import make_derived_file_name, read_text_file
+from app.utils.timing import Timings, measure, timed
 from tenacity import before_log, retry, stop_after_attempt
 
 
@@ -50,6 +97,14 @@ def safe_make_dirs(directory: str) -> None:
         os.makedirs(directory)
 
 
+def worker_name() -> str:
+    """Name reported to the API; in pool mode each slot reports separately."""
+    slot = worker_pool.current_slot()
+    if slot:
+        return f"{WORKER_ID}-{slot}"
+    return WORKER_ID
+
+
 def raise_for_status(response: requests.Response) -> None:
     """Raises :class:`HTTPError`, if one occurred."""
     http_error_msg = ""
@@ -76,7 +131,7 @@ def get_next_document(not_found: bool = False) -> Dict[Any, Any]:
     endpoint = os.path.join(API_ENDPOINT, "next-document")
     if not_found:
         endpoint = endpoint + "?forceStatus=not_found"
-    response = requests.get(endpoint)
+    response = api_client.get(endpoint)
     raise_for_status(response)
     logger.debug(
         f"Endpoint {endpoint} response {response.text} status {response.status_code}"
@@ -85,12 +140,31 @@ def get_next_document(not_found: bool = False) -> Dict[Any, Any]:
     return parsed_response
 
 
+def get_next_documents(count: int = 1) -> List[Dict[Any, Any]]:
+    """Claims up to `count` documents from the API in one request.
+
+    APIs that do not support claiming in batches return a single document.
+    """
+    if count <= 1:
+        return [get_next_document()]
+    endpoint = os.path.join(API_ENDPOINT, "next-document") + f"?count={count}"
+    response = api_client.get(endpoint)
+    raise_for_status(response)
+    logger.debug(
+        f"Endpoint {endpoint} response {response.text} status {response.status_code}"
+    )
+    parsed_response = response.json()
+    if isinstance(parsed_response, dict):
+        return [parsed_response]
+    return parsed_response or [{"status": APIStatus.NOT_FOUND}]
+
+
 @retry(stop=stop_after_attempt(3), before=before_log(logger, logging.INFO))
 def get_document(id: str) -> Dict[Any, Any]:
     """Gets a document by id to process from the API."""
     endpoint = os.path.join(API_ENDPOINT, "document", id)
     logger.info(f"Calling endpoint {endpoint}")
-    response = requests.get(endpoint)
+    response = api_client.get(endpoint)
     logger.info(f"Endpoint response {response.text}")
     response.raise_for_status()
     return response.json()
@@ -105,30 +179,50 @@ def shorten_analysis(analysis: Dict[str, Any],
     return analysis
 
 
-def shorten_payload(body: Dict[str, Any],
-                    for_good: bool = False) -> Dict[str, Any]:
-    """Shortens the analysis field of the response."""
+def payload_tiers(body: Dict[str, Any]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """Lazily makes the full, summarized and minimal versions of a payload.
+
+    The summary is computed only if the summarized version is requested.
+    """
+    yield PayloadTier.FULL, body
     analysis = body.get(BodyField.ANALYSIS, {})
-    if analysis:
-        body[BodyField.ANALYSIS] = shorten_analysis(analysis,
-                                                    for_good=for_good)
-    return body
+    if not analysis:
+        return
+    summarized = dict(analysis)
+    if ResponseField.TEXT in summarized:
+        summarized = shorten_analysis(summarized)
+    yield PayloadTier.SUMMARIZED, {
+        **body,
+        BodyField.MESSAGE: "Payload too large; summarized payload sent.",
+        BodyField.ANALYSIS: summarized,
+    }
+    minimal = dict(summarized)
+    minimal[ResponseField.ANALYSIS_META] = []
+    yield PayloadTier.MINIMAL, {
+        **body,
+        BodyField.MESSAGE: "Payload too large; minimal payload sent.",
+        BodyField.ANALYSIS: minimal,
+    }
 
 
 #  @retry(stop=stop_after_attempt(3), before=before_log(logger, logging.INFO))
-def update_document(id, status, message="", analysis={}, raise_failure=True):
+def update_document(id, status, message="", analysis={}, raise_failure=True) -> str:
     """Updates the status of a document in the API.
 
+    Payloads larger than API_MAX_PAYLOAD are shortened before being sent;
+    if the API still rejects a payload as too large, the next shorter one is sent.
+
     :param id: document id
     :param status: status to update
     :param message: additional message containing errors, defaults to ""
     :param analysis: analysis of the document, defaults to {}
     :param raise_failure: raises an exception if API can't process the request\
         defaults to True
+    :return: the payload tier that was sent
     """
     endpoint = os.path.join(API_ENDPOINT, "ocr-updates")
     body = {
-        BodyField.WORKER: WORKER_ID,
+        BodyField.WORKER: worker_name(),
         BodyField.ID: id,
         BodyField.STATUS: status,
         BodyField.MESSAGE: message,
@@ -139,114 +233,532 @@ def update_document(id, status, message="", analysis={}, raise_failure=True):
         f"Calling endpoint {endpoint}"
         f" Document: '{id}' status: '{status}' message: '{message}' stats: '{stats}'"
     )
-    response = requests.post(endpoint, json=body)
-    logger.info(f"Endpoint response {response.text} status {response.status_code}")
-    if response.status_code == 413:
-        logger.info("Trying again with summarized payload")
-        body = shorten_payload(body, for_good=False)
-        body[BodyField.MESSAGE] = "Payload too large; summarized payload sent."
-        response = requests.post(endpoint, json=body)
-        logger.info(f"Endpoint response {response.text} status {response.status_code}")
-        if response.status_code == 413:
-            logger.warning("Payload too large even after shortening. Trying again with minimal payload.")
-            body = shorten_payload(body, for_good=True)
-            body[BodyField.MESSAGE] = "Payload too large; minimal payload sent."
-            logger.info(f'Minimal payload body: {body}')
-            response = requests.post(endpoint, json=body)
-            logger.info(f"Endpoint response {response.text} status {response.status_code}")
+    for tier, tier_body in payload_tiers(body):
+        data = api_client.encode_json(tier_body)
+        if API_MAX_PAYLOAD and len(data) > API_MAX_PAYLOAD and tier != PayloadTier.MINIMAL and analysis:
+            logger.info(f"Payload of {len(data)} bytes is over the limit of {API_MAX_PAYLOAD} bytes; shortening it...")
+            continue
+        if tier == PayloadTier.MINIMAL:
+            logger.info(f'Minimal payload body: {tier_body}')
+        response = api_client.post_json(endpoint, data=data)
+        logger.info(f"Endpoint response {response.text} status {response.status_code} payload {tier} {len(data)} bytes")
+        if response.status_code != 413:
+            break
+        logger.warning(f"Payload too large for the API ({len(data)} bytes); trying again with a shorter payload.")
+    metrics.PAYLOAD_TIERS.inc(tier=tier)
     if raise_failure:
         raise_for_status(response)
+    return tier
 
 
-def assert_doc_length(doc_path: str):
+def assert_doc_length(probe: PdfProbe):
     """Asserts that a document is not too long."""
-    doc_length = ocr_service.count_pages(doc_path)
+    doc_length = probe.num_pages
     if doc_length > MAX_NUM_PAGES:
         raise ValueError(
-            f"Document {doc_path} is too long ({doc_length} pages), max length is {MAX_NUM_PAGES} pages."
+            f"Document {probe.path} is too long ({doc_length} pages), max length is {MAX_NUM_PAGES} pages."
         )
 
 
-def validate_document(document: Dict[str, Any]):
-    """Validates that a document is valid for processing."""
+def probe_document(doc_path: str) -> PdfProbe:
+    """Probes a document, classifying its pages if the born-digital fast path is enabled."""
+    return PdfProbe(doc_path, classify=BORN_DIGITAL_FAST_PATH, max_pages=MAX_NUM_PAGES)
+
+
+def validate_document(document: Dict[str, Any]) -> PdfProbe:
+    """Validates that a document is valid for processing.
+
+    :param document: document to validate
+    :return: probe of the document, to be passed to `process`
+    """
     doc_path = document["storagePath"]
     assert_path_exists(doc_path)
-    assert ocr_service.is_pdf_valid(doc_path)
-    assert_doc_length(doc_path)
-    if ocr_service.is_pdf_encrypted(doc_path):
+    probe = probe_document(doc_path)
+    assert probe.valid
+    assert_doc_length(probe)
+    if probe.encrypted:
         logger.info(
             f"{doc_path} is encrypted, digitially signed or password protected; atempting to clean..."
         )
         ocr_service.remove_encryption(doc_path)
+        probe = probe_document(doc_path)
+    logger.debug(probe)
+    return probe
 
 
-def process(document: Dict[str, Any],
-            output_path: str,
-            dump_text: bool = False,
-            dump_json: bool = False) -> Dict[str, Any]:
-    """Processes a document receieved from the API.
+def make_job(document: Dict[str, Any],
+             output_path: str,
+             dump_text: bool = False,
+             dump_json: bool = False,
+             journal: Optional[JobJournal] = None,
+             resume: Optional[Dict[str, Any]] = None,
+             timings: Optional[Timings] = None,
+             probe: Optional[PdfProbe] = None) -> Dict[str, Any]:
+    """Makes the state of a document that is passed between the processing stages.
 
     :param document: document to process
     :param output_path: location to store the output
     :param dump_text: flag to dump the text content to a file, defaults to False
     :param dump_json: flag to dump the json contne to a file, defaults to False
-    :return: analysis of the document
+    :param journal: journal recording the completed stages, defaults to None
+    :param resume: journal entry of a previous run to resume from, defaults to None
+    :param timings: timings of the steps done before processing, defaults to None
+    :param probe: probe of the document made by `validate_document`, defaults to None
+    :return: job with an empty analysis, or the analysis recorded in the journal
     """
-    start_time = time.time()
-    js_content = {ResponseField.IN_STATUS: document["status"]}
-    js_content = {ResponseField.WK_VERSION: APP_VERSION}
-    input_file = document["storagePath"]
+    job = {
+        JobField.DOCUMENT: document,
+        JobField.OUTPUT_PATH: output_path,
+        JobField.DUMP_TEXT: dump_text,
+        JobField.DUMP_JSON: dump_json,
+        JobField.START_TIME: time.time(),
+        JobField.CACHE_STATS: {},
+        JobField.TIMINGS: timings if timings is not None else Timings(),
+        JobField.PAGE_KINDS: {},
+        JobField.PAGE_QUALITIES: [],
+        JobField.FORCE_ROTATE: False,
+        JobField.PROBE: probe,
+        JobField.JOURNAL: journal,
+        JobField.COMPLETED: [],
+        JobField.ANALYSIS: {ResponseField.WK_VERSION: APP_VERSION},
+    }
+    if resume is not None:
+        job[JobField.COMPLETED] = resume["stages"]
+        job[JobField.ANALYSIS].update(resume["analysis"])
+        job.update(resume.get("state", {}))
+    return job
+
+
+# fields of a job decided by its stages, restored when the job is resumed
+JOURNALED_FIELDS = (JobField.FORCE_ROTATE, JobField.PAGE_KINDS, JobField.PAGE_QUALITIES, JobField.CACHE_KEY)
+
+
+def record_stage(job: Dict[str, Any], stage: str, document: Optional[Dict[str, Any]] = None):
+    """Records in the journal that a stage of the job is completed."""
+    journal = job[JobField.JOURNAL]
+    if journal is not None:
+        journal.record(
+            job[JobField.DOCUMENT].get("id", "not_found"),
+            stage,
+            all_keys_but(job[JobField.ANALYSIS], keys={ResponseField.TEXT}),
+            document=document,
+            state={field: job[field] for field in JOURNALED_FIELDS if field in job},
+        )
+
+
+def is_resumed(job: Dict[str, Any], stage: str, *artifacts: str) -> bool:
+    """Checks if a stage was completed by a previous run and its artifacts are still there."""
+    return stage in job[JobField.COMPLETED] and all(os.path.exists(path) for path in artifacts)
+
+
+def derived_output(job: Dict[str, Any], new_extension: str, new_suffix: str) -> str:
+    """Makes the path of an output file of the job."""
+    return make_derived_file_name(
+        job[JobField.DOCUMENT]["storagePath"],
+        new_path=job[JobField.OUTPUT_PATH],
+        new_extension=new_extension,
+        new_suffix=new_suffix,
+    )
+
+
+def ocr_stage(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Does the OCR of the input document, unless the result is cached."""
+    js_content = job[JobField.ANALYSIS]
+    input_file = job[JobField.DOCUMENT]["storagePath"]
     js_content[ResponseField.IN] = input_file
     assert_path_exists(input_file)
-    ocr_output = make_derived_file_name(
-        input_file, new_path=output_path, new_extension="pdf", new_suffix="ocr"
-    )
-    anl_output = make_derived_file_name(
-        input_file, new_path=output_path, new_extension="pdf", new_suffix="highlight"
-    )
-    ocr_service.call_ocr(input_file, ocr_output, force_rotate=False)
-    # TODO: call this instead of the cli
-    # ocr_service.run_ocr(input_file, ocr_output)
+    ocr_output = derived_output(job, "pdf", "ocr")
+    if is_resumed(job, JournalStage.OCR_DONE, ocr_output):
+        logger.info(f"Resuming from the OCR output {ocr_output} of a previous run")
+        js_content[ResponseField.OCR] = ocr_output
+        return job
+    cache = result_cache.get_cache()
+    if cache is not None:
+        job[JobField.CACHE_KEY] = cache.ocr_key(
+            input_file,
+            f"{ocr_service.ocr_settings()} min_quality={MIN_QUALITY} fast_path={BORN_DIGITAL_FAST_PATH}"
+            f" confidence_quality={OCR_CONFIDENCE_QUALITY}"
+            f" rotation_probe={ROTATION_PROBE_PAGES}/{ROTATION_PROBE_MIN_PAGES}"
+        )
+        cached = cache.get_ocr(job[JobField.CACHE_KEY], ocr_output)
+        job[JobField.CACHE_STATS][CacheStat.OCR] = CacheStat.HIT if cached else CacheStat.MISS
+        if cached:
+            logger.info(f"Using cached OCR result for {input_file}")
+            js_content[ResponseField.OCR] = ocr_output
+            js_content[ResponseField.TEXT], js_content[ResponseField.QUALITY] = cached
+            record_stage(job, JournalStage.OCR_DONE)
+            return job
+    timings = job[JobField.TIMINGS]
+    probe = job[JobField.PROBE]
+    if probe is None:
+        with timings.measure("probe"):
+            probe = job[JobField.PROBE] = probe_document(input_file)
+    if probe.page_kinds is not None:
+        job[JobField.PAGE_KINDS] = page_classification.count_kinds(probe.page_kinds)
+        logger.info(f"Pages of {input_file}: {job[JobField.PAGE_KINDS]}")
+        pages = page_classification.pages_to_ocr(probe.page_kinds)
+    else:
+        pages = list(range(probe.num_pages))
+    if ROTATION_PROBE_PAGES and len(pages) >= max(ROTATION_PROBE_MIN_PAGES, ROTATION_PROBE_PAGES + 1):
+        with timings.measure("rotation_probe"):
+            job[JobField.FORCE_ROTATE], sample, probe_output = probe_rotation(input_file, pages, ocr_output)
+        if job[JobField.FORCE_ROTATE]:
+            metrics.FORCED_ROTATIONS.inc()
+        try:
+            # the probed pages are already OCRed with the chosen setting
+            sampled = set(sample)
+            with timings.measure("ocr"):
+                ocr_service.call_ocr_on_some_pages(
+                    input_file, ocr_output, [page for page in pages if page not in sampled],
+                    force_rotate=job[JobField.FORCE_ROTATE], num_pages=probe.num_pages,
+                )
+                ocr_service.splice_pages(ocr_output, probe_output, {page: index for index, page in enumerate(sample)})
+        finally:
+            remove_ocr_output(probe_output)
+    elif probe.page_kinds is not None:
+        with timings.measure("ocr"):
+            ocr_service.call_ocr_on_some_pages(
+                input_file, ocr_output, pages, force_rotate=job[JobField.FORCE_ROTATE], num_pages=probe.num_pages,
+            )
+    else:
+        with timings.measure("ocr"):
+            ocr_service.call_ocr(
+                input_file, ocr_output, force_rotate=job[JobField.FORCE_ROTATE], num_pages=probe.num_pages
+            )
     assert_path_exists(ocr_output)
     js_content[ResponseField.OCR] = ocr_output
-    text = ocr_service.get_ocrized_text_from_blocks(ocr_output)
-    js_content[ResponseField.TEXT] = text
-    js_content[ResponseField.QUALITY] = ocr_evaluation.estimate_quality(text)
-    if js_content[ResponseField.QUALITY] < MIN_QUALITY:
-        logger.info(f"Quality of {ocr_output} is too low. Forcing page rotation and doing again...")
-        ocr_service.call_ocr(input_file, ocr_output, force_rotate=True)
-        assert_path_exists(ocr_output)
-        js_content[ResponseField.OCR] = ocr_output
-        text = ocr_service.get_ocrized_text_from_blocks(ocr_output)
-        js_content[ResponseField.TEXT] = text
-        js_content[ResponseField.QUALITY] = ocr_evaluation.estimate_quality(text)
+    record_stage(job, JournalStage.OCR_DONE)
+    return job
+
+
+def remove_ocr_output(ocr_output: str):
+    """Removes an intermediate OCR output along with its word confidences."""
+    if os.path.exists(ocr_output):
+        os.remove(ocr_output)
+    ocr_service.remove_confidences(ocr_output)
 
+
+def probe_rotation(input_file: str, pages: List[int], ocr_output: str) -> Tuple[bool, List[int], str]:
+    """Decides if the document needs forced page rotation by doing the OCR of a sample of its pages.
+
+    The sample is OCRed with forced rotation only if its quality is low, and
+    forced rotation is used for the document if it gives a better quality.
+
+    :param input_file: input document
+    :param pages: pages of the document that need OCR
+    :param ocr_output: OCR output of the document, used to name the outputs of the probe
+    :return: True if the document should be OCRed with forced rotation, the sampled pages,\
+        and the OCR output of the sample with the chosen setting, to be removed by the caller
+    """
+    sample = page_classification.sample_pages(pages, ROTATION_PROBE_PAGES)
+    probe_output = make_derived_file_name(ocr_output, new_suffix="probe", new_extension="pdf")
+    rotated_output = make_derived_file_name(ocr_output, new_suffix="probe_rotated", new_extension="pdf")
+    try:
+        ocr_service.call_ocr_on_pages(input_file, sample, probe_output, force_rotate=False)
+        quality, _ = estimate_output_quality(probe_output)
+        if quality >= MIN_QUALITY:
+            logger.info(f"Quality of the pages {sample} of {input_file} is {quality}, no forced rotation")
+            return False, sample, probe_output
+        ocr_service.call_ocr_on_pages(input_file, sample, rotated_output, force_rotate=True)
+        rotated_quality, _ = estimate_output_quality(rotated_output)
+    except BaseException:
+        remove_ocr_output(probe_output)
+        remove_ocr_output(rotated_output)
+        raise
+    logger.info(
+        f"Quality of the pages {sample} of {input_file} is {quality}, {rotated_quality} with forced rotation"
+    )
+    if rotated_quality > quality:
+        remove_ocr_output(probe_output)
+        return True, sample, rotated_output
+    remove_ocr_output(rotated_output)
+    return False, sample, probe_output
+
+
+def retry_rotated_pages(input_file: str, ocr_output: str, page_qualities: List[Optional[float]],
+                        ocr_pages: Optional[List[int]] = None) -> int:
+    """Does the OCR again with forced rotation only for the pages with low quality.
+
+    Each page OCRed again replaces the page of the OCR output only if its quality is higher.
+    A page OCRed without recognizing any word, e.g. a sideways scan, has a low quality.
+
+    :param input_file: input document
+    :param ocr_output: OCR output of the document, modified in place
+    :param page_qualities: quality of each page of the OCR output, None for the pages without text
+    :param ocr_pages: pages whose image was OCRed, defaults to all the pages
+    :return: number of pages replaced
+    """
+    ocr_pages = set(range(len(page_qualities)) if ocr_pages is None else ocr_pages)
+    qualities = [
+        (0 if page in ocr_pages else 100) if quality is None else quality
+        for page, quality in enumerate(page_qualities)
+    ]
+    low_pages = [page for page, quality in enumerate(qualities) if quality < MIN_QUALITY]
+    logger.info(f"Pages {low_pages} of {ocr_output} have a quality under {MIN_QUALITY}")
+    if not low_pages:
+        return 0
+    rotated_output = make_derived_file_name(ocr_output, new_suffix="rotated", new_extension="pdf")
+    try:
+        ocr_service.call_ocr_on_pages(input_file, low_pages, rotated_output, force_rotate=True)
+        replacements = {}
+        for index, quality in enumerate(estimate_page_qualities(rotated_output)):
+            page = low_pages[index]
+            if quality > qualities[page]:
+                replacements[page] = index
+        logger.info(f"Replacing pages {sorted(replacements)} with their rotated version")
+        if replacements:
+            ocr_service.splice_pages(ocr_output, rotated_output, replacements)
+    finally:
+        remove_ocr_output(rotated_output)
+    return len(replacements)
+
+
+def estimate_output_quality(ocr_output: str) -> Tuple[float, List[Optional[float]]]:
+    """Estimates the quality of the OCR output and of each of its pages, None for the pages without text."""
+    estimator = ocr_evaluation.QualityEstimator(ocr_service.read_confidences(ocr_output))
+    for _ in clean_and_estimate(ocr_output, estimator):
+        pass
+    return estimator.quality, estimator.page_qualities
+
+
+def clean_and_estimate(ocr_output: str, estimator: Optional[ocr_evaluation.QualityEstimator],
+                       timings: Optional[Timings] = None) -> Iterator[str]:
+    """Yields the clean text of each page of the OCR output, after adding it to the quality estimator, if any.
+
+    Large documents are cleaned and estimated in TEXT_WORKERS processes, with
+    the same results; the quality estimation is then timed as cleaning.
+    """
+    num_pages = ocr_service.count_pages(ocr_output) if TEXT_WORKERS > 1 else 0
+    if num_pages and num_pages >= TEXT_PARALLEL_MIN_PAGES:
+        num_chunks = -(-num_pages // TEXT_CHUNK_PAGES)
+        with ocr_service.reserve_jobs(num_chunks, TEXT_WORKERS) as jobs:
+            workers = jobs or TEXT_WORKERS
+            logger.info(f"Cleaning the text of {ocr_output} in {workers} processes")
+            pages = ocr_service.iter_page_texts_from_blocks(ocr_output, timings=timings)
+            clean_pages = parallel_text.clean_and_estimate(
+                pages, estimator, workers, TEXT_CHUNK_PAGES, report=ocr_evaluation.report_normalization_caches
+            )
+            yield from timed(clean_pages, timings, "cleaning", exclude="text_extraction")
+        return
+    for page in ocr_service.iter_clean_pages(ocr_output, timings=timings):
+        if estimator is not None:
+            with measure(timings, "quality_estimation"):
+                estimator.add_page(page)
+        yield page
+    logger.info(f"Word normalization cache hit rates: {ocr_evaluation.report_normalization_caches()}")
+
+
+def estimate_page_qualities(ocr_output: str) -> List[float]:
+    """Estimates the quality of each page of the OCR output, 0 for the pages without text."""
+    _, qualities = estimate_output_quality(ocr_output)
+    return [0 if quality is None else quality for quality in qualities]
+
+
+def extract_text(job: Dict[str, Any], ocr_output: str, text_file: Optional[str] = None
+                 ) -> Tuple[str, List[Optional[float]]]:
+    """Extracts and cleans the text of the OCR output one page at a time, and estimates its quality.
+
+    Each clean page is written to the text file and added to the quality
+    estimation as soon as it is extracted; only the text of the payload is kept.
+
+    :param text_file: file where the text is written, defaults to None
+    :return: text of the document, and quality of each page, None for the pages without text
+    """
+    js_content = job[JobField.ANALYSIS]
+    timings = job[JobField.TIMINGS]
+    confidences = ocr_service.read_confidences(ocr_output)
+    sampled = QUALITY_SAMPLE_MIN_PAGES and ocr_service.count_pages(ocr_output) >= QUALITY_SAMPLE_MIN_PAGES
+    estimator = None if sampled else ocr_evaluation.QualityEstimator(confidences)
+    pages = []
+    with (open(text_file, "w", encoding="utf-8") if text_file else contextlib.nullcontext()) as fout:
+        for page in clean_and_estimate(ocr_output, estimator, timings=timings):
+            pages.append(page)
+            if fout is not None:
+                fout.write(page)
+    with timings.measure("quality_estimation"):
+        if estimator is None:
+            quality, page_qualities = estimate_sampled_quality(pages, confidences)
+        else:
+            quality, page_qualities = estimator.quality, estimator.page_qualities
+    js_content[ResponseField.QUALITY] = quality
+    if confidences is not None:
+        job[JobField.PAGE_QUALITIES] = page_qualities
+    return "".join(pages), page_qualities
+
+
+def estimate_sampled_quality(pages: List[str], confidences: Optional[List[Optional[Dict[str, Any]]]]
+                             ) -> Tuple[float, List[Optional[float]]]:
+    """Estimates the quality of a document from a sample of its pages, unless it is too close to MIN_QUALITY.
+
+    Only the side of MIN_QUALITY the quality is on matters, so the sampled
+    estimate is used when its confidence interval is entirely above it;
+    otherwise all the pages are scored, the rotation retry choosing the pages
+    to OCR again from their quality.
+
+    :param pages: clean text of each page
+    :param confidences: word confidences of each page, None for the pages that were not OCRed
+    :return: quality of the document and of each page, None for the pages without text or not scored
+    """
+    sample = ocr_evaluation.sample_quality(pages, confidences, QUALITY_SAMPLE_PAGES)
+    logger.info(
+        f"Quality estimated on {sample.scored_pages} of {len(pages)} pages: {sample.quality}"
+        f" [{sample.low}, {sample.high}]"
+    )
+    if sample.quality is not None and sample.low >= MIN_QUALITY:
+        return sample.quality, sample.page_qualities
+    logger.info(f"The quality may be under {MIN_QUALITY}, scoring all the pages")
+    return ocr_evaluation.estimate_pages_quality(pages, confidences)
+
+
+def extraction_stage(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Extracts the text and estimates its quality; does the OCR again if the quality is low."""
+    js_content = job[JobField.ANALYSIS]
+    input_file = js_content[ResponseField.IN]
+    ocr_output = js_content[ResponseField.OCR]
+    text_file = js_content.get(ResponseField.TEXT_FILE, 'not_dumped')
+    if is_resumed(job, JournalStage.TEXT_EXTRACTED, text_file):
+        logger.info(f"Resuming from the text {text_file} of a previous run")
+        js_content[ResponseField.TEXT] = read_text_file(text_file)
+        return job
+    timings = job[JobField.TIMINGS]
     text_file = 'not_dumped'
-    if dump_text is True:
-        text_file = make_derived_file_name(
-            input_file, new_path=output_path, new_extension="txt", new_suffix="ocr"
-        )
-        ocr_service.dump_text(text, text_file)
+    if job[JobField.DUMP_TEXT] is True:
+        text_file = derived_output(job, "txt", "ocr")
+    if job[JobField.CACHE_STATS].get(CacheStat.OCR) == CacheStat.HIT:
+        text = js_content[ResponseField.TEXT]
+        if job[JobField.DUMP_TEXT] is True:
+            ocr_service.dump_text(text, text_file)
+    else:
+        text, page_qualities = extract_text(job, ocr_output, text_file if job[JobField.DUMP_TEXT] is True else None)
+        js_content[ResponseField.TEXT] = text
+        if js_content[ResponseField.QUALITY] < MIN_QUALITY and job[JobField.FORCE_ROTATE]:
+            logger.info(f"Quality of {ocr_output} is low, but it was already OCRed with forced page rotation")
+        elif js_content[ResponseField.QUALITY] < MIN_QUALITY:
+            logger.info(f"Quality of {ocr_output} is too low. Forcing page rotation on low quality pages...")
+            metrics.ROTATION_RETRIES.inc()
+            probe = job[JobField.PROBE]
+            ocr_pages = None
+            if probe is not None and probe.page_kinds is not None:
+                ocr_pages = page_classification.pages_to_ocr(probe.page_kinds)
+            with timings.measure("ocr_rotation_retry"):
+                retry_rotated_pages(input_file, ocr_output, page_qualities, ocr_pages)
+            assert_path_exists(ocr_output)
+            js_content[ResponseField.OCR] = ocr_output
+            text, _ = extract_text(job, ocr_output, text_file if job[JobField.DUMP_TEXT] is True else None)
+            js_content[ResponseField.TEXT] = text
+        if job.get(JobField.CACHE_KEY):
+            result_cache.get_cache().put_ocr(
+                job[JobField.CACHE_KEY], ocr_output, text, js_content[ResponseField.QUALITY]
+            )
+        ocr_service.remove_confidences(ocr_output)
+    if job[JobField.DUMP_TEXT] is True:
         assert_path_exists(text_file)
     js_content[ResponseField.TEXT_FILE] = text_file
+    record_stage(job, JournalStage.TEXT_EXTRACTED)
+    return job
+
+
+def highlight_stage(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Highlights the keywords in the OCR output, unless the result is cached."""
+    js_content = job[JobField.ANALYSIS]
+    document = job[JobField.DOCUMENT]
+    anl_output = derived_output(job, "pdf", "highlight")
+    if is_resumed(job, JournalStage.HIGHLIGHTED, anl_output):
+        logger.info(f"Resuming from the highlighted output {anl_output} of a previous run")
+        return job
     kwds_hash = document.get('keywordsHash', '0')
     js_content[ResponseField.KWDS_HASH] = kwds_hash
-    highlight_meta_js, statistics = doc_analysis.highlight_keywords(
-        ocr_output, anl_output, document.get('keywords', []), kwds_hash
-    )
+    cache_key = job.get(JobField.CACHE_KEY)
+    highlight_key = f"{kwds_hash} {doc_analysis.highlight_settings()}"
+    cached = None
+    if cache_key:
+        cached = result_cache.get_cache().get_highlight(cache_key, highlight_key, anl_output)
+        job[JobField.CACHE_STATS][CacheStat.HIGHLIGHT] = CacheStat.HIT if cached else CacheStat.MISS
+    if cached:
+        logger.info(f"Using cached highlighting for keywords hash '{kwds_hash}'")
+        highlight_meta_js, statistics = cached
+    else:
+        highlight_meta_js, statistics = doc_analysis.highlight_keywords(
+            js_content[ResponseField.OCR], anl_output, document.get('keywords', []), kwds_hash,
+            timings=job[JobField.TIMINGS],
+        )
+        # do not cache results of a keywords list that failed to load
+        if cache_key and doc_analysis.LAST_KEYWORDS_HASH == kwds_hash:
+            result_cache.get_cache().put_highlight(
+                cache_key, highlight_key, anl_output, highlight_meta_js, statistics
+            )
+    statistics = dict(statistics)
+    if job[JobField.CACHE_STATS]:
+        statistics["result_cache"] = job[JobField.CACHE_STATS]
+    if job[JobField.PAGE_KINDS]:
+        statistics["page_kinds"] = job[JobField.PAGE_KINDS]
+    if job[JobField.PAGE_QUALITIES]:
+        statistics["page_qualities"] = job[JobField.PAGE_QUALITIES]
     js_content[ResponseField.STATISTICS] = statistics
     assert_path_exists(anl_output)
     js_content[ResponseField.ANALYSIS] = anl_output
     js_content[ResponseField.ANALYSIS_META] = highlight_meta_js
-    time_duration = round(time.time() - start_time, 3)
+    record_stage(job, JournalStage.HIGHLIGHTED)
+    return job
+
+
+def finish_stage(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Records the processing time and its breakdown, and dumps the analysis."""
+    js_content = job[JobField.ANALYSIS]
+    time_duration = round(time.time() - job[JobField.START_TIME], 3)
     js_content[ResponseField.TIME] = time_duration
-    if dump_json is True:
-        json_file = make_derived_file_name(
-            input_file, new_path=output_path, new_extension="json", new_suffix="stats"
-        )
+    js_content.setdefault(ResponseField.STATISTICS, {})["timings"] = job[JobField.TIMINGS].as_dict()
+    record_job_metrics(job)
+    if job[JobField.DUMP_JSON] is True:
+        json_file = derived_output(job, "json", "stats")
         dump_json_to_path(js_content, json_file)
         assert_path_exists(json_file)
-    return js_content
+    return job
+
+
+def record_job_metrics(job: Dict[str, Any]):
+    """Records the processing time, pages and cache lookups of a processed document."""
+    js_content = job[JobField.ANALYSIS]
+    time_duration = js_content[ResponseField.TIME]
+    metrics.DOCUMENT_SECONDS.observe(time_duration)
+    for step, seconds in job[JobField.TIMINGS].as_dict().items():
+        metrics.STEP_SECONDS.observe(seconds, step=step)
+    num_pages = js_content[ResponseField.STATISTICS].get("num_pages", 0)
+    metrics.PAGES.inc(num_pages)
+    if num_pages and time_duration > 0:
+        metrics.PAGES_PER_SECOND.observe(num_pages / time_duration)
+    for result, outcome in job[JobField.CACHE_STATS].items():
+        metrics.CACHE_LOOKUPS.inc(result=result, outcome=outcome)
+
+
+PROCESSING_STAGES = [ocr_stage, extraction_stage, highlight_stage, finish_stage]
+
+
+def process(document: Dict[str, Any],
+            output_path: str,
+            dump_text: bool = False,
+            dump_json: bool = False,
+            journal: Optional[JobJournal] = None,
+            resume: Optional[Dict[str, Any]] = None,
+            timings: Optional[Timings] = None,
+            probe: Optional[PdfProbe] = None) -> Dict[str, Any]:
+    """Processes a document receieved from the API.
+
+    :param document: document to process
+    :param output_path: location to store the output
+    :param dump_text: flag to dump the text content to a file, defaults to False
+    :param dump_json: flag to dump the json contne to a file, defaults to False
+    :param journal: journal recording the completed stages, defaults to None
+    :param resume: journal entry of a previous run to resume from, defaults to None
+    :param timings: timings of the steps done before processing, defaults to None
+    :param probe: probe of the document made by `validate_document`, defaults to None
+    :return: analysis of the document
+    """
+    job = make_job(document, output_path, dump_text=dump_text, dump_json=dump_json,
+                   journal=journal, resume=resume, timings=timings, probe=probe)
+    for stage in PROCESSING_STAGES:
+        job = stage(job)
+    return job[JobField.ANALYSIS]
 
 
 def dump_json_to_path(analysis: Dict[str, Any], json_output: str):
@@ -270,15 +782,161 @@ def init():
     assert_path_exists(OUTPUT_PATH)
 
 
-def main():
-    """Main function of the worker."""
-    init()
+def warm_up() -> Dict[str, float]:
+    """Loads the models before the worker forks, so its processes share them, and reports the startup time.
+
+    :return: seconds spent importing, loading each resource and in total
+    """
+    startup = {"imports": round(metrics.process_uptime(), 3)}
+    if WARM_UP:
+        startup.update(resources.RESOURCES.warm_up())
+    startup["total"] = round(metrics.process_uptime(), 3)
+    for step, seconds in startup.items():
+        metrics.STARTUP_SECONDS.set(seconds, step=step)
+    logger.info(f"Worker started in {startup['total']} seconds: {startup}")
+    return startup
+
+
+def handle_document(document: Dict[str, Any], resume: Optional[Dict[str, Any]] = None) -> str:
+    """Processes a downloaded document and reports every status change to the API.
+
+    :param document: document received from the API
+    :param resume: journal entry of a previous run to resume from, defaults to None
+    :return: the last status reported for the document
+    """
+    job_id = document.get("id", "not_found")
+    analysis = {}
+    journal = job_journal.get_journal()
+    timings = Timings()
+    probe = None
+    try:
+        if resume is None:
+            logger.info(f"Got document {all_keys_but(document, keys={'keywords'})}")
+            update_document(job_id, APIStatus.LOCKED, message="Processing...")
+            with timings.measure("validation"):
+                probe = validate_document(document)
+            if journal is not None:
+                journal.record(job_id, JournalStage.VALIDATED, {}, document=document)
+        else:
+            logger.info(f"Resuming document '{job_id}' after stages {resume['stages']}")
+        update_document(
+            job_id, APIStatus.OCR_INPROGRESS, message="Doing AI analysis..."
+        )
+        analysis = process(document, OUTPUT_PATH, dump_text=True, dump_json=DUMP_JSON,
+                           journal=journal, resume=resume, timings=timings, probe=probe)
+        logger.info(
+            f"Processing time took: {analysis[ResponseField.TIME]} seconds {analysis[ResponseField.STATISTICS]}"
+        )
+        upload_start = time.time()
+        update_document(job_id, APIStatus.OCR_DONE, analysis=analysis)
+        logger.info(f"Upload of the analysis of '{job_id}' took {round(time.time() - upload_start, 3)} seconds")
+        metrics.DOCUMENTS.inc(status=APIStatus.OCR_DONE)
+        return APIStatus.OCR_DONE
+    except Exception as e:
+        message = f"Something went wrong for job id '{job_id}'. "
+        logger.exception(message)
+        message += str(e)
+        update_document(
+            job_id, APIStatus.FAILED, message=message, raise_failure=False, analysis=analysis
+        )
+        metrics.DOCUMENTS.inc(status=APIStatus.FAILED)
+        return APIStatus.FAILED
+    finally:
+        if journal is not None:
+            journal.finish(job_id)
+
+
+def is_still_assigned(job_id: str) -> Optional[bool]:
+    """Checks that the API still expects this worker to process a document left unfinished.
+
+    :return: None if the API cannot be reached
+    """
+    try:
+        document = get_document(job_id)
+    except Exception:
+        logger.exception(f"Could not get the status of job id '{job_id}'")
+        return None
+    status = document.get("status")
+    if status not in {APIStatus.LOCKED, APIStatus.OCR_INPROGRESS}:
+        logger.info(f"Not resuming job id '{job_id}', its status is now '{status}'")
+        return False
+    worker = str(document.get(BodyField.WORKER) or "")
+    if worker and worker != str(WORKER_ID) and not worker.startswith(f"{WORKER_ID}-"):
+        logger.info(f"Not resuming job id '{job_id}', it is now assigned to worker '{worker}'")
+        return False
+    return True
+
+
+def resume_unfinished_documents():
+    """Resumes the documents left unfinished by a previous run of the worker.
+
+    A document is failed instead after JOB_MAX_ATTEMPTS runs that did not
+    finish, e.g. because it kills the worker, and is dropped if the API no
+    longer expects this worker to process it.
+    """
+    journal = job_journal.get_journal()
+    if journal is None:
+        return
+    for entry in journal.unfinished():
+        job_id = entry["document"].get("id", "not_found")
+        if entry["attempts"] >= JOB_MAX_ATTEMPTS:
+            message = (
+                f"Giving up on job id '{job_id}' after {entry['attempts']} attempts"
+                " that did not finish, the worker may have crashed while processing it."
+            )
+            logger.error(message)
+            update_document(job_id, APIStatus.FAILED, message=message, raise_failure=False)
+            metrics.DOCUMENTS.inc(status=APIStatus.FAILED)
+            journal.finish(job_id)
+            continue
+        assigned = is_still_assigned(job_id)
+        if assigned is None:
+            # kept in the journal, to be checked again on the next start
+            continue
+        if not assigned:
+            journal.finish(job_id)
+            continue
+        journal.record_attempt(job_id)
+        handle_document(entry["document"], resume=entry)
+
+
+def handle_document_serially(document: Dict[str, Any]):
+    """Processes a document in the current process and backs off after a failure."""
+    if handle_document(document) == APIStatus.FAILED:
+        time.sleep(SLEEP_TIME)
+
+
+def report_crash(document: Dict[str, Any], error: Exception):
+    """Marks as failed a document whose pool slot died while processing it."""
+    job_id = document.get("id", "not_found")
+    message = f"Worker process died while processing job id '{job_id}'. {error}"
+    update_document(job_id, APIStatus.FAILED, message=message, raise_failure=False)
+    metrics.DOCUMENTS.inc(status=APIStatus.FAILED)
+    # a broken pool loses all its slots, with the cores they had reserved
+    ocr_service.CPU_BUDGET.reset()
+
+
+def poll_documents(dispatch: Callable[[Dict[str, Any]], Any],
+                   wait_for_slot: Optional[Callable[[], Any]] = None):
+    """Polls the API for documents and dispatches the ones ready to be processed.
+
+    The API is polled again right after a document is dispatched; while there
+    is nothing to process the polling interval grows up to POLL_MAX_SLEEP.
+
+    :param dispatch: called with each downloaded document
+    :param wait_for_slot: called before claiming a document, blocks until\
+        there is capacity to process it, defaults to None
+    """
     input_status = "no_input_status"
+    poller = DocumentPoller(get_next_documents, batch_size=CLAIM_BATCH_SIZE)
+    metrics.QUEUE_DEPTH.track(poller.queue_depth, queue="claimed")
+    backoff = Backoff(POLL_MIN_SLEEP, POLL_MAX_SLEEP)
     while True:
+        if wait_for_slot is not None:
+            wait_for_slot()
         job_id = ""
-        analysis = {}
         try:
-            document = get_next_document()
+            document = poller.next_document()
             last_input_status = input_status
             input_status = document["status"]
             job_id = document.get("id", "not_found")
@@ -286,48 +944,265 @@ def main():
                 if input_status != last_input_status:
                     logger.info(
                         f"Next document status is {input_status}. Assuming no more documents to process."
-                        f" Polling every {SLEEP_TIME} seconds."
+                        f" Polling every {POLL_MIN_SLEEP} to {POLL_MAX_SLEEP} seconds."
                         f"\nThis message will only be logged once."
                     )
-                time.sleep(SLEEP_TIME)
+                backoff.sleep()
             elif input_status in APIStatus.DOWNLOADED:
-                logger.info(f"Got document {all_keys_but(document, keys={'keywords'})}")
-                update_document(job_id, APIStatus.LOCKED, message="Processing...")
-                validate_document(document)
-                update_document(
-                    job_id, APIStatus.OCR_INPROGRESS, message="Doing AI analysis..."
-                )
-                analysis = process(document, OUTPUT_PATH, dump_text=True, dump_json=DUMP_JSON)
-                logger.info(
-                    f"Processing time took: {analysis[ResponseField.TIME]} seconds {analysis[ResponseField.STATISTICS]}"
-                )
-                update_document(job_id, APIStatus.OCR_DONE, analysis=analysis)
+                backoff.reset()
+                dispatch(document)
             elif input_status in {
                 APIStatus.OCR_DONE,
                 APIStatus.OCR_INPROGRESS,
                 APIStatus.LOCKED,
             }:
-                message = f"Status of '{job_id}'' is '{input_status}'. Sleeping for {SLEEP_TIME} seconds..."
+                message = f"Status of '{job_id}'' is '{input_status}'. Sleeping for {POLL_MIN_SLEEP} seconds..."
                 logger.info(message)
                 update_document(job_id, APIStatus.FAILED, message=message)
-                time.sleep(SLEEP_TIME)
+                backoff.reset()
+                time.sleep(POLL_MIN_SLEEP)
             else:
                 if input_status != last_input_status:
                     logger.info(
                         f"Status of '{job_id}' is '{input_status}' (unkown). Assuming no more documents to process."
                         f" Expected one of these statuses {APIStatus.statuses()}"
-                        f" Next call will take place in {6*SLEEP_TIME} seconds..."
+                        f" Next calls will take place at most every {POLL_MAX_SLEEP} seconds..."
                     )
-                time.sleep(SLEEP_TIME)
+                backoff.sleep()
         except Exception as e:
             message = f"Something went wrong for job id '{job_id}'. "
             logger.exception(message)
             message += str(e)
             if job_id:
                 update_document(
-                    job_id, APIStatus.FAILED, message=message, raise_failure=False, analysis=analysis
+                    job_id, APIStatus.FAILED, message=message, raise_failure=False
                 )
-            time.sleep(SLEEP_TIME)
+            backoff.sleep()
+
+
+def claim_stage(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Locks and validates a document before it enters the pipeline."""
+    document = job[JobField.DOCUMENT]
+    job_id = document.get("id", "not_found")
+    logger.info(f"Got document {all_keys_but(document, keys={'keywords'})}")
+    update_document(job_id, APIStatus.LOCKED, message="Processing...")
+    with job[JobField.TIMINGS].measure("validation"):
+        job[JobField.PROBE] = validate_document(document)
+    job[JobField.JOURNAL] = job_journal.get_journal()
+    record_stage(job, JournalStage.VALIDATED, document=document)
+    update_document(
+        job_id, APIStatus.OCR_INPROGRESS, message="Doing AI analysis..."
+    )
+    job[JobField.START_TIME] = time.time()
+    return job
+
+
+def report_stage(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Sends the analysis of a processed document to the API."""
+    analysis = job[JobField.ANALYSIS]
+    logger.info(
+        f"Processing time took: {analysis[ResponseField.TIME]} seconds {analysis[ResponseField.STATISTICS]}"
+    )
+    job_id = job[JobField.DOCUMENT].get("id", "not_found")
+    try:
+        upload_start = time.time()
+        update_document(job_id, APIStatus.OCR_DONE, analysis=analysis)
+        logger.info(f"Upload of the analysis of '{job_id}' took {round(time.time() - upload_start, 3)} seconds")
+        metrics.DOCUMENTS.inc(status=APIStatus.OCR_DONE)
+    finally:
+        if job[JobField.JOURNAL] is not None:
+            job[JobField.JOURNAL].finish(job_id)
+    return job
+
+
+def report_stage_failure(job: Dict[str, Any], error: Exception):
+    """Marks as failed a document that failed in one of the pipeline stages."""
+    job_id = job[JobField.DOCUMENT].get("id", "not_found")
+    message = f"Something went wrong for job id '{job_id}'. {error}"
+    update_document(
+        job_id, APIStatus.FAILED, message=message, raise_failure=False, analysis=job[JobField.ANALYSIS]
+    )
+    metrics.DOCUMENTS.inc(status=APIStatus.FAILED)
+    if job[JobField.JOURNAL] is not None:
+        job[JobField.JOURNAL].finish(job_id)
+
+
+def make_pipeline() -> pipeline.Pipeline:
+    """Makes the pipeline of stages: claim -> OCR -> extract/quality -> highlight -> report."""
+    stages = [
+        pipeline.Stage("claim", claim_stage, queue_size=PIPELINE_QUEUE_SIZE),
+        pipeline.Stage("ocr", ocr_stage, workers=PIPELINE_OCR_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+        pipeline.Stage("extract", extraction_stage, workers=PIPELINE_EXTRACT_WORKERS, queue_size=PIPELINE_QUEUE_SIZE),
+        # the spacy model and the keyword matchers are global, so highlighting is never concurrent
+        pipeline.Stage("highlight", highlight_stage, queue_size=PIPELINE_QUEUE_SIZE),
+        pipeline.Stage("report", lambda job: report_stage(finish_stage(job)), queue_size=PIPELINE_QUEUE_SIZE),
+    ]
+    return pipeline.Pipeline(stages, on_error=report_stage_failure)
+
+
+def report_update_failure(job_id: str, error: Exception):
+    """Marks as failed a document whose status update was rejected by the API."""
+    message = f"Something went wrong for job id '{job_id}'. {error}"
+    update_document(job_id, APIStatus.FAILED, message=message, raise_failure=False)
+
+
+async def handle_document_async(document: Dict[str, Any],
+                                reporter: StatusReporter,
+                                executor: Executor):
+    """Processes a document in the executor while its statuses are reported in the background."""
+    loop = asyncio.get_running_loop()
+    job_id = document.get("id", "not_found")
+    analysis = {}
+    journal = job_journal.get_journal()
+    done = None
+    try:
+        logger.info(f"Got document {all_keys_but(document, keys={'keywords'})}")
+        # like the synchronous loop, the document is locked before validation touches its file
+        if not await reporter.report(job_id, APIStatus.LOCKED, message="Processing..."):
+            # already reported as failed by report_update_failure
+            logger.error(f"Not processing job id '{job_id}', the API did not accept its status update.")
+            metrics.DOCUMENTS.inc(status=APIStatus.FAILED)
+            return
+        timings = Timings()
+        with timings.measure("validation"):
+            probe = await loop.run_in_executor(executor, validate_document, document)
+        if journal is not None:
+            journal.record(job_id, JournalStage.VALIDATED, {}, document=document)
+        if not await reporter.report(job_id, APIStatus.OCR_INPROGRESS, message="Doing AI analysis..."):
+            logger.error(f"Not processing job id '{job_id}', the API did not accept its status update.")
+            metrics.DOCUMENTS.inc(status=APIStatus.FAILED)
+            return
+        analysis = await loop.run_in_executor(
+            executor,
+            functools.partial(process, document, OUTPUT_PATH, dump_text=True, dump_json=DUMP_JSON,
+                              journal=journal, timings=timings, probe=probe),
+        )
+        logger.info(
+            f"Processing time took: {analysis[ResponseField.TIME]} seconds {analysis[ResponseField.STATISTICS]}"
+        )
+        done = reporter.report(job_id, APIStatus.OCR_DONE, analysis=analysis)
+    except Exception as e:
+        message = f"Something went wrong for job id '{job_id}'. "
+        logger.exception(message)
+        message += str(e)
+        reporter.report(
+            job_id, APIStatus.FAILED, message=message, raise_failure=False, analysis=analysis
+        )
+        metrics.DOCUMENTS.inc(status=APIStatus.FAILED)
+    finally:
+        if done is not None:
+            # the result is kept in the journal until it is uploaded, or reported as failed
+            done.add_done_callback(lambda sent: finish_upload(job_id, journal, sent.result()))
+        elif journal is not None:
+            journal.finish(job_id)
+
+
+def finish_upload(job_id: str, journal: Optional[JobJournal], sent: bool):
+    """Counts a document whose result was sent in the background and removes it from the journal."""
+    metrics.DOCUMENTS.inc(status=APIStatus.OCR_DONE if sent else APIStatus.FAILED)
+    if journal is not None:
+        journal.finish(job_id)
+
+
+def make_async_executor() -> Executor:
+    """Makes the executor processing the documents of the asyncio front end."""
+    if WORKER_SLOTS > 1:
+        return ProcessPoolExecutor(max_workers=WORKER_SLOTS, mp_context=multiprocessing.get_context("fork"))
+    # process() relies on module level models, so documents are processed one at a time
+    return ThreadPoolExecutor(max_workers=1)
+
+
+async def poll_documents_async():
+    """Asyncio front end: claims documents, reports statuses and uploads results\
+    without blocking the processing, which runs in an executor.
+    """
+    loop = asyncio.get_running_loop()
+    # a broken pool loses all its processes, with the cores they had reserved
+    executor = RestartingExecutor(make_async_executor, on_restart=ocr_service.CPU_BUDGET.reset)
+    reporter = StatusReporter(update_document, on_error=report_update_failure)
+    reporter.start()
+    slots = asyncio.Semaphore(WORKER_SLOTS)
+    poller = DocumentPoller(get_next_documents, batch_size=CLAIM_BATCH_SIZE)
+    metrics.QUEUE_DEPTH.track(poller.queue_depth, queue="claimed")
+    backoff = Backoff(POLL_MIN_SLEEP, POLL_MAX_SLEEP)
+    input_status = "no_input_status"
+    while True:
+        await slots.acquire()
+        job_id = ""
+        try:
+            document = await loop.run_in_executor(None, poller.next_document)
+            last_input_status = input_status
+            input_status = document["status"]
+            job_id = document.get("id", "not_found")
+            if input_status in APIStatus.DOWNLOADED:
+                backoff.reset()
+                task = asyncio.create_task(handle_document_async(document, reporter, executor))
+                task.add_done_callback(lambda _: slots.release())
+                continue
+            slots.release()
+            if input_status in {
+                APIStatus.OCR_DONE,
+                APIStatus.OCR_INPROGRESS,
+                APIStatus.LOCKED,
+            }:
+                message = f"Status of '{job_id}'' is '{input_status}'. Sleeping for {POLL_MIN_SLEEP} seconds..."
+                logger.info(message)
+                reporter.report(job_id, APIStatus.FAILED, message=message)
+                backoff.reset()
+                await asyncio.sleep(POLL_MIN_SLEEP)
+            else:
+                if input_status != last_input_status:
+                    logger.info(
+                        f"Next document status is '{input_status}'. Assuming no more documents to process."
+                        f" Polling every {POLL_MIN_SLEEP} to {POLL_MAX_SLEEP} seconds."
+                    )
+                await asyncio.sleep(backoff.next_delay())
+        except Exception as e:
+            slots.release()
+            message = f"Something went wrong for job id '{job_id}'. "
+            logger.exception(message)
+            message += str(e)
+            if job_id:
+                reporter.report(job_id, APIStatus.FAILED, message=message, raise_failure=False)
+            await asyncio.sleep(backoff.next_delay())
+
+
+def main():
+    """Main function of the worker."""
+    init()
+    if METRICS_PORT:
+        metrics.start_server(METRICS_HOST, METRICS_PORT)
+    warm_up()
+    resume_unfinished_documents()
+    pool_mode = WORKER_SLOTS > 1 and not ASYNC_FRONTEND
+    if OCR_IN_PROCESS and not pool_mode:
+        # in pool mode every slot starts its own engine
+        ocr_service.get_engine()
+    if pool_mode:
+        logger.info(f"Running in pool mode with {WORKER_SLOTS} document slots.")
+        pool = worker_pool.WorkerPool(
+            WORKER_SLOTS, warm_up=ocr_service.get_engine if OCR_IN_PROCESS else None, on_crash=report_crash
+        )
+        metrics.QUEUE_DEPTH.track(lambda: len(pool.in_flight), queue="in_flight")
+        poll_documents(lambda document: pool.submit(handle_document, document),
+                       wait_for_slot=pool.wait_for_slot)
+    elif ASYNC_FRONTEND:
+        logger.info(f"Running the asyncio front end with {WORKER_SLOTS} document slots.")
+        asyncio.run(poll_documents_async())
+    elif PIPELINE:
+        logger.info("Running in pipeline mode.")
+        stages = make_pipeline()
+        for stage in stages.stages:
+            metrics.QUEUE_DEPTH.track(stage.queue.qsize, queue=stage.name)
+        stages.start()
+        poll_documents(
+            lambda document: stages.submit(
+                make_job(document, OUTPUT_PATH, dump_text=True, dump_json=DUMP_JSON)
+            ),
+            wait_for_slot=stages.wait_for_capacity,
+        )
+    else:
+        poll_documents(handle_document_serially)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,61 @@
+"""Compare the speed of the Cleaner with the reference line by line implementation.
+
+Usage: python scripts/benchmark_cleaner.py [file.pdf|file.txt ...] [--repeat N]
+Without files, the text of the PDF files in nlp/documents is used.
+"""
+import argparse
+import os
+import sys
+import time
+
+import fitz
+
+sys.path.insert(0, os.path.abspath("."))
+sys.path.insert(0, os.path.abspath("tests/tests_app"))
+
+from app.services.text_processing import Cleaner  # noqa: E402
+from reference_cleaner import ReferenceCleaner  # noqa: E402
+
+DOC_DIR = "nlp/documents"
+
+
+def read_text(path):
+    if not path.endswith(".pdf"):
+        with open(path, encoding="utf-8") as fin:
+            return fin.read()
+    try:
+        with fitz.open(path) as pdf:
+            return "".join(page.get_text() for page in pdf)
+    except (RuntimeError, ValueError):
+        return ""
+
+
+def best_time(function, text, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(text)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("files", nargs="*")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=50, help="times the text is repeated, to time larger documents")
+    args = parser.parse_args()
+    files = args.files or [os.path.join(DOC_DIR, name) for name in sorted(os.listdir(DOC_DIR)) if name.endswith(".pdf")]
+    text = "".join(read_text(path) for path in files) * args.scale
+    reference, cleaner = ReferenceCleaner(), Cleaner()
+    assert cleaner.clean(text) == reference.clean(text), "outputs differ"
+    reference_time = best_time(reference.clean, text, args.repeat)
+    cleaner_time = best_time(cleaner.clean, text, args.repeat)
+    print(f"{len(text)} characters, {text.count(chr(10))} lines")
+    print(f"reference: {reference_time:.4f}s")
+    print(f"cleaner:   {cleaner_time:.4f}s")
+    print(f"speedup:   {reference_time / cleaner_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+"""Compile the normalized vocabulary used for quality estimation to VOCABULARY_CACHE_PATH.
+
+Usage: python scripts/build_vocabulary.py
+Workers compile it on their first start otherwise; the file is named after the
+word sources and the stemmer, so it is rebuilt when any of them changes.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath("."))
+
+from app.config import VOCABULARY_CACHE_PATH  # noqa: E402
+
+if __name__ == "__main__":
+    if not VOCABULARY_CACHE_PATH:
+        sys.exit("VOCABULARY_CACHE_PATH is empty, the vocabulary cache is disabled")
+    from app.services import ocr_evaluation
+
+    print(f"{len(ocr_evaluation.get_vocabulary_words())} words in {ocr_evaluation.vocabulary_file()}")
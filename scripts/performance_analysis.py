@@ -41,6 +41,13 @@ print(f"\tAverage processing time per page: {round(seconds_per_page.mean(), 2)}
 K=30
 print(f'\tTop {K} longest processing times:')
 print(df.iloc[df.processing_time.argsort()[::-1]][:K])
+time_columns = [column for column in df.columns if column.startswith('time_')]
+if time_columns:
+    print('\tAverage time per page of each step:')
+    steps = df[time_columns].fillna(0).div(df['num_pages'], axis=0).mean()
+    share = df[time_columns].fillna(0).sum() / df['processing_time'].sum() * 100
+    print(pd.DataFrame({'seconds_per_page': steps.round(3), 'percent': share.round(1)})
+          .sort_values('seconds_per_page', ascending=False))
 
 
 print('\n\n')
@@ -3,8 +3,16 @@ import os
 import logging
 import pytest
 from tests.util import get_next_document_mock
+from app.constants import JobField
+from app.services import ocr_evaluation, ocr_service
+from app.services.job_journal import JobJournal
 from ocr_worker import (process,
+                        make_job,
+                        record_stage,
+                        probe_rotation,
+                        remove_ocr_output,
                         validate_document,
+                        payload_tiers,
                         safe_make_dirs,
                         shorten_analysis)
 
@@ -40,6 +48,15 @@ def test_normal_pdf():
     LOGGER.info(analysis['statistics'])
 
 
+def test_timings_pdf():
+    analysis = pipeline('normal.pdf')
+    timings = analysis['statistics']['timings']
+    for step in ['ocr', 'text_extraction', 'cleaning', 'quality_estimation',
+                 'spacy_parsing', 'matching', 'annotation', 'pdf_save']:
+        assert step in timings
+    assert sum(timings.values()) <= analysis['processing_time']
+
+
 def test_naturally_occuring_kwds_pdf():
     analysis = pipeline('kwds.pdf')
     LOGGER.info(analysis['statistics'])
@@ -77,12 +94,49 @@ def test_rotated_pdf():
     assert analysis['ocr_quality'] > 90
 
 
+def test_page_qualities_pdf(monkeypatch):
+    from app.services import ocr_service
+    monkeypatch.setattr(ocr_service, "OCR_CONFIDENCE_QUALITY", True)
+    analysis = pipeline("rotated.pdf")
+    statistics = analysis['statistics']
+    assert len(statistics['page_qualities']) == statistics['num_pages']
+    assert all(quality is None or 0 <= quality <= 100 for quality in statistics['page_qualities'])
+
+
 def test_heavily_rotated_pdf(caplog):
     analysis = pipeline("heavily_rotated.pdf")  # "rotated.pdf")
     assert analysis['ocr_quality'] > 90
     assert "Forcing page rotation" in caplog.text
 
 
+def test_rotation_probe(tmp_path):
+    input_file = os.path.join(DOC_DIR, "heavily_rotated.pdf")
+    ocr_output = str(tmp_path / "heavily_rotated_ocr.pdf")
+    force_rotate, sample, probe_output = probe_rotation(input_file, [0, 1, 2, 3], ocr_output)
+    assert force_rotate is True
+    assert sample == [0, 1, 2, 3]
+    # only the output with forced rotation is kept, to be spliced into the OCR output
+    assert os.listdir(tmp_path) == [os.path.basename(probe_output)]
+    remove_ocr_output(probe_output)
+    assert os.listdir(tmp_path) == []
+
+
+def test_resumed_job_keeps_its_decisions(tmp_path):
+    journal = JobJournal(str(tmp_path / "journal"))
+    document = {"id": "1", "storagePath": "input.pdf"}
+    job = make_job(document, str(tmp_path), journal=journal)
+    job[JobField.FORCE_ROTATE] = True
+    job[JobField.PAGE_KINDS] = {"scanned": 2}
+    job[JobField.CACHE_KEY] = "key"
+    record_stage(job, "ocr_done", document=document)
+    [entry] = journal.unfinished()
+    resumed = make_job(document, str(tmp_path), journal=journal, resume=entry)
+    assert resumed[JobField.FORCE_ROTATE] is True
+    assert resumed[JobField.PAGE_KINDS] == {"scanned": 2}
+    assert resumed[JobField.CACHE_KEY] == "key"
+    assert resumed[JobField.COMPLETED] == ["ocr_done"]
+
+
 def test_digitally_signed_pdf():
     analysis = pipeline("digitally_signed.pdf")
     assert len(analysis['text']) > 100
@@ -108,3 +162,30 @@ def test_shorten_analysis():
     analysis = shorten_analysis(analysis)
     assert len(analysis['text']) < orig_len
     LOGGER.info(analysis['statistics'])
+
+
+def test_payload_tiers():
+    analysis = pipeline('normal.pdf')
+    body = {'analysis': analysis}
+    tiers = payload_tiers(body)
+    assert next(tiers) == ('full', body)
+    tier, summarized = next(tiers)
+    assert tier == 'summarized'
+    assert len(summarized['analysis']['text']) < len(analysis['text'])
+    assert summarized['analysis']['highlight_metadata'] == analysis['highlight_metadata']
+    tier, minimal = next(tiers)
+    assert tier == 'minimal'
+    assert minimal['analysis']['highlight_metadata'] == []
+    assert minimal['analysis']['text'] == summarized['analysis']['text']
+
+
+def test_sampled_quality():
+    pages = list(ocr_service.iter_clean_pages(os.path.join(DOC_DIR, "keywords.pdf"))) * 40
+    quality, _ = ocr_evaluation.estimate_pages_quality(pages)
+    sample = ocr_evaluation.sample_quality(pages, sample_size=20)
+    assert sample.scored_pages == 20
+    assert sample.low <= quality <= sample.high
+    confidences = [{"words": 10, "confidence": 90.0} if page % 2 else None for page in range(len(pages))]
+    quality, _ = ocr_evaluation.estimate_pages_quality(pages, confidences)
+    sample = ocr_evaluation.sample_quality(pages, confidences, sample_size=len(pages))
+    assert sample.low == sample.quality == sample.high == quality
@@ -66,7 +66,10 @@ def run_performance_test(input_dir, out_dir, analysis_file='perf_analysis_defaul
                     item["avg_number_of_occ"] = np.mean(
                         [len(a["occs"]) for a in analysis["highlight_metadata"]]
                     )
-                    item.update(analysis["statistics"])
+                    statistics = dict(analysis["statistics"])
+                    for step, seconds in statistics.pop("timings", {}).items():
+                        item[f"time_{step}"] = seconds
+                    item.update(statistics)
                 except Exception as e:
                     item["corpus"] = os.path.basename(corpus)
                     item["law"] = law
@@ -0,0 +1,39 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.services import api_client
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        self.requests.append((self.client_address, json.loads(data)))
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+def test_compressed_posts_reuse_the_connection():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RecordingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    endpoint = f"http://127.0.0.1:{server.server_port}/ocr-updates"
+    try:
+        body = {"id": "1", "analysis": {"text": "lorem ipsum " * 1000}}
+        for _ in range(3):
+            response = api_client.post_json(endpoint, body, compress=True)
+            assert response.status_code == 200
+    finally:
+        server.shutdown()
+    assert [request[1] for request in RecordingHandler.requests] == [body] * 3
+    assert len(set(request[0] for request in RecordingHandler.requests)) == 1
@@ -0,0 +1,123 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from app.services.async_frontend import RestartingExecutor, StatusReporter
+
+
+def test_updates_are_coalesced_and_ordered():
+    sent = []
+    gate = threading.Event()
+
+    def send(job_id, status, **kwargs):
+        if status == "first":
+            gate.wait(1)
+        sent.append((job_id, status))
+
+    async def scenario():
+        reporter = StatusReporter(send, concurrency=2)
+        reporter.start()
+        reporter.report("a", "first")
+        await asyncio.sleep(0.05)
+        # "a" is being sent, so these wait; only the repeated status is coalesced
+        reporter.report("a", "locked")
+        reporter.report("a", "ocr_in_progress", message="first")
+        reporter.report("a", "ocr_in_progress", message="second")
+        reporter.report("b", "locked")
+        await asyncio.sleep(0.05)
+        gate.set()
+        await reporter.stop()
+        return reporter.coalesced
+
+    coalesced = asyncio.run(scenario())
+    assert coalesced == 1
+    assert [status for job_id, status in sent if job_id == "a"] == ["first", "locked", "ocr_in_progress"]
+    assert ("b", "locked") in sent
+
+
+def test_failed_updates_are_reported():
+    errors = []
+
+    def send(job_id, status, **kwargs):
+        time.sleep(0.01)
+        raise ValueError(status)
+
+    async def scenario():
+        reporter = StatusReporter(send, on_error=lambda job_id, error: errors.append((job_id, str(error))))
+        reporter.start()
+        reporter.report("a", "ocr_done")
+        await reporter.stop()
+
+    asyncio.run(scenario())
+    assert errors == [("a", "ocr_done")]
+
+
+def test_report_tells_whether_the_update_was_sent():
+    def send(job_id, status, **kwargs):
+        time.sleep(0.01)
+        if status == "ocr_done":
+            raise ValueError(status)
+
+    async def scenario():
+        reporter = StatusReporter(send)
+        reporter.start()
+        locked = reporter.report("a", "locked")
+        in_progress = reporter.report("a", "ocr_in_progress")
+        done = reporter.report("b", "ocr_done")
+        results = await asyncio.gather(locked, in_progress, done)
+        await reporter.stop()
+        return results
+
+    assert asyncio.run(scenario()) == [True, True, False]
+
+
+def test_locked_is_sent_while_the_senders_are_busy():
+    sent = []
+    gate = threading.Event()
+
+    def send(job_id, status, **kwargs):
+        if status == "ocr_done":
+            gate.wait(1)
+        sent.append((job_id, status))
+
+    async def scenario():
+        reporter = StatusReporter(send, concurrency=2)
+        reporter.start()
+        # large uploads keep both senders busy
+        reporter.report("a", "ocr_done")
+        reporter.report("b", "ocr_done")
+        await asyncio.sleep(0.05)
+        locked = reporter.report("c", "locked")
+        in_progress = reporter.report("c", "ocr_in_progress")
+        await asyncio.sleep(0.05)
+        gate.set()
+        results = await asyncio.gather(locked, in_progress)
+        await reporter.stop()
+        return results, reporter.coalesced
+
+    results, coalesced = asyncio.run(scenario())
+    assert results == [True, True]
+    assert coalesced == 0
+    assert [status for job_id, status in sent if job_id == "c"] == ["locked", "ocr_in_progress"]
+
+
+def test_restarting_executor_replaces_a_broken_pool():
+    restarts = []
+
+    def make_executor():
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork"))
+
+    executor = RestartingExecutor(make_executor, on_restart=lambda: restarts.append(True))
+    try:
+        with pytest.raises(BrokenProcessPool):
+            executor.submit(os._exit, 1).result()
+        assert executor.submit(pow, 2, 3).result() == 8
+        assert restarts == [True]
+    finally:
+        executor.shutdown()
@@ -0,0 +1,64 @@
+import os
+import random
+
+import fitz
+import pytest
+from reference_cleaner import ReferenceCleaner
+
+from app.services.text_processing import Cleaner
+
+DOC_DIR = "nlp/documents"
+
+# characters and fragments that trigger every rule of the cleaner
+ALPHABET = list("abcdeăâîșțşţŞŢ ABC  019,./-<>@:wwhtp()|│─■•~­–—֊ºÃ¢\t") + [
+    "www", "http", "( ă)", "ab@cd.ro", "- ", "/ ", ", ", "1, 4%", "S- ar",
+]
+
+
+def page_texts(path):
+    """Text of each page, extracted like the OCR output."""
+    with fitz.open(path) as pdf:
+        for page in pdf:
+            blocks = page.get_text(option="blocks", flags=fitz.TEXTFLAGS_SEARCH)
+            yield "\n".join([block[4].replace("\n", " ") for block in blocks]) + "\n"
+
+
+def fixtures():
+    for name in sorted(os.listdir(DOC_DIR)):
+        path = os.path.join(DOC_DIR, name)
+        if not name.endswith(".pdf"):
+            continue
+        try:
+            texts = list(page_texts(path))
+        except (RuntimeError, ValueError):
+            continue
+        if "".join(texts).strip():
+            yield name, texts
+
+
+@pytest.mark.parametrize("name, texts", list(fixtures()))
+def test_same_output_as_reference_on_documents(name, texts):
+    text = "".join(texts)
+    assert Cleaner().clean(text) == ReferenceCleaner().clean(text)
+    assert "".join(Cleaner().clean_pages(texts)) == ReferenceCleaner().clean(text)
+
+
+def test_same_output_and_stats_as_reference_on_random_text(caplog):
+    caplog.set_level("INFO")
+    rng = random.Random(0)
+    reference, cleaner = ReferenceCleaner(), Cleaner()
+    for _ in range(2000):
+        text = "\n".join(
+            "".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 60))) for _ in range(rng.randint(1, 6))
+        )
+        caplog.clear()
+        assert cleaner.clean(text) == reference.clean(text), text
+        assert caplog.messages[0] == caplog.messages[1]
+
+
+def test_add_stats():
+    stats = {name: [1, 10] for name in Cleaner.SKIPPED_STATS}
+    stats.update(total_original_length=100, total_clean_length=50)
+    total = Cleaner().add_stats(stats, stats)
+    assert total["skipped_alpha_count"] == [2, 20]
+    assert total["total_clean_length"] == 100
@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+from app.services.confidence_plugin import (hocr_word_confidences,
+                                            page_index,
+                                            read_page_confidences,
+                                            record_page_confidences,
+                                            summarize_confidences)
+
+HOCR = """
+<div class='ocr_page' id='page_1' title='image "000002_ocr.png"; bbox 0 0 100 100; ppageno 0'>
+ <span class='ocr_line' id='line_1_1' title="bbox 10 10 90 20; baseline 0 0; x_size 10">
+  <span class='ocrx_word' id='word_1_1' title='bbox 10 10 40 20; x_wconf 91'>Tribunalul</span>
+  <span class='ocrx_word' id='word_1_2' title='bbox 50 10 90 20; x_wconf 64'>Bucure&#537;ti</span>
+ </span>
+</div>
+"""
+
+
+def test_hocr_word_confidences():
+    assert hocr_word_confidences(HOCR) == [91, 64]
+    assert hocr_word_confidences("<div class='ocr_page'></div>") == []
+
+
+def test_summarize_confidences():
+    assert summarize_confidences([91, 64]) == {"words": 2, "confidence": 77.5}
+    assert summarize_confidences([]) == {"words": 0, "confidence": None}
+
+
+def test_record_and_read_page_confidences(tmp_path):
+    assert page_index(tmp_path / "000002_ocr.png") == 1
+    options = SimpleNamespace(confidence_dir=str(tmp_path))
+    record_page_confidences(tmp_path / "000002_ocr.png", HOCR, options)
+    record_page_confidences(tmp_path / "000003_ocr.png", "", options)
+    assert read_page_confidences(str(tmp_path), 4) == [
+        None, {"words": 2, "confidence": 77.5}, {"words": 0, "confidence": None}, None
+    ]
+
+
+def test_record_page_confidences_disabled(tmp_path):
+    record_page_confidences(tmp_path / "000001_ocr.png", HOCR, SimpleNamespace(confidence_dir=None))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,74 @@
+import multiprocessing
+import os
+import threading
+
+from app.services import cpu_budget
+from app.services.cpu_budget import CpuBudget, cgroup_cpu_quota
+
+
+def test_cgroup_quota(tmp_path):
+    cpu_max = tmp_path / "cpu.max"
+    cpu_max.write_text("250000 100000\n")
+    assert cgroup_cpu_quota(str(cpu_max)) == 2.5
+    cpu_max.write_text("max 100000\n")
+    assert cgroup_cpu_quota(str(cpu_max)) is None
+    quota, period = tmp_path / "quota", tmp_path / "period"
+    quota.write_text("200000")
+    period.write_text("100000")
+    assert cgroup_cpu_quota(str(tmp_path / "missing"), str(quota), str(period)) == 2
+    quota.write_text("-1")
+    assert cgroup_cpu_quota(str(tmp_path / "missing"), str(quota), str(period)) is None
+
+
+def test_budget_is_shared_fairly():
+    budget = CpuBudget(4)
+    assert budget.acquire(2) == 2
+    # two documents share the budget, so the second gets at most half of it
+    assert budget.acquire(10) == 2
+    assert budget.free.value == 0
+    taken = []
+    waiting = threading.Thread(target=lambda: taken.append(budget.acquire(3)))
+    waiting.start()
+    waiting.join(0.1)
+    assert not taken
+    budget.release(2)
+    waiting.join(1)
+    assert taken == [2]
+    budget.reset()
+    assert budget.free.value == 4
+    with budget.reserve(8) as cores:
+        assert cores == 4
+    assert budget.free.value == 4
+
+
+def test_releases_before_a_reset_are_ignored():
+    budget = CpuBudget(4)
+    with budget.reserve(4):
+        budget.reset()
+        with budget.reserve(4) as cores:
+            assert cores == 4
+        assert budget.free.value == 4
+    # the reservation made before the reset is not given back twice
+    assert budget.free.value == 4
+    assert budget.users.value == 0
+    budget.release(3)
+    assert budget.free.value == 4
+    assert budget.users.value == 0
+
+
+def test_reset_after_a_process_died_holding_the_lock(monkeypatch):
+    monkeypatch.setattr(cpu_budget, "RESET_LOCK_TIMEOUT", 0.1)
+    budget = CpuBudget(2)
+    budget.acquire(2)
+
+    def die_holding_the_lock():
+        budget.condition.acquire()
+        os._exit(1)
+
+    process = multiprocessing.get_context("fork").Process(target=die_holding_the_lock)
+    process.start()
+    process.join()
+    budget.reset()
+    with budget.reserve(2) as cores:
+        assert cores == 2
+    assert budget.free.value == 2
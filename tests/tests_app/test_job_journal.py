@@ -0,0 +1,56 @@
+import os
+
+from app.services.job_journal import JobJournal
+
+
+def test_journal_replays_stages(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    document = {"id": "doc/1", "status": "downloaded"}
+    journal.record("doc/1", "validated", {}, document=document)
+    journal.record("doc/1", "ocr_done", {"ocr_file": "a.pdf"})
+    [job] = journal.unfinished()
+    assert job["document"] == document
+    assert job["stages"] == ["validated", "ocr_done"]
+    assert job["analysis"] == {"ocr_file": "a.pdf"}
+    assert job["attempts"] == 1
+    journal.finish("doc/1")
+    assert journal.unfinished() == []
+
+
+def test_journal_ignores_truncated_entry(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record("1", "validated", {}, document={"id": "1"})
+    with open(journal.path("1"), "a", encoding="utf-8") as fout:
+        fout.write('{"stage": "ocr_do')
+    [job] = journal.unfinished()
+    assert job["stages"] == ["validated"]
+
+
+def test_journal_drops_files_without_document(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    with open(journal.path("1"), "w", encoding="utf-8") as fout:
+        fout.write('{"stage": "valid')
+    assert journal.unfinished() == []
+    assert not os.listdir(str(tmp_path))
+
+
+def test_journal_counts_attempts(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record("1", "validated", {}, document={"id": "1"})
+    journal.record_attempt("1")
+    journal.record("1", "ocr_done", {})
+    journal.record_attempt("1")
+    [job] = journal.unfinished()
+    assert job["attempts"] == 3
+    assert job["stages"] == ["validated", "ocr_done"]
+
+
+def test_journal_replays_the_last_state(tmp_path):
+    journal = JobJournal(str(tmp_path))
+    journal.record("1", "validated", {}, document={"id": "1"})
+    [job] = journal.unfinished()
+    assert job["state"] == {}
+    journal.record("1", "ocr_done", {}, state={"force_rotate": True, "page_kinds": {"scanned": 3}})
+    journal.record("1", "text_extracted", {}, state={"force_rotate": True, "page_qualities": [90.0]})
+    [job] = journal.unfinished()
+    assert job["state"] == {"force_rotate": True, "page_qualities": [90.0]}
@@ -0,0 +1,52 @@
+import multiprocessing
+import time
+import urllib.request
+
+from app.services.metrics import Registry, start_server, process_uptime, REGISTRY, DOCUMENTS
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    documents = registry.counter("documents_total", "Documents.", ["status"])
+    seconds = registry.histogram("step_seconds", "Steps.", ["step"], buckets=(1, 10))
+    depth = registry.gauge("queue_depth", "Queue.")
+    documents.inc(status="ocr_done")
+    documents.inc(2, status="ocr_done")
+    seconds.observe(0.5, step="ocr")
+    seconds.observe(5, step="ocr")
+    depth.track(lambda: 3)
+    text = registry.render()
+    assert '# TYPE documents_total counter' in text
+    assert 'documents_total{status="ocr_done"} 3.0' in text
+    assert 'step_seconds_bucket{step="ocr",le="1.0"} 1.0' in text
+    assert 'step_seconds_bucket{step="ocr",le="+Inf"} 2.0' in text
+    assert 'step_seconds_sum{step="ocr"} 5.5' in text
+    assert 'queue_depth 3.0' in text
+
+
+def _process_document():
+    DOCUMENTS.inc(status="failed")
+
+
+def test_server_collects_forked_processes():
+    server = start_server("127.0.0.1", 0)
+    try:
+        process = multiprocessing.get_context("fork").Process(target=_process_document)
+        process.start()
+        process.join()
+        for _ in range(50):
+            text = urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics").read().decode()
+            if 'ocr_documents_total{status="failed"}' in text:
+                break
+            time.sleep(0.05)
+        assert 'ocr_documents_total{status="failed"} 1.0' in text
+        assert "ocr_resident_memory_bytes" in text
+    finally:
+        server.shutdown()
+        REGISTRY.metrics["ocr_documents_total"].values.clear()
+
+
+def test_process_uptime():
+    first = process_uptime()
+    time.sleep(0.05)
+    assert 0 <= first < process_uptime()
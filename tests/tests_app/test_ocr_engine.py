@@ -0,0 +1,85 @@
+import os
+import shutil
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import fitz
+import pytest
+
+from app.services import ocr_engine
+from app.services.ocr_engine import OcrEngine
+
+
+def crash_once(input_file, output_file, options):
+    """Kills the engine process on the first call, copies the input afterwards."""
+    try:
+        os.close(os.open(options["marker"], os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        shutil.copyfile(input_file, output_file)
+        return 0
+    os._exit(1)
+
+
+@pytest.mark.skipif(shutil.which("tesseract") is None, reason="ocrmypdf needs the tesseract binary")
+def test_engine_reuses_processes(tmp_path):
+    in_file = str(tmp_path / "input.pdf")
+    with fitz.open() as pdf:
+        pdf.new_page().insert_text((72, 72), "Text generat digital")
+        pdf.save(in_file)
+    engine = OcrEngine(workers=1)
+    engine.start()
+    try:
+        pids = set()
+        for index in range(2):
+            output = str(tmp_path / f"output_{index}.pdf")
+            assert engine.run(in_file, output, skip_text=True, output_type="pdf", progress_bar=False) == 0
+            with fitz.open(output) as pdf:
+                assert "Text generat digital" in pdf[0].get_text()
+            pids.update(engine.executor._processes)
+        assert len(pids) == 1
+    finally:
+        engine.shutdown()
+
+
+def test_engine_raises_ocr_errors(tmp_path):
+    engine = OcrEngine(workers=1)
+    try:
+        with pytest.raises(Exception):
+            engine.run(str(tmp_path / "missing.pdf"), str(tmp_path / "output.pdf"), output_type="pdf")
+    finally:
+        engine.shutdown()
+
+
+def test_engine_restarts_after_a_crash(tmp_path):
+    engine = OcrEngine(workers=1)
+    engine.start()
+    try:
+        crashed = set(engine.executor._processes)
+        for pid in crashed:
+            os.kill(pid, signal.SIGKILL)
+        # the error of ocrmypdf, raised by the restarted engine, not the broken pool
+        with pytest.raises(Exception) as error:
+            engine.run(str(tmp_path / "missing.pdf"), str(tmp_path / "output.pdf"), output_type="pdf")
+        assert not isinstance(error.value, BrokenProcessPool)
+        assert crashed.isdisjoint(engine.executor._processes)
+    finally:
+        engine.shutdown()
+
+
+def test_concurrent_runs_restart_the_engine_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocr_engine, "_run_ocr", crash_once)
+    in_file = tmp_path / "input.pdf"
+    in_file.write_bytes(b"%PDF")
+    engine = OcrEngine(workers=2)
+    try:
+        with ThreadPoolExecutor(max_workers=4) as threads:
+            codes = list(threads.map(
+                lambda index: engine.run(str(in_file), str(tmp_path / f"output_{index}.pdf"),
+                                         marker=str(tmp_path / "crashed")),
+                range(4),
+            ))
+        assert codes == [0] * 4
+        assert engine.restarts == 1
+    finally:
+        engine.shutdown()
@@ -0,0 +1,52 @@
+import os
+
+import nltk
+import pytest
+
+from app.services import ocr_evaluation
+from app.services.ocr_evaluation import (NORMALIZATION_CACHES, check_word,
+                                         normalize_word,
+                                         report_normalization_caches,
+                                         wer_counts)
+from nlp.resources.constants import VOCAB_PATH
+
+
+def vocabulary_installed():
+    """Whether the dictionary heuristic can run: the vocabulary and the NLTK data are installed."""
+    try:
+        for path in ocr_evaluation.NLTK_DATA:
+            nltk.data.find(path)
+    except LookupError:
+        return False
+    return os.path.exists(VOCAB_PATH)
+
+
+@pytest.fixture
+def empty_caches():
+    for cache in NORMALIZATION_CACHES.values():
+        cache.cache_clear()
+    report_normalization_caches()
+
+
+def test_normalization_caches(empty_caches):
+    words = ["tribunalul", "cererea", "tribunalul", "cererea", "apelul"]
+    for word in words:
+        assert normalize_word(word) == normalize_word.__wrapped__(word)
+    hit_rates = report_normalization_caches()
+    assert hit_rates["normalize_word"] == 0.4
+    assert "check_word" not in hit_rates
+    for cache in NORMALIZATION_CACHES.values():
+        cache.cache_clear()
+    normalize_word("tribunalul")
+    normalize_word("tribunalul")
+    assert report_normalization_caches()["normalize_word"] == 0.5
+
+
+@pytest.mark.skipif(not vocabulary_installed(), reason="the dictionary heuristic needs the vocabulary and NLTK data")
+def test_word_checks_are_cached(empty_caches):
+    text = "Tribunalul București a admis cererea. Tribunalul a respins apelul din 2020 , cererea xqzw."
+    counts = wer_counts(text)
+    assert wer_counts(text) == counts
+    for word in text.lower().split():
+        assert check_word(word) == check_word.__wrapped__(word)
+    assert report_normalization_caches()["check_word"] > 0.5
@@ -0,0 +1,41 @@
+import os
+import shutil
+
+import fitz
+
+from app.services import ocr_engine, ocr_service
+from app.services.ocr_engine import OcrEngine
+
+
+def crash_first_shard(input_file, output_file, options):
+    """Kills the engine process OCRing the first shard to arrive, copies the shards afterwards."""
+    try:
+        os.close(os.open(os.path.join(os.path.dirname(output_file), "crashed"), os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        shutil.copyfile(input_file, output_file)
+        return 0
+    os._exit(1)
+
+
+def test_sharded_ocr_survives_an_engine_crash(tmp_path, monkeypatch):
+    in_file = str(tmp_path / "input.pdf")
+    with fitz.open() as pdf:
+        for number in range(7):
+            pdf.new_page().insert_text((72, 72), f"pagina {number}")
+        pdf.save(in_file)
+    engine = OcrEngine(workers=2)
+    monkeypatch.setattr(ocr_engine, "_run_ocr", crash_first_shard)
+    monkeypatch.setattr(ocr_service, "get_engine", lambda: engine)
+    # the fake engine needs no Tesseract language
+    monkeypatch.setattr(ocr_service, "get_ocr_language", lambda: "ron")
+    monkeypatch.setattr(ocr_service, "OCR_IN_PROCESS", True)
+    monkeypatch.setattr(ocr_service, "OCR_SHARD_SIZE", 2)
+    monkeypatch.setattr(ocr_service, "OCR_SHARD_WORKERS", 4)
+    output = str(tmp_path / "output.pdf")
+    try:
+        ocr_service.call_ocr_sharded(in_file, output, force_rotate=False, num_pages=7, jobs=4)
+    finally:
+        engine.shutdown()
+    assert engine.restarts == 1
+    with fitz.open(output) as pdf:
+        assert [page.get_text().strip() for page in pdf] == [f"pagina {number}" for number in range(7)]
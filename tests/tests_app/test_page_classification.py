@@ -0,0 +1,46 @@
+import fitz
+
+from app.constants import PageKind
+from app.services.page_classification import (classify_pages, count_kinds,
+                                              pages_to_ocr, sample_pages,
+                                              stratified_sample)
+
+
+def make_pixmap_png():
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 20, 20), False)
+    pixmap.clear_with(200)
+    return pixmap.tobytes("png")
+
+
+def test_classify_pages(tmp_path):
+    path = str(tmp_path / "mixed.pdf")
+    image = make_pixmap_png()
+    with fitz.open() as pdf:
+        pdf.new_page().insert_text((72, 72), "Text generat digital")
+        pdf.new_page().insert_image(fitz.Rect(0, 0, 300, 300), stream=image)
+        page = pdf.new_page()
+        page.insert_text((72, 72), "Text si imagine")
+        page.insert_image(fitz.Rect(100, 100, 200, 200), stream=image)
+        pdf.new_page()
+        pdf.save(path)
+    kinds = classify_pages(path)
+    assert kinds == [PageKind.TEXT, PageKind.IMAGE, PageKind.MIXED, PageKind.EMPTY]
+    assert pages_to_ocr(kinds) == [1]
+    assert count_kinds(kinds) == {"text": 1, "image": 1, "mixed": 1, "empty": 1}
+
+
+def test_sample_pages():
+    assert sample_pages([2, 5, 7], 5) == [2, 5, 7]
+    sample = sample_pages(list(range(100)), 5)
+    assert len(sample) == 5
+    assert sample[0] == 0 and sample[-1] == 99
+    assert sample == sorted(set(sample))
+    assert sample_pages(list(range(100)), 5) == sample
+    assert sample_pages(list(range(100)), 1) == [0, 99]
+
+
+def test_stratified_sample():
+    assert stratified_sample([2, 5, 7], 5) == [2, 5, 7]
+    sample = stratified_sample(list(range(100)), 10)
+    assert [page // 10 for page in sample] == list(range(10))
+    assert stratified_sample(list(range(100)), 10) == sample
@@ -0,0 +1,108 @@
+import os
+
+import nltk
+import pytest
+
+from app.services import ocr_evaluation, ocr_service
+from app.services.ocr_evaluation import QualityEstimator
+from app.services.parallel_text import chunks, clean_and_estimate
+from app.services.text_processing import Cleaner
+from nlp.resources.constants import VOCAB_PATH
+
+PAGES = [
+    f"Pagina {number} a hotărârii Tribunalului Bucureşti\nscurt\nwww.just.ro pentru detalii suplimentare\n"
+    for number in range(23)
+] + ["", "Ultima pagina a dosarului civil\n"]
+
+
+def vocabulary_installed():
+    """Whether the dictionary heuristic can run: the vocabulary and the NLTK data are installed."""
+    try:
+        for path in ocr_evaluation.NLTK_DATA:
+            nltk.data.find(path)
+    except LookupError:
+        return False
+    return os.path.exists(VOCAB_PATH)
+
+
+class LengthEstimator:
+    """Stands for the quality estimator, whose vocabulary is not available in the unit tests."""
+
+    def __init__(self, confidences=None):
+        self.confidences = confidences
+        self.pages = []
+
+    def add_page(self, text):
+        confidence = self.confidences[len(self.pages)] if self.confidences else None
+        self.pages.append((len(text), confidence))
+
+    def merge(self, other):
+        self.pages.extend(other.pages)
+
+
+def test_chunks():
+    assert list(chunks(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(chunks([], 3)) == []
+
+
+def test_same_results_as_serial(caplog):
+    caplog.set_level("INFO")
+    confidences = [{"words": number, "confidence": 90.0} for number in range(len(PAGES))]
+    serial = LengthEstimator(confidences)
+    serial_pages = list(Cleaner().clean_pages(PAGES))
+    serial_stats = caplog.messages[-1]
+    for page in serial_pages:
+        serial.add_page(page)
+
+    caplog.clear()
+    parallel = LengthEstimator(confidences)
+    parallel_pages = list(clean_and_estimate(iter(PAGES), parallel, workers=2, chunk_pages=4))
+    assert parallel_pages == serial_pages
+    assert parallel.pages == serial.pages
+    assert caplog.messages[-1] == serial_stats
+
+
+def test_clean_only():
+    pages = list(clean_and_estimate(iter(PAGES), None, workers=2, chunk_pages=4))
+    assert pages == list(Cleaner().clean_pages(PAGES))
+
+
+def test_quality_estimator_merge_with_confidences():
+    confidences = [{"words": number % 5, "confidence": 60.0 + number} for number in range(len(PAGES))]
+    serial = QualityEstimator(confidences)
+    for page in Cleaner().clean_pages(PAGES):
+        serial.add_page(page)
+    parallel = QualityEstimator(confidences)
+    list(clean_and_estimate(iter(PAGES), parallel, workers=3, chunk_pages=4))
+    assert parallel.quality == serial.quality
+    assert parallel.page_qualities == serial.page_qualities
+    assert parallel.page_words == serial.page_words
+
+
+def test_quality_estimator_merge_sums_counts_and_keeps_the_first_start():
+    first, second, third = QualityEstimator(), QualityEstimator(), QualityEstimator()
+    second.start, second.correct_chars, second.total_chars = "Pagina 2", 8, 10
+    second.correct_words, second.checked_words = 1, 2
+    second.page_qualities, second.page_words = [None, 80.0], [0, 2]
+    third.start, third.correct_chars, third.total_chars = "Pagina 3", 5, 5
+    third.correct_words, third.checked_words = 3, 4
+    third.page_qualities, third.page_words = [90.0], [4]
+    for other in (second, third):
+        first.merge(other)
+    assert first.start == "Pagina 2"
+    assert (first.correct_chars, first.total_chars) == (13, 15)
+    assert (first.correct_words, first.checked_words) == (4, 6)
+    assert first.page_qualities == [None, 80.0, 90.0]
+    assert first.page_words == [0, 2, 4]
+
+
+@pytest.mark.skipif(not vocabulary_installed(), reason="the dictionary heuristic needs the vocabulary and NLTK data")
+def test_parallel_quality_estimation():
+    pages = list(ocr_service.iter_page_texts_from_blocks(os.path.join("nlp/documents", "keywords.pdf"))) * 20
+    serial = QualityEstimator()
+    for page in Cleaner().clean_pages(pages):
+        serial.add_page(page)
+    parallel = QualityEstimator()
+    list(clean_and_estimate(pages, parallel, workers=3, chunk_pages=7))
+    assert parallel.quality == serial.quality
+    assert parallel.page_qualities == serial.page_qualities
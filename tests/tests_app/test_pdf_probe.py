@@ -0,0 +1,34 @@
+import fitz
+
+from app.constants import PageKind
+from app.services.pdf_probe import PdfProbe
+
+
+def test_probe_collects_facts(tmp_path):
+    path = str(tmp_path / "document.pdf")
+    with fitz.open() as pdf:
+        pdf.new_page().insert_text((72, 72), "Text generat digital")
+        pdf.new_page()
+        pdf.save(path)
+    probe = PdfProbe(path, classify=True)
+    assert probe.valid
+    assert probe.num_pages == 2
+    assert not probe.encrypted
+    assert not probe.signed
+    assert probe.file_size > 0
+    assert probe.page_kinds == [PageKind.TEXT, PageKind.EMPTY]
+    assert probe.text_coverage == 0.5
+    assert PdfProbe(path, classify=True, max_pages=1).page_kinds is None
+
+
+def test_probe_detects_encryption_and_invalid_files(tmp_path):
+    path = str(tmp_path / "encrypted.pdf")
+    with fitz.open() as pdf:
+        pdf.new_page().insert_text((72, 72), "Secret")
+        pdf.save(path, encryption=fitz.PDF_ENCRYPT_AES_256, owner_pw="owner", user_pw="")
+    probe = PdfProbe(path, classify=True)
+    assert probe.encrypted
+    assert probe.page_kinds is None
+    invalid = tmp_path / "invalid.pdf"
+    invalid.write_bytes(b"not a pdf")
+    assert not PdfProbe(str(invalid)).valid
@@ -0,0 +1,51 @@
+import fitz
+
+from app.services.pdf_shards import extract_pages, merge_pdfs, replace_pages, split_pdf
+
+
+def make_pdf(path, num_pages):
+    with fitz.open() as pdf:
+        for number in range(num_pages):
+            page = pdf.new_page()
+            page.insert_text((72, 72), f"pagina {number}")
+        pdf.save(path)
+
+
+def test_split_and_merge_keep_page_order(tmp_path):
+    in_file = str(tmp_path / "input.pdf")
+    make_pdf(in_file, 7)
+    shards = split_pdf(in_file, str(tmp_path), 3)
+    assert len(shards) == 3
+    with fitz.open(shards[-1]) as shard:
+        assert shard.page_count == 1
+    output = str(tmp_path / "merged.pdf")
+    assert merge_pdfs(shards, output) == 7
+    with fitz.open(output) as merged:
+        assert [page.get_text().strip() for page in merged] == [f"pagina {i}" for i in range(7)]
+
+
+def test_extract_and_replace_pages(tmp_path):
+    in_file = str(tmp_path / "input.pdf")
+    make_pdf(in_file, 5)
+    subset = str(tmp_path / "subset.pdf")
+    extract_pages(in_file, [3, 1], subset)
+    with fitz.open(subset) as pdf:
+        assert [page.get_text().strip() for page in pdf] == ["pagina 3", "pagina 1"]
+    replace_pages(in_file, subset, {0: 0, 4: 1})
+    with fitz.open(in_file) as pdf:
+        assert [page.get_text().strip() for page in pdf] == [
+            "pagina 3", "pagina 1", "pagina 2", "pagina 3", "pagina 1"
+        ]
+
+
+def test_replace_pages_into_another_file(tmp_path):
+    in_file = str(tmp_path / "input.pdf")
+    make_pdf(in_file, 3)
+    source = str(tmp_path / "source.pdf")
+    extract_pages(in_file, [2], source)
+    output = str(tmp_path / "output.pdf")
+    replace_pages(in_file, source, {0: 0}, output=output)
+    with fitz.open(in_file) as pdf:
+        assert [page.get_text().strip() for page in pdf] == ["pagina 0", "pagina 1", "pagina 2"]
+    with fitz.open(output) as pdf:
+        assert [page.get_text().strip() for page in pdf] == ["pagina 2", "pagina 1", "pagina 2"]
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from app.services.pipeline import Pipeline, Stage
+
+
+def test_stages_overlap():
+    running = set()
+    overlaps = []
+    lock = threading.Lock()
+
+    def work(name):
+        def func(item):
+            with lock:
+                running.add(name)
+                if len(running) > 1:
+                    overlaps.append(set(running))
+            time.sleep(0.1)
+            with lock:
+                running.discard(name)
+            return item + [name]
+        return func
+
+    results = []
+    stages = [Stage("ocr", work("ocr")),
+              Stage("highlight", work("highlight")),
+              Stage("report", results.append)]
+    pipeline = Pipeline(stages)
+    pipeline.start()
+    for i in range(4):
+        pipeline.submit([i])
+    pipeline.stop()
+    assert sorted(results) == [[i, "ocr", "highlight"] for i in range(4)]
+    assert overlaps
+    assert pipeline.stats()["ocr"]["processed"] == 4
+
+
+def test_failed_items_are_reported():
+    failed = []
+
+    def fail_odd(item):
+        if item % 2:
+            raise ValueError(item)
+        return item
+
+    results = []
+    pipeline = Pipeline([Stage("check", fail_odd, workers=2), Stage("sink", results.append)],
+                        on_error=lambda item, error: failed.append(item))
+    pipeline.start()
+    for i in range(6):
+        pipeline.submit(i)
+    pipeline.stop()
+    assert sorted(results) == [0, 2, 4]
+    assert sorted(failed) == [1, 3, 5]
+    assert pipeline.stats()["check"]["failed"] == 3
+
+
+def test_backpressure_is_accounted():
+    stages = [Stage("slow", lambda item: time.sleep(0.2), queue_size=1)]
+    pipeline = Pipeline(stages, blocked_log_interval=0.05)
+    pipeline.start()
+    for i in range(3):
+        pipeline.submit(i)
+    pipeline.stop()
+    assert pipeline.stats()["slow"]["blocked_time"] > 0
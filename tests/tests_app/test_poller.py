@@ -0,0 +1,29 @@
+from app.services.poller import Backoff, DocumentPoller
+
+
+def test_backoff_grows_and_resets():
+    backoff = Backoff(1, 8, jitter=0)
+    assert [backoff.next_delay() for _ in range(5)] == [1, 2, 4, 8, 8]
+    backoff.reset()
+    assert backoff.next_delay() == 1
+
+
+def test_backoff_jitter_is_bounded():
+    backoff = Backoff(10, 10, jitter=0.1)
+    delays = [backoff.next_delay() for _ in range(100)]
+    assert all(9 <= delay <= 11 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_poller_prefetches_batches():
+    calls = []
+
+    def fetch(count):
+        calls.append(count)
+        return [{"id": f"{len(calls)}-{i}", "status": "downloaded"} for i in range(count)]
+
+    poller = DocumentPoller(fetch, batch_size=3)
+    ids = [poller.next_document()["id"] for _ in range(4)]
+    assert ids == ["1-0", "1-1", "1-2", "2-0"]
+    assert calls == [3, 3]
+    assert poller.queue_depth() == 2
@@ -0,0 +1,58 @@
+import threading
+
+from app.services.resources import ResourceRegistry
+
+
+def test_resources_are_loaded_once_on_first_use():
+    registry = ResourceRegistry()
+    loads = []
+    registry.register("model", lambda: loads.append("model") or "loaded model")
+    assert not registry.is_loaded("model")
+    assert registry.report() == {}
+    assert registry.get("model") == "loaded model"
+    assert registry.get("model") == "loaded model"
+    assert loads == ["model"]
+    assert list(registry.report()) == ["model"]
+
+
+def test_warm_up_loads_dependencies_once():
+    registry = ResourceRegistry()
+    loads = []
+
+    def load(name, *dependencies):
+        def loader():
+            for dependency in dependencies:
+                registry.get(dependency)
+            loads.append(name)
+            return name
+        return loader
+
+    registry.register("vocabulary", load("vocabulary", "data"))
+    registry.register("data", load("data"))
+    registry.register("unused", load("unused"))
+    assert list(registry.warm_up(["vocabulary"])) == ["data", "vocabulary"]
+    assert loads == ["data", "vocabulary"]
+    registry.warm_up()
+    assert loads == ["data", "vocabulary", "unused"]
+
+
+def test_concurrent_first_use_loads_once():
+    registry = ResourceRegistry()
+    loads = []
+    started = threading.Event()
+
+    def slow_loader():
+        started.wait(1)
+        loads.append(1)
+        return object()
+
+    registry.register("model", slow_loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.get("model"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    started.set()
+    for thread in threads:
+        thread.join()
+    assert len(loads) == 1
+    assert len({id(result) for result in results}) == 1
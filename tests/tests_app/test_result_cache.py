@@ -0,0 +1,40 @@
+import filecmp
+import os
+import time
+
+from app.services.result_cache import ResultCache
+
+DOC = "nlp/documents/normal.pdf"
+
+
+def test_ocr_and_highlight_results_are_cached(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=10 * 1024**2)
+    key = cache.ocr_key(DOC, "--rotate-pages")
+    assert key != cache.ocr_key(DOC, "--rotate-pages --force")
+    output = str(tmp_path / "out.pdf")
+    assert cache.get_ocr(key, output) is None
+    cache.put_ocr(key, DOC, "some text", 95.5)
+    assert cache.get_ocr(key, output) == ("some text", 95.5)
+    assert filecmp.cmp(DOC, output, shallow=False)
+
+    assert cache.get_highlight(key, "1", output) is None
+    cache.put_highlight(key, "1", DOC, [{"keyword": "lege"}], {"num_pages": 3})
+    assert cache.get_highlight(key, "1", output) == ([{"keyword": "lege"}], {"num_pages": 3})
+    assert cache.get_highlight(key, "2", output) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    size = os.path.getsize(DOC)
+    cache = ResultCache(str(tmp_path / "cache"), max_bytes=int(2.5 * size))
+    output = str(tmp_path / "out.pdf")
+    keys = [cache.ocr_key(DOC, str(i)) for i in range(3)]
+    cache.put_ocr(keys[0], DOC, "0", 90)
+    time.sleep(0.01)
+    cache.put_ocr(keys[1], DOC, "1", 90)
+    time.sleep(0.01)
+    assert cache.get_ocr(keys[0], output) is not None
+    time.sleep(0.01)
+    cache.put_ocr(keys[2], DOC, "2", 90)
+    assert cache.get_ocr(keys[0], output) is not None
+    assert cache.get_ocr(keys[1], output) is None
+    assert cache.get_ocr(keys[2], output) is not None
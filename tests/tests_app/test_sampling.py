@@ -0,0 +1,60 @@
+import math
+import random
+
+from app.services.ocr_evaluation import estimate_pages_quality, sample_quality
+from app.services.sampling import Z_95, RatioEstimate
+
+
+def test_whole_population_is_exact():
+    estimate = RatioEstimate(3)
+    for y, x in [(9, 10), (4, 5), (0, 0)]:
+        estimate.add(y, x)
+    assert estimate.ratio == 13 / 15
+    assert estimate.variance == 0
+
+
+def test_unknown_variance():
+    estimate = RatioEstimate(10)
+    assert estimate.ratio is None
+    estimate.add(1, 2)
+    assert estimate.variance == math.inf
+
+
+def test_interval_coverage():
+    rng = random.Random(0)
+    xs = [rng.randint(50, 500) for _ in range(1000)]
+    ys = [x * rng.uniform(0.6, 1.0) for x in xs]
+    ratio = sum(ys) / sum(xs)
+    covered = 0
+    for _ in range(200):
+        estimate = RatioEstimate(len(xs))
+        for unit in rng.sample(range(len(xs)), 50):
+            estimate.add(ys[unit], xs[unit])
+        covered += abs(estimate.ratio - ratio) <= Z_95 * math.sqrt(estimate.variance)
+    assert covered >= 180
+
+
+def test_covariance_of_the_same_ratio_is_its_variance():
+    first, second = RatioEstimate(100), RatioEstimate(100)
+    for y, x in [(8, 10), (3, 5), (7, 9), (1, 4)]:
+        first.add(y, x)
+        second.add(y, x)
+    assert first.covariance(second) == first.variance > 0
+
+
+def test_sample_quality_of_ocred_pages_is_exact():
+    pages = [f"pagina {number} " * (number % 4) for number in range(120)]
+    confidences = [{"words": number % 4, "confidence": 50.0 + number % 40} for number in range(120)]
+    quality, page_qualities = estimate_pages_quality(pages, confidences)
+    sample = sample_quality(pages, confidences, sample_size=10)
+    # word confidences cost nothing, so no page is scored from its text
+    assert sample.scored_pages == 0
+    assert sample.low == sample.quality == sample.high == quality
+    assert sample.page_qualities == page_qualities
+
+
+def test_sample_quality_without_words():
+    pages = ["", "[OCR skipped on page(s) 2]"]
+    sample = sample_quality(pages, [{"words": 0, "confidence": 0.0}, None], sample_size=10)
+    assert sample.quality == sample.low == sample.high == 100
+    assert sample.page_qualities == [None, None]
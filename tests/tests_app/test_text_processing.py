@@ -0,0 +1,23 @@
+from app.services.text_processing import Cleaner, remove_diacritics
+
+PAGES = [
+    "Tribunalul Bucureşti a pronunţat hotărârea\nscurt\n1234567890 12345\n",
+    "",
+    "Domnul Ştefan a depus cererea la data de 1, 5 martie\nwww.just.ro pentru detalii suplimentare\n",
+]
+
+
+def test_clean_pages_is_clean_of_joined_pages():
+    cleaner = Cleaner()
+    pages = list(cleaner.clean_pages(iter(PAGES)))
+    assert len(pages) == len(PAGES)
+    assert pages[1] == ""
+    assert "".join(pages) == cleaner.clean("".join(PAGES))
+    assert pages[0] == "Tribunalul București a pronunțat hotărârea\n"
+
+
+def test_remove_diacritics_is_memoized():
+    assert remove_diacritics("hotărâre") == "hotarare"
+    hits = remove_diacritics.cache_info().hits
+    assert remove_diacritics("hotărâre") == "hotarare"
+    assert remove_diacritics.cache_info().hits == hits + 1
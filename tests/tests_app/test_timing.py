@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+from app.utils.timing import Timings, measure, timed
+
+
+def test_timings_accumulate():
+    timings = Timings()
+    for _ in range(2):
+        with timings.measure("ocr"):
+            time.sleep(0.01)
+    timings.add("matching", 0.5)
+    durations = timings.as_dict()
+    assert list(durations) == ["ocr", "matching"]
+    assert durations["ocr"] >= 0.02
+    assert durations["matching"] == 0.5
+
+
+def test_timings_measure_failed_steps():
+    timings = Timings()
+    with pytest.raises(ValueError):
+        with measure(timings, "validation"):
+            raise ValueError("invalid")
+    assert "validation" in timings.as_dict()
+    with measure(None, "validation"):
+        pass
+
+
+def test_timed_excludes_nested_steps():
+    timings = Timings()
+
+    def produce():
+        for item in range(3):
+            with timings.measure("text_extraction"):
+                time.sleep(0.01)
+            yield item
+
+    def transform(items):
+        for item in items:
+            time.sleep(0.01)
+            yield item * 2
+
+    consumed = []
+    for item in timed(transform(produce()), timings, "cleaning", exclude="text_extraction"):
+        time.sleep(0.02)
+        consumed.append(item)
+    assert consumed == [0, 2, 4]
+    durations = timings.as_dict()
+    assert durations["text_extraction"] >= 0.03
+    assert 0.03 <= durations["cleaning"] < 0.06
+    assert list(timed([1, 2], None, "cleaning")) == [1, 2]
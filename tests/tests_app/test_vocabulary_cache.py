@@ -0,0 +1,38 @@
+import random
+import string
+
+from app.services.vocabulary_cache import (MappedVocabulary, build_vocabulary,
+                                           load_vocabulary)
+
+
+def test_mapped_vocabulary_matches_set(tmp_path):
+    rng = random.Random(0)
+    letters = string.ascii_lowercase + "ăâîșțşţ"
+    words = {"".join(rng.choices(letters, k=rng.randint(1, 12))) for _ in range(5000)}
+    path = str(tmp_path / "vocabulary.bin")
+    build_vocabulary(words | {""}, path)
+    vocabulary = MappedVocabulary(path)
+    assert len(vocabulary) == len(words)
+    assert all(word in vocabulary for word in words)
+    others = {"".join(rng.choices(letters, k=rng.randint(1, 12))) for _ in range(5000)} - words
+    assert not any(word in vocabulary for word in others)
+    assert "" not in vocabulary
+    assert 1 not in vocabulary
+
+
+def test_empty_vocabulary(tmp_path):
+    path = str(tmp_path / "vocabulary.bin")
+    build_vocabulary([], path)
+    vocabulary = MappedVocabulary(path)
+    assert len(vocabulary) == 0
+    assert "cuvânt" not in vocabulary
+
+
+def test_load_vocabulary_missing_or_invalid(tmp_path):
+    assert load_vocabulary(str(tmp_path / "missing.bin")) is None
+    invalid = tmp_path / "invalid.bin"
+    invalid.write_bytes(b"not a vocabulary")
+    assert load_vocabulary(str(invalid)) is None
+    build_vocabulary(["lege"], str(invalid))
+    invalid.write_bytes(invalid.read_bytes()[:-1])
+    assert load_vocabulary(str(invalid)) is None
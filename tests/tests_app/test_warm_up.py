@@ -0,0 +1,38 @@
+import subprocess
+import sys
+
+import ocr_worker
+from app.services import resources
+from app.services.resources import ResourceRegistry
+
+
+def test_importing_the_worker_loads_nothing():
+    # in a new process, since the other tests may load resources
+    check = (
+        "import ocr_worker\n"
+        "from app.services.resources import RESOURCES\n"
+        "assert {'spacy_model', 'vocabulary', 'ocr_language', 'summarization_pipeline', 'wordnet'}"
+        " <= set(RESOURCES.loaders)\n"
+        "assert not any(RESOURCES.is_loaded(name) for name in RESOURCES.loaders)\n"
+    )
+    subprocess.run([sys.executable, "-c", check], check=True)
+
+
+def test_warm_up_reports_the_startup(monkeypatch):
+    registry = ResourceRegistry()
+    registry.register("model", lambda: "model")
+    monkeypatch.setattr(resources, "RESOURCES", registry)
+    monkeypatch.setattr(ocr_worker, "WARM_UP", True)
+    startup = ocr_worker.warm_up()
+    assert set(startup) == {"imports", "model", "total"}
+    assert startup["imports"] <= startup["total"]
+    assert registry.is_loaded("model")
+
+
+def test_no_warm_up(monkeypatch):
+    registry = ResourceRegistry()
+    registry.register("model", lambda: "model")
+    monkeypatch.setattr(resources, "RESOURCES", registry)
+    monkeypatch.setattr(ocr_worker, "WARM_UP", False)
+    assert set(ocr_worker.warm_up()) == {"imports", "total"}
+    assert not registry.is_loaded("model")
@@ -0,0 +1,35 @@
+import os
+import time
+
+from app.services.worker_pool import WorkerPool, current_slot
+
+
+def slot_handler(document):
+    time.sleep(0.2)
+    return document["id"], current_slot()
+
+
+def crashing_handler(document):
+    if document["id"] == "crash":
+        os._exit(1)
+    return document["id"], current_slot()
+
+
+def test_documents_are_spread_over_slots():
+    pool = WorkerPool(2)
+    futures = [pool.submit(slot_handler, {"id": str(i)}) for i in range(4)]
+    pool.shutdown()
+    results = [future.result() for future in futures]
+    assert [doc_id for doc_id, _ in results] == ["0", "1", "2", "3"]
+    assert {slot for _, slot in results} == {1, 2}
+    assert current_slot() == 0
+
+
+def test_crashed_slot_is_reported_and_pool_restarted():
+    crashed = []
+    pool = WorkerPool(1, on_crash=lambda document, error: crashed.append(document["id"]))
+    pool.submit(crashing_handler, {"id": "crash"})
+    future = pool.submit(crashing_handler, {"id": "after"})
+    pool.shutdown()
+    assert crashed == ["crash"]
+    assert future.result() == ("after", 1)